@@ -8,10 +8,11 @@ from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.runnables.base import Runnable
 from database_management import db_manager as db, template_processing as tp, string_helper as sh
 from database_management.db_manager import Metrics as M, PREV_OUTPUTS
-from RAG import RAG
 from evaluation_wrapper.evaluation_wrapper import EvalWrapper, GeneralEval
 from LLMs import LLM
 from typing import Optional, Dict
+import run_telemetry
+import time
 
 class Evaluator(Runnable):
     """Evaluator class for running and evaluating language model (LLM) chains.
@@ -28,6 +29,7 @@ class Evaluator(Runnable):
         useSystemMessage (bool): Flag to use system message in prompts.
         memory_size (int): Size of the memory for the LLM.
         structured_output (bool): Flag to determine if the output should be structured.
+        early_abort (bool): Flag to stream structured outputs and cancel them on the first format or requirement violation.
         llm_chain (RunnableSerializable): Chain of runnable components for the LLM.
 
     Key Methods
@@ -41,21 +43,25 @@ class Evaluator(Runnable):
             Resets the memory (history of last messages) of the LLM.
     """
     def __init__(
-        self, llm:LLM=LLM("llama-3.1-8b-instant"), evaluation_wrapper:EvalWrapper=GeneralEval(),
+        self, llm:Optional[LLM]=None, evaluation_wrapper:EvalWrapper=GeneralEval(),
         structured_output:bool=True, n_shots:int=1, useSystemMessage:bool=False, memory_size:int=0,
         metrics:M._list=M.all, set_chain_on_init:bool=True,
-        prompt_versions:db.PromptVersions=db.PromptVersions()
+        prompt_versions:db.PromptVersions=db.PromptVersions(), early_abort:bool=False
     ):
         self.session_count = 0
         self.evaluation_wrapper = evaluation_wrapper
-        self.llm = llm
+        # the default LLM is created on init, so importing this module does not initialize an API client
+        self.llm = llm or LLM("llama-3.1-8b-instant")
         self.metrics = metrics
         self.pv = prompt_versions
         self.n_shots = n_shots
         self.useSystemMessage = useSystemMessage
         self.memory_size = memory_size
         self.structured_output = structured_output
+        self.early_abort = early_abort
         self.llm_chain:RunnableSerializable = None
+        # name of the current chain link in the run telemetry
+        self.link_name:str = prompt_versions.template
         if set_chain_on_init:
             self.llm_chain = self._create_chain(prompt_versions.template, metrics)
 
@@ -108,10 +114,18 @@ class Evaluator(Runnable):
         return StrOutputParser().invoke(output)
     
     def invoke(self, input, config = None, **kwargs):
-        return self._parse_output(
-            self.llm_chain.invoke(input, config, **kwargs),
-            input
-        )
+        if self.early_abort and self.structured_output:
+            # the LLM validates its streamed output, see `LLM._stream`
+            config = dict(config or {})
+            config["configurable"] = {
+                **config.get("configurable", {}),
+                "stream_validator": self.evaluation_wrapper.stream_validator(input if isinstance(input, str) else None)
+            }
+        start = time.perf_counter()
+        output = self.llm_chain.invoke(input, config, **kwargs)
+        if telemetry := run_telemetry.current():
+            telemetry.record_link(self.link_name, time.perf_counter() - start)
+        return self._parse_output(output, input)
     
     def update(self, prompt_version:db.PROMPT_VERSION, eval_wrapper:EvalWrapper, metrics:M._list, step:Optional[int]=None, prev_outputs:PREV_OUTPUTS=[]):
         """
@@ -126,6 +140,7 @@ class Evaluator(Runnable):
         """
         self.llm_chain = self._create_chain(prompt_version, metrics, step, prev_outputs)
         self.evaluation_wrapper = eval_wrapper
+        self.link_name = prompt_version if step is None else f"{prompt_version} step {step}"
     
     def reset_memory(self):
         self.llm.reset_memory()
@@ -135,16 +150,19 @@ class ReqEvaluator(Evaluator):
         self, llm:LLM, evaluation_wrapper: EvalWrapper, structured_output:bool=True,
         use_RAG:bool=False, n_shots:int=1, RAG_kwargs:dict=None, useSystemMessage:bool=False, 
         memory_size:int=0, metrics:M._list=M.all, set_chain_on_init:bool=True,
-        prompt_versions:db.PromptVersions=db.PromptVersions()
+        prompt_versions:db.PromptVersions=db.PromptVersions(), early_abort:bool=False
     ):
         self.use_RAG = use_RAG
         if use_RAG:
-            self.RAG  = RAG(**RAG_kwargs)
+            # imported on demand, as the retriever backends depend on heavy libraries
+            from RAG import get_shared_RAG
+            # evaluators with the same RAG arguments share one index, e.g. the workers of a dataset run
+            self.RAG  = get_shared_RAG(**RAG_kwargs)
         self.RAG_kwargs = RAG_kwargs
         super().__init__(
             llm, evaluation_wrapper, 
             structured_output, n_shots, useSystemMessage, memory_size, 
-            metrics, set_chain_on_init, prompt_versions
+            metrics, set_chain_on_init, prompt_versions, early_abort
         )
 
     def _get_inputs(self, template, metrics):
@@ -164,14 +182,14 @@ class ReqEvaluator(Evaluator):
 class Judge(Evaluator):
     def __init__(
         self, llm: LLM, eval_wrapper:EvalWrapper, set_chain_on_init:bool=True,
-        prompt_versions:db.PromptVersions=db.PromptVersions()
+        prompt_versions:db.PromptVersions=db.PromptVersions(), early_abort:bool=False
     ):
         super().__init__(
             llm, eval_wrapper, set_chain_on_init=set_chain_on_init, prompt_versions=db.PromptVersions(
                 metric_definitions=prompt_versions.metric_definitions,
                 rating_definitions=prompt_versions.rating_definitions,
                 template="judge_general"
-            )
+            ), early_abort=early_abort
         )
 
     def _parse_output(self, output, _):
@@ -2,27 +2,79 @@
 # Copyright (c) 2025 Benedikt Horn, Sascha Tauchmann
 # See the LICENSE file for more details.
 
-from langchain_groq import ChatGroq
-from groq import BadRequestError
-from langchain_anthropic import ChatAnthropic
+# provider SDKs and langchain chains are imported when the respective wrapper is initialized to keep the startup fast
 from pydantic import BaseModel, ValidationError
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.messages import AIMessage, BaseMessage
 from langchain_core.prompt_values import PromptValue
 from langchain_core.outputs import ChatGeneration
-from langchain.memory import ConversationBufferWindowMemory
-from langchain.chains.conversation.base import ConversationChain
 from langchain_core.output_parsers import BaseLLMOutputParser
 from langchain_core.runnables.base import Runnable
-from typing import Literal, Union, get_args, List, Callable
+from langchain_core.rate_limiters import InMemoryRateLimiter
+from langchain_core.callbacks import BaseCallbackHandler, BaseCallbackManager
+from langchain_core.outputs import LLMResult
+from typing import Literal, Union, get_args, List, Callable, Dict, Optional, Iterator
+from threading import Lock
 import json
 from database_management import db_manager as db, string_helper as sh
+import run_telemetry
+from evaluation_wrapper.evaluation import STREAM_ABORT_KEY
 
 LLM_INPUT = Union[str, BaseMessage, List[BaseMessage], PromptValue]
 LLM_OUTPUT = Union[BaseMessage, dict]
 
 LLM_TYPE = Runnable[LLM_INPUT, LLM_OUTPUT]
 
+_rate_limiters:Dict[db.LLM_PROVIDER, InMemoryRateLimiter] = {}
+_rate_limiter_lock = Lock()
+
+def get_rate_limiter(provider:db.LLM_PROVIDER) -> Optional[InMemoryRateLimiter]:
+    """
+    Returns the rate limiter of a provider, which is shared by all of its chat models in this process, 
+    so that concurrent workers stay within `db.REQUESTS_PER_SECOND` together.
+    """
+    if (requests_per_second := db.REQUESTS_PER_SECOND.get(provider)) is None:
+        return None
+    with _rate_limiter_lock:
+        if provider not in _rate_limiters:
+            _rate_limiters[provider] = InMemoryRateLimiter(
+                requests_per_second=requests_per_second, 
+                check_every_n_seconds=min(0.1, 1 / requests_per_second), 
+                max_bucket_size=1
+            )
+        return _rate_limiters[provider]
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Reports the token usage of each chat model response to the telemetry of the running dataset evaluation."""
+    def __init__(self, telemetry:run_telemetry.RunTelemetry, model:db.MODEL):
+        self.telemetry = telemetry
+        self.model = model
+
+    def on_llm_end(self, response:LLMResult, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                if usage := getattr(getattr(generation, "message", None), "usage_metadata", None):
+                    self.telemetry.record_tokens(self.model, usage.get("input_tokens", 0), usage.get("output_tokens", 0))
+
+def with_token_usage_callback(config, model:db.MODEL):
+    """Adds a `TokenUsageCallback` to the config, if a telemetry is activated."""
+    if (telemetry := run_telemetry.current()) is None:
+        return config
+    callback = TokenUsageCallback(telemetry, model)
+    config = dict(config or {})
+    callbacks = config.get("callbacks")
+    if isinstance(callbacks, BaseCallbackManager):
+        callbacks = callbacks.copy()
+        callbacks.add_handler(callback)
+    else:
+        callbacks = list(callbacks or []) + [callback]
+    config["callbacks"] = callbacks
+    return config
+
+def get_stream_validator(config) -> Optional[Callable[[str], Optional[dict]]]:
+    """The `StreamValidator` passed to a chain by `config["configurable"]["stream_validator"]`, see `Evaluator.invoke`."""
+    return ((config or {}).get("configurable") or {}).get("stream_validator")
+
 class ConversationOutputParser(BaseLLMOutputParser):
     def parse_result(self, result, *, partial = False):
         if type(output:=result[-1]) == ChatGeneration:
@@ -43,6 +95,8 @@ class LLMwithJsonStrOutput(Runnable):
     
 class LLMwithMemory(Runnable):
     def __init__(self, llm:BaseChatModel, memory_size:int=0, structured_output:bool=False):
+        from langchain.memory import ConversationBufferWindowMemory
+        from langchain.chains.conversation.base import ConversationChain
         self.structured_output = structured_output
         self.conversation = ConversationChain(
             llm=LLMwithJsonStrOutput(llm) if structured_output else llm,
@@ -62,30 +116,56 @@ class LLMwithMemory(Runnable):
 class LLMGroq(Runnable):
     """Wrapper for Groq Language Models"""
     def __init__(self, model:db.GROQ_MODEL, structured_output=False):
+        from langchain_groq import ChatGroq
         self.model = model
         self.structured_output = structured_output
         llm = ChatGroq(
             model=self.model,
             temperature=0.0,
-            api_key=db.GROQ_API_KEY
+            api_key=db.get_api_key("groq"),
+            rate_limiter=get_rate_limiter("groq")
         )
+        # the plain chat model streams the JSON text, see `stream_text`
+        self.chat = llm
         if structured_output:
             llm = llm.with_structured_output(None, method="json_mode")
         self.llm = llm
     
     def invoke(self, input:str, config=None, **kwargs):
+        from groq import BadRequestError
         try:
             return self.llm.invoke(input, config, **kwargs)
         except BadRequestError as e:
             return e.message
 
+    def stream_text(self, input:str, config=None, **kwargs) -> Iterator[str]:
+        """Streams the JSON text of a structured output in json mode."""
+        from groq import BadRequestError
+        try:
+            for chunk in self.chat.bind(response_format={"type": "json_object"}).stream(input, config, **kwargs):
+                if isinstance(chunk.content, str):
+                    yield chunk.content
+        except BadRequestError as e:
+            yield e.message
+
+    def parse_streamed_output(self, text:str):
+        """Parses the streamed text like the structured output of `invoke`."""
+        from langchain_core.utils.json import parse_json_markdown
+        try:
+            return parse_json_markdown(text)
+        except json.JSONDecodeError:
+            return text
+
 class LLMAnthropic(Runnable):
     """Wrapper for Anthropic Language Models, that supports schema based structured output"""
     def __init__(self, model:db.ANTHROPIC_MODEL, structured_output:bool=True, schema:BaseModel=None):
-        self.llm = ChatAnthropic(
+        from langchain_anthropic import ChatAnthropic
+        self.schema = schema
+        self.chat = self.llm = ChatAnthropic(
             model=model,
             temperature=0.0,
-            api_key=db.ANTHROPIC_API_KEY,
+            api_key=db.get_api_key("anthropic"),
+            rate_limiter=get_rate_limiter("anthropic"),
             #max_tokens=1024 #might make sense to enable this for testing purposes
         )
         if structured_output:
@@ -102,6 +182,22 @@ class LLMAnthropic(Runnable):
         except ValidationError as e:
             return json.loads(e.json())
 
+    def stream_text(self, input:str, config=None, **kwargs) -> Iterator[str]:
+        """Streams the JSON arguments of the forced tool call of a structured output."""
+        from langchain_anthropic.chat_models import convert_to_anthropic_tool
+        tool_name = convert_to_anthropic_tool(self.schema)["name"]
+        for chunk in self.chat.bind_tools([self.schema], tool_choice=tool_name).stream(input, config, **kwargs):
+            for tool_call_chunk in chunk.tool_call_chunks:
+                if tool_call_chunk.get("args"):
+                    yield tool_call_chunk["args"]
+
+    def parse_streamed_output(self, text:str):
+        """Parses the streamed text like the structured output of `invoke`."""
+        try:
+            return self.output_parser(self.schema.model_validate_json(text))
+        except ValidationError as e:
+            return json.loads(e.json())
+
 class LLM(Runnable):
     """General Wrapper for Language Models, that supports both Anthropic and Groq models, structured output and a variable memory size"""
     def __init__(self, model:db.MODEL, structured_output=True, schema:BaseModel=None, memory_size:int=0):
@@ -111,6 +207,8 @@ class LLM(Runnable):
         self.memory_size = memory_size
         self.schema = schema
         self.llm = self._init_llm()
+        # models per output schema, see `update_schema`
+        self._llms:Dict[Optional[type], LLM_TYPE] = {schema: self.llm}
 
     def _init_llm(self) -> LLM_TYPE:
         if self.model in get_args(db.ANTHROPIC_MODEL):
@@ -138,20 +236,61 @@ class LLM(Runnable):
         return message
     
     def invoke(self, input:LLM_INPUT, config = None, **kwargs) -> LLM_OUTPUT:
-        """Invoke the Language Model and save the last 20 prompts and responses to `database/last_message`"""
+        """
+        Invoke the Language Model and save the last 20 prompts and responses to `database/last_message`.
+        The token usage is reported to the telemetry of a running dataset evaluation, see `run_telemetry`.
+        If the config holds a stream validator, a structured output is streamed and validated while it is generated, see `_stream`.
+        """
         if self.invoke_count > 20:
             self.invoke_count = 0
         self.invoke_count += 1
-        return self._save_message(self.llm.invoke(
-            self._save_message(input, "prompt"), 
-            config, **kwargs
-        ), "response")
+        input = self._save_message(input, "prompt")
+        config = with_token_usage_callback(config, self.model)
+        if (validator := get_stream_validator(config)) and self.structured_output and isinstance(self.llm, (LLMGroq, LLMAnthropic)):
+            output = self._stream(input, validator, config, **kwargs)
+        else:
+            output = self.llm.invoke(input, config, **kwargs)
+        return self._save_message(output, "response")
+
+    def _stream(self, input:LLM_INPUT, validator:Callable[[str], Optional[dict]], config=None, **kwargs) -> LLM_OUTPUT:
+        """
+        Streams the structured output and cancels the generation on the first violation found by the validator,
+        so no further output tokens are generated for a response, that is retried anyway.
+
+        Returns:
+            LLM_OUTPUT: The parsed output like `invoke`, 
+                or `{STREAM_ABORT_KEY: error, "partial_output": text}` if the generation was cancelled.
+        """
+        text = ""
+        stream = self.llm.stream_text(input, config, **kwargs)
+        try:
+            for delta in stream:
+                text += delta
+                if abort := validator(text):
+                    return {STREAM_ABORT_KEY: abort, "partial_output": text}
+        finally:
+            # closes the connection of a cancelled generation
+            stream.close()
+        return self.llm.parse_streamed_output(text)
     
     def reset_memory(self):
         if isinstance(self.llm, LLMwithMemory):
             self.llm.reset_memory()
 
     def update_schema(self, schema:BaseModel):
-        """Interface to the `EvaluationChain` Module to adapt the output schema for different prompt steps"""
+        """
+        Interface to the `EvaluationChain` Module to adapt the output schema for different prompt steps.
+        Without memory, the model of each schema is created once and reused, as the schemas are shared per wrapper configuration.
+        With memory, the model is recreated, which resets the memory as before.
+        """
+        if self.memory_size > 0:
+            self.schema = schema
+            self.llm = self._init_llm()
+            return
+        if schema is self.schema:
+            return
+        self._llms.setdefault(self.schema, self.llm)
         self.schema = schema
-        self.llm = self._init_llm()
+        if (llm := self._llms.get(schema)) is None:
+            llm = self._llms[schema] = self._init_llm()
+        self.llm = llm
@@ -4,75 +4,369 @@
 
 from langchain_core.retrievers import BaseRetriever
 from langchain_core.runnables import RunnablePassthrough, Runnable, RunnableLambda
-from langchain.schema import Document
-from streamlit.runtime.scriptrunner import get_script_run_ctx
+from langchain_core.documents import Document
 from sys import platform
-if platform == "linux":
-    from ragatouille import RAGPretrainedModel
-else:
-    from langchain_huggingface import HuggingFaceEmbeddings
-    from langchain_chroma import Chroma
-import random
 import shutil
 import json
-from typing import List, Callable, Dict
+import hashlib
+from pathlib import Path
+from collections import OrderedDict
+from threading import Lock
+from typing import List, Callable, Dict, Any, Hashable, Tuple, Type, Optional, Union
 from abc import abstractmethod, ABC
-from database_management import db_manager as db, template_processing as tp
+from database_management import db_manager as db, template_processing as tp, string_helper as sh
 from database_management.db_manager import Metrics as M
+from chatbot import run_by_streamlit
+
+class LRUCache:
+    """
+    Thread-safe mapping with a bounded number of entries, that evicts the least recently used entry first.
+    Hits and misses are counted to monitor the cache efficiency.
+    """
+    _missing = object()
+
+    def __init__(self, max_size:int=256):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries:OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key:Hashable, default:Any=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key:Hashable, value:Any):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_or_create(self, key:Hashable, create:Callable[[], Any]):
+        """Returns the cached value of `key` or caches and returns the result of `create()`, which is called outside the lock."""
+        if (value := self.get(key, self._missing)) is self._missing:
+            value = create()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
 
 class GetCustomRetriever(ABC):
+    """
+    Interface for building or loading a retriever index over a list of texts.
+
+    The retrieved documents must provide the position of their text in `texts` as `ID` in their metadata.
+    `settings` holds every option that influences the content of the index. 
+    Together with the indexed texts, it forms the fingerprint stored next to the index,
+    which allows an existing index to be reused as long as neither the data nor the settings changed.
+    """
+    settings:Dict[str, Any] = {}
+
     @abstractmethod
     def __call__(self, 
         texts:List[str], n_retrieved_docs:int, index_name:str, load_from_index:bool
     ) -> BaseRetriever:
         ...
         # define retriever here
+
+    @abstractmethod
+    def index_path(self, index_name:str) -> Path:
+        ...
+
+    def batch_search(self, queries:List[str], n_retrieved_docs:int) -> List[List[Document]]:
+        """
+        Retrieves the documents for several queries at once. 
+        Backends without a native batched search fall back to the `batch` method of the last created retriever.
+        """
+        return self.retriever.batch(queries)
+
+    def add_texts(self, texts:List[str], index_name:str, first_id:int):
+        """Appends texts, with IDs starting at `first_id`, to the index of the last created retriever and persists the updated index."""
+        raise NotImplementedError(f"{type(self).__name__} does not support incremental index updates")
+
+    def fingerprint(self, texts:List[str]) -> str:
+        content = json.dumps({"settings": self.settings, "texts": texts}, sort_keys=True)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def index_is_current(self, texts:List[str], index_name:str) -> bool:
+        """Checks if a stored index exists, that was built from the same texts and settings."""
+        fingerprint_file = db.index_fingerprint_file(self.index_path(index_name))
+        if not (self.index_path(index_name).exists() and fingerprint_file.exists()):
+            return False
+        return fingerprint_file.read_text(encoding="utf-8") == self.fingerprint(texts)
+
+    def save_fingerprint(self, texts:List[str], index_name:str):
+        fingerprint_file = db.index_fingerprint_file(self.index_path(index_name))
+        fingerprint_file.parent.mkdir(parents=True, exist_ok=True)
+        fingerprint_file.write_text(self.fingerprint(texts), encoding="utf-8")
+
+    def remove_index(self, index_name:str):
+        index_path = self.index_path(index_name)
+        if index_path.exists() and index_path.is_dir():
+            shutil.rmtree(index_path)
+        db.index_fingerprint_file(index_path).unlink(missing_ok=True)
     
 class GetRagaTouilleRetriever(GetCustomRetriever):
     """Used when running on a linux system"""
+    settings = {
+        "backend": "ragatouille",
+        "model": "colbert-ir/colbertv2.0",
+        "max_document_length": 1,
+        "split_documents": False
+    }
+
+    def index_path(self, index_name:str):
+        return db.ragatouille_index_path(index_name)
+
     def __call__(self, texts:List[str], n_retrieved_docs:int, index_name:str, load_from_index:bool):
-        self.index_path = db.ragatouille_index_path(index_name)
+        from ragatouille import RAGPretrainedModel
         if load_from_index:
-            RAG = RAGPretrainedModel.from_index(self.index_path)
+            RAG = RAGPretrainedModel.from_index(self.index_path(index_name))
         else:
-            if self.index_path.exists() and self.index_path.is_dir():
-                shutil.rmtree(self.index_path)
-            RAG = RAGPretrainedModel.from_pretrained("colbert-ir/colbertv2.0")
+            self.remove_index(index_name)
+            RAG = RAGPretrainedModel.from_pretrained(self.settings["model"])
             RAG.index(
                 collection=texts,
+                document_ids=[str(id) for id in range(len(texts))],
+                document_metadatas=[{"ID": id} for id in range(len(texts))],
                 index_name=index_name,
-                max_document_length=1,
-                split_documents=False,
+                max_document_length=self.settings["max_document_length"],
+                split_documents=self.settings["split_documents"],
             )
-        return RAG.as_langchain_retriever(k=n_retrieved_docs)
+        self.model = RAG
+        self.retriever = RAG.as_langchain_retriever(k=n_retrieved_docs)
+        return self.retriever
+
+    def add_texts(self, texts:List[str], index_name:str, first_id:int):
+        ids = range(first_id, first_id + len(texts))
+        self.model.add_to_index(
+            new_collection=texts, 
+            new_document_ids=[str(id) for id in ids],
+            new_document_metadatas=[{"ID": id} for id in ids],
+            index_name=index_name, 
+            split_documents=self.settings["split_documents"]
+        )
+
+    def batch_search(self, queries:List[str], n_retrieved_docs:int):
+        # all queries are encoded in one pass, ragatouille returns a flat list for a single query
+        results = self.model.search(query=queries, k=n_retrieved_docs)
+        if len(queries) == 1:
+            results = [results]
+        return [
+            [Document(page_content=r["content"], metadata=r.get("document_metadata", {})) for r in query_results]
+            for query_results in results
+        ]
     
 class GetChromaRetriever(GetCustomRetriever):
-    """Used when running on a non-linux system for the lack of support for RAGaTouille"""
+    """
+    Used when running on a non-linux system for the lack of support for RAGaTouille.
+
+    The texts are embedded and inserted in chunks of `chunk_size` in their original order, with their position as ID.
+    Every chunk is persisted right away, so an interrupted build resumes with the first missing chunk,
+    as long as it is continued with the same texts and settings.
+    """
+    settings = {
+        "backend": "chroma",
+        "model": "sentence-transformers/all-mpnet-base-v2",
+        "chunk_size": 256
+    }
+
+    def index_path(self, index_name:str):
+        return db.chroma_index_path(index_name)
+
+    def build_fingerprint_file(self, index_name:str):
+        """Fingerprint of the texts and settings of a build in progress, stored inside the index directory."""
+        return self.index_path(index_name) / "build.fingerprint"
+
     def __call__(self, texts:List[str], n_retrieved_docs:int, index_name:str, load_from_index:bool):
-        embedding=HuggingFaceEmbeddings(
-                model_name="sentence-transformers/all-mpnet-base-v2"
+        from langchain_huggingface import HuggingFaceEmbeddings
+        from langchain_chroma import Chroma
+        self.embedding = embedding = HuggingFaceEmbeddings(
+                model_name=self.settings["model"]
         )
-        index_path = str(db.chroma_index_path(index_name))
-        if load_from_index:
-            vectorstore = Chroma(
-                collection_name=index_name,
-                embedding_function=embedding,
-                persist_directory=index_path
-            )
-        else:
-            max_batch_size = 166
-            if len(texts) > max_batch_size:
-                texts = random.sample(texts, max_batch_size)
-            vectorstore = Chroma.from_texts(
-                collection_name=index_name,
-                texts=texts,
-                embedding=embedding,
-                persist_directory=index_path
-            )
-        return vectorstore.as_retriever(
+        build_fingerprint_file = self.build_fingerprint_file(index_name)
+        if not load_from_index:
+            fingerprint = self.fingerprint(texts)
+            resumes = build_fingerprint_file.exists() and build_fingerprint_file.read_text(encoding="utf-8") == fingerprint
+            if not resumes:
+                self.remove_index(index_name)
+                build_fingerprint_file.parent.mkdir(parents=True, exist_ok=True)
+                build_fingerprint_file.write_text(fingerprint, encoding="utf-8")
+        self.vectorstore = vectorstore = Chroma(
+            collection_name=index_name,
+            embedding_function=embedding,
+            persist_directory=str(self.index_path(index_name))
+        )
+        if not load_from_index:
+            indexed_ids = set(vectorstore.get(include=[])["ids"])
+            chunk_size = self.settings["chunk_size"]
+            for start in range(0, len(texts), chunk_size):
+                ids = [id for id in range(start, min(start + chunk_size, len(texts))) if str(id) not in indexed_ids]
+                if ids:
+                    self._insert([texts[id] for id in ids], ids)
+            build_fingerprint_file.unlink()
+        self.retriever = vectorstore.as_retriever(
             search_type="mmr", 
             search_kwargs={"k": n_retrieved_docs}
         )
+        return self.retriever
+
+    def _insert(self, texts:List[str], ids:List[int]):
+        self.vectorstore.add_texts(texts, metadatas=[{"ID": id} for id in ids], ids=[str(id) for id in ids])
+
+    def add_texts(self, texts:List[str], index_name:str, first_id:int):
+        chunk_size = self.settings["chunk_size"]
+        for start in range(0, len(texts), chunk_size):
+            chunk = texts[start:start + chunk_size]
+            self._insert(chunk, list(range(first_id + start, first_id + start + len(chunk))))
+
+    def batch_search(self, queries:List[str], n_retrieved_docs:int):
+        vectors = self.embedding.embed_documents(queries)
+        return [
+            self.vectorstore.max_marginal_relevance_search_by_vector(v, k=n_retrieved_docs)
+            for v in vectors
+        ]
+
+class GetBM25Retriever(GetCustomRetriever):
+    """Lexical BM25 retriever based on sparse NumPy/SciPy matrices, which requires neither torch nor a model download"""
+    settings = {
+        "backend": "bm25",
+        "k1": 1.5,
+        "b": 0.75
+    }
+
+    def index_path(self, index_name:str):
+        return db.bm25_index_path(index_name)
+
+    def __call__(self, texts:List[str], n_retrieved_docs:int, index_name:str, load_from_index:bool):
+        from search_index import BM25Index, IndexRetriever
+        if load_from_index:
+            index = BM25Index.load(self.index_path(index_name))
+        else:
+            self.remove_index(index_name)
+            index = BM25Index.build(texts, k1=self.settings["k1"], b=self.settings["b"])
+            index.save(self.index_path(index_name))
+        self.retriever = IndexRetriever(index=index, k=n_retrieved_docs)
+        return self.retriever
+
+    def add_texts(self, texts:List[str], index_name:str, first_id:int):
+        # the position in the index is the ID, so first_id always equals the current number of texts
+        self.retriever.index.add(texts)
+        self.retriever.index.save(self.index_path(index_name))
+
+    def batch_search(self, queries:List[str], n_retrieved_docs:int):
+        return self.retriever.search(queries, n_retrieved_docs)
+
+class GetDenseRetriever(GetCustomRetriever):
+    """
+    Dense retriever over a memory-mapped `.npy` matrix of sentence-transformers embeddings with exact top k cosine search in NumPy.
+    The embedding model is only loaded once texts or queries need to be embedded, so loading an existing index is almost instant.
+    """
+    settings = {
+        "backend": "dense",
+        "model": "sentence-transformers/all-mpnet-base-v2",
+        "dtype": "float16"
+    }
+    # search options, which do not affect the stored index
+    mmr = False
+    fetch_k = 20
+    lambda_mult = 0.5
+
+    def __init__(self):
+        self._embedding = None
+
+    def index_path(self, index_name:str):
+        return db.dense_index_path(index_name)
+
+    def embed(self, texts:List[str]):
+        import numpy as np
+        if self._embedding is None:
+            from langchain_huggingface import HuggingFaceEmbeddings
+            self._embedding = HuggingFaceEmbeddings(model_name=self.settings["model"])
+        return np.asarray(self._embedding.embed_documents(texts), dtype=np.float32)
+
+    def _index_type(self):
+        from search_index import DenseIndex
+        return DenseIndex
+
+    def _search_kwargs(self) -> Dict[str, Any]:
+        return dict(mmr=self.mmr, fetch_k=self.fetch_k, lambda_mult=self.lambda_mult)
+
+    def _build_kwargs(self) -> Dict[str, Any]:
+        return dict(dtype=self.settings["dtype"])
+
+    def __call__(self, texts:List[str], n_retrieved_docs:int, index_name:str, load_from_index:bool):
+        from search_index import IndexRetriever
+        index_type = self._index_type()
+        if load_from_index:
+            index = index_type.load(self.index_path(index_name), self.embed, **self._search_kwargs())
+        else:
+            self.remove_index(index_name)
+            index = index_type.build(texts, self.embed, **self._build_kwargs(), **self._search_kwargs())
+            index.save(self.index_path(index_name))
+        self.retriever = IndexRetriever(index=index, k=n_retrieved_docs)
+        return self.retriever
+
+    def add_texts(self, texts:List[str], index_name:str, first_id:int):
+        # the position in the index is the ID, so first_id always equals the current number of texts
+        self.retriever.index.add(texts)
+        self.retriever.index.save(self.index_path(index_name))
+
+    def batch_search(self, queries:List[str], n_retrieved_docs:int):
+        return self.retriever.search(queries, n_retrieved_docs)
+
+class GetIVFRetriever(GetDenseRetriever):
+    """
+    Approximate variant of the dense retriever for large evaluation corpora.
+    The embeddings are partitioned into `n_lists` inverted lists by k-means (`None` chooses 4·sqrt(n_documents)),
+    and a query only searches the `n_probe` lists with the most similar centroids. 
+    Raising `n_probe` increases recall at the cost of latency, see `retrieval_benchmark.compare_ann`.
+    """
+    settings = {
+        "backend": "dense_ivf",
+        "model": "sentence-transformers/all-mpnet-base-v2",
+        "dtype": "float16",
+        "n_lists": None,
+        "n_iter": 10
+    }
+    # search option, which does not affect the stored index
+    n_probe = 8
+
+    def index_path(self, index_name:str):
+        return db.ivf_index_path(index_name)
+
+    def _index_type(self):
+        from search_index import IVFIndex
+        return IVFIndex
+
+    def _search_kwargs(self) -> Dict[str, Any]:
+        return dict(super()._search_kwargs(), n_probe=self.n_probe)
+
+    def _build_kwargs(self) -> Dict[str, Any]:
+        return dict(super()._build_kwargs(), n_lists=self.settings["n_lists"], n_iter=self.settings["n_iter"])
+
+retriever_backends:Dict[db.RETRIEVER_BACKEND, Type[GetCustomRetriever]] = {
+    "ragatouille": GetRagaTouilleRetriever,
+    "chroma": GetChromaRetriever,
+    "bm25": GetBM25Retriever,
+    "dense": GetDenseRetriever,
+    "dense_ivf": GetIVFRetriever
+}
+
+def default_retriever_backend() -> db.RETRIEVER_BACKEND:
+    # RAGaTouille is only supported on linux systems
+    return "ragatouille" if platform == "linux" else "chroma"
 
 class RAG:
     """
@@ -81,21 +375,34 @@ class RAG:
     Attributes
     ==========
 
+        dataset_name (str): The name of the RAG dataset in `data_base/RAG_data`.
         evaluations (list): List of evaluation dictionaries loaded from the dataset.
         rating_scale (int): the scale [1, rating_scale] used for requirement evaluation.
-        last_input (str): The last input requirement used to reduce computation in evaluation chains.
-        last_retrieved_docs (List[Document]): The set of retrieved documents from the last input requirement.
+        retrieval_cache (LRUCache): 
+            The retrieved documents of the recently used requirements, keyed by the normalized requirement and the number of documents.
+            Shared by all links of an evaluation chain to avoid repeated retrievals.
+        context_cache (LRUCache):
+            The rendered contexts of the recently retrieved document sets, keyed by the document IDs, metrics and context template.
         retriever (RunnableLambda[str, List[Document]]): A lambda function for retrieving documents based on input.
 
-    Key Method
-    ==========
+    Key Methods
+    ===========
 
+        **batch_retrieve**
+            retrieves the documents for a list of requirements in batches and caches them for the upcoming `retriever` calls.
+        **add_evaluations**
+            appends new evaluations to the dataset table and the retriever index without rebuilding it.
+        **cache_stats**
+            returns the hits and misses of the retrieval and context cache.
         **get_inputs**
             dynamically creates a dictionary to be integrated as input of a Runnable Sequence.
-            Based on the provided context template and metrics, 
-            the retrieved evaluations are formatted according to `tp.process_one_shot_section`.
+            Based on the provided context template and metrics, the one-shot fragments of all evaluations 
+            are rendered once (see `tp.render_one_shot_fragment`) and joined for the retrieved evaluations.
     """
-    def __init__(self, dataset_name:str, load_retriever:bool=False, n_retrieved_docs:int=2):
+    def __init__(
+        self, dataset_name:str, load_retriever:bool=False, n_retrieved_docs:int=2, cache_size:int=256,
+        retriever_backend:Optional[db.RETRIEVER_BACKEND]=None
+    ):
         """
         Initializes the RAG class with the specified dataset and retriever settings.
 
@@ -114,47 +421,171 @@ class RAG:
                 
                 See the `RAGEvaluation` class of the `evaluation_wrapper` module for the exact format.
                          
-            load_retriever (bool, optional): Flag to indicate whether to load an existing retriever. Defaults to False.
+            load_retriever (bool, optional): 
+                Flag to force loading an existing retriever. If False, an existing index is still loaded 
+                as long as its stored fingerprint matches the dataset and retriever settings, otherwise it is rebuilt. 
+                Defaults to False.
             n_retrieved_docs (int, optional): Number of documents to retrieve. Defaults to 2.
+            cache_size (int, optional): The maximum number of entries of the retrieval and context cache each. Defaults to 256.
+            retriever_backend (db.RETRIEVER_BACKEND, optional): 
+                The retriever implementation to be used, see `retriever_backends`. 
+                Defaults to RAGaTouille on linux systems and Chroma otherwise.
         
         """
         eval_dict = db.load_dict_from_json_file(dataset_name, db.RAG_data)
+        self.dataset_name = dataset_name
         self.evaluations, self.rating_scale = [eval_dict[key] for key in ["evaluations", "rating_scale"]]
-        reqs = [json.dumps({"req": eval["requirement"], "ID":id}) for id, eval in enumerate(self.evaluations)]
-        self.last_input:str = None
-        self.last_retrieved_docs:List[Document] = None
-        if platform == "linux":
-            get_retriever = GetRagaTouilleRetriever()
-        else:
-            get_retriever = GetChromaRetriever()
-            if get_script_run_ctx():
-                #prevent error from using ChromaDB and streamlit
-                import chromadb
-                chromadb.api.client.SharedSystemClient.clear_system_cache()
-        inner_retriever = get_retriever(reqs, n_retrieved_docs, f"{dataset_name[:60]}_index", load_retriever)
-        def retrieve_docs(input:str):
-            if not (input == self.last_input and self.last_retrieved_docs):
-                self.last_retrieved_docs = inner_retriever.invoke(input)
-            self.last_input = input
-            return self.last_retrieved_docs
+        self._texts = [eval["requirement"] for eval in self.evaluations]
+        self.n_retrieved_docs = n_retrieved_docs
+        self.retrieval_cache = LRUCache(cache_size)
+        self.context_cache = LRUCache(cache_size)
+        # the fragments of all evaluations per template and metrics, or the error of evaluations which cannot be rendered
+        self._fragment_tables:Dict[Tuple[str, Tuple[str, ...]], List[Union[str, ValueError]]] = {}
+        self._fragment_lock = Lock()
+        # texts and their IDs of indexes without ID metadata, see `_doc_id`
+        self._text_id_table:Optional[Tuple[int, Dict[str, int]]] = None
+        retriever_backend = retriever_backend or default_retriever_backend()
+        get_retriever = retriever_backends[retriever_backend]()
+        if retriever_backend == "chroma" and run_by_streamlit():
+            #prevent error from using ChromaDB and streamlit
+            import chromadb
+            chromadb.api.client.SharedSystemClient.clear_system_cache()
+        self._index_name = index_name = f"{dataset_name[:60]}_index"
+        load_retriever = load_retriever or get_retriever.index_is_current(self._texts, index_name)
+        inner_retriever = get_retriever(self._texts, n_retrieved_docs, index_name, load_retriever)
+        if not load_retriever:
+            get_retriever.save_fingerprint(self._texts, index_name)
+        self._get_retriever = get_retriever
+        # guards the index against searches during incremental updates
+        self._index_lock = Lock()
+        def search(input:str) -> List[Document]:
+            with self._index_lock:
+                return inner_retriever.invoke(input)
+        def retrieve_docs(input:str) -> List[Document]:
+            return self.retrieval_cache.get_or_create(self._retrieval_key(input), lambda: search(input))
         self.retriever = RunnableLambda(retrieve_docs)
+
+    def _retrieval_key(self, input:str) -> Tuple[str, int]:
+        return (sh.normalize_string(input), self.n_retrieved_docs)
+    
+    def batch_retrieve(self, queries:List[str], batch_size:int=32) -> List[List[Document]]:
+        """
+        Retrieves the documents for multiple requirements, encoding and searching `batch_size` queries at once.
+        The results are stored in the retrieval cache, which allows prefetching the contexts of upcoming requirements.
+
+        Args:
+            queries (List[str]): The requirements to retrieve similar evaluations for.
+            batch_size (int, optional): The number of queries processed in a single search. Defaults to 32.
+
+        Returns:
+            List[List[Document]]: The retrieved documents for each query.
+        """
+        retrieved_docs:List[List[Document]] = []
+        for i in range(0, len(queries), batch_size):
+            batch = queries[i:i+batch_size]
+            with self._index_lock:
+                batch_docs = self._get_retriever.batch_search(batch, self.n_retrieved_docs)
+            for query, docs in zip(batch, batch_docs):
+                self.retrieval_cache.put(self._retrieval_key(query), docs)
+            retrieved_docs.extend(batch_docs)
+        return retrieved_docs
     
-    def _get_evaluation_extractor(self, metrics:M._list): 
-        get_eval:Callable[[Document], dict] = lambda doc: self.evaluations[json.loads(doc.page_content)["ID"]]["evaluation"]
+    def add_evaluations(self, evaluations:List[dict]):
+        """
+        Appends new evaluations to the evaluation table and embeds them into the existing retriever index.
+        The fingerprint of the index is updated as well, so the index is reused once the evaluations are saved to the dataset.
+
+        Args:
+            evaluations (List[dict]): New evaluations in the format of the RAG dataset, see `RAGEvaluation`.
+        """
+        evaluations = [ev for ev in evaluations if "requirement" in ev and "evaluation" in ev]
+        if not evaluations:
+            return
+        with self._index_lock:
+            new_texts = [ev["requirement"] for ev in evaluations]
+            self._get_retriever.add_texts(new_texts, self._index_name, first_id=len(self.evaluations))
+            with self._fragment_lock:
+                first_id = len(self.evaluations)
+                self.evaluations.extend(evaluations)
+                for (context_template, metrics), fragments in self._fragment_tables.items():
+                    fragments.extend(self._render_fragments(first_id, evaluations, context_template, metrics))
+            self._texts.extend(new_texts)
+            self._get_retriever.save_fingerprint(self._texts, self._index_name)
+        # previously retrieved documents might no longer be the most similar ones
+        self.retrieval_cache.clear()
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """The hits and misses of the retrieval and context cache, e.g. for the run telemetry of a dataset evaluation."""
+        return {
+            name: {"hits": cache.hits, "misses": cache.misses}
+            for name, cache in [("retrieval", self.retrieval_cache), ("context", self.context_cache)]
+        }
+
+    def _doc_id(self, doc:Document) -> int:
+        if "ID" in doc.metadata:
+            return doc.metadata["ID"]
+        # indexes built before the IDs were stored as metadata hold them in a JSON content or only the plain text
+        try:
+            return json.loads(doc.page_content)["ID"]
+        except (ValueError, TypeError, KeyError):
+            return self._text_ids()[doc.page_content]
+
+    def _text_ids(self) -> Dict[str, int]:
+        """The ID of the first evaluation of each requirement text, which is rebuilt after `add_evaluations`."""
+        if self._text_id_table is None or self._text_id_table[0] != len(self._texts):
+            text_ids:Dict[str, int] = {}
+            for id, text in enumerate(self._texts):
+                text_ids.setdefault(text, id)
+            self._text_id_table = (len(self._texts), text_ids)
+        return self._text_id_table[1]
+
+    def _get_evaluation_extractor(self, metrics:M._list) -> Callable[[dict], dict]: 
+        get_eval:Callable[[dict], dict] = lambda eval: eval["evaluation"]
         if len(metrics) > 1:
             return get_eval
-        return lambda doc: get_eval(doc)[metrics[0]]
-    
-    def _create_context(self, context_template:str, metrics:M._list):
+        return lambda eval: get_eval(eval)[metrics[0]]
+
+    def _render_fragments(
+        self, first_id:int, evaluations:List[dict], context_template:str, metrics:M._list
+    ) -> List[Union[str, ValueError]]:
+        """
+        Renders the one-shot fragments of evaluations with consecutive IDs starting at first_id.
+        An evaluation which cannot be rendered, e.g. as it lacks a metric, gets a ValueError instead of its fragment,
+        which is raised once the evaluation is retrieved.
+        """
         get_evaluation = self._get_evaluation_extractor(metrics)
-        def save_docs(docs):
-            self.last_retrieved_docs = docs
-            return docs
-        return lambda docs: tp.process_one_shot_section(
-            tp.remove_comments(context_template), 
-            evaluations=[get_evaluation(doc) for doc in save_docs(docs)], 
-            rating_scale=self.rating_scale
-        )
+        section = tp.remove_comments(context_template)
+        fragments:List[Union[str, ValueError]] = []
+        for id, ev in enumerate(evaluations, first_id):
+            try:
+                fragments.append(tp.render_one_shot_fragment(section, get_evaluation(ev), self.rating_scale))
+            except (KeyError, TypeError, ValueError) as e:
+                fragments.append(ValueError(
+                    f"RAG evaluation {id} of {self.dataset_name} cannot be rendered as one-shot example: {e!r}"
+                ))
+        return fragments
+
+    def _get_fragment_table(self, context_template:str, metrics:M._list) -> List[Union[str, ValueError]]:
+        """Returns the one-shot fragments of all evaluations, indexed by document ID, which are rendered once per template and metrics."""
+        key = (context_template, tuple(metrics))
+        with self._fragment_lock:
+            if key not in self._fragment_tables:
+                self._fragment_tables[key] = self._render_fragments(0, self.evaluations, context_template, metrics)
+            return self._fragment_tables[key]
+
+    def _create_context(self, context_template:str, metrics:M._list):
+        fragments = self._get_fragment_table(context_template, metrics)
+        def join_fragments(ids:Tuple[int, ...]) -> str:
+            selected = [fragments[id] for id in ids]
+            for fragment in selected:
+                if isinstance(fragment, ValueError):
+                    # a new error per retrieval, as the stored one is shared by concurrent workers
+                    raise ValueError(*fragment.args)
+            return tp.join_one_shot_fragments(selected)
+        def create_context(docs:List[Document]) -> str:
+            ids = tuple(self._doc_id(doc) for doc in docs)
+            return self.context_cache.get_or_create((ids, tuple(metrics), context_template), lambda: join_fragments(ids))
+        return create_context
 
     def get_inputs(self, context_template:str, metrics:M._list=M.all) -> Dict[str, Runnable]:
         """
@@ -171,3 +602,17 @@ class RAG:
             "context": self.retriever | self._create_context(context_template, metrics),
             "query": RunnablePassthrough()
         }
+
+_shared_RAGs:Dict[Tuple[Tuple[str, Any], ...], RAG] = {}
+_shared_RAG_lock = Lock()
+
+def get_shared_RAG(**RAG_kwargs) -> RAG:
+    """
+    Returns the RAG instance of the given init arguments, which is created on the first call and shared afterwards,
+    e.g. by the evaluators of concurrent dataset workers. The retrieval and index updates of a RAG instance are thread safe.
+    """
+    key = tuple(sorted(RAG_kwargs.items()))
+    with _shared_RAG_lock:
+        if key not in _shared_RAGs:
+            _shared_RAGs[key] = RAG(**RAG_kwargs)
+        return _shared_RAGs[key]
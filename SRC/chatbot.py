@@ -3,12 +3,19 @@
 # See the LICENSE file for more details.
 
 from typing import Callable, Union
-import streamlit as ui
 from collections.abc import Mapping
 from collections import deque
 import json
+import sys
 from database_management.db_manager import StreamlitMessage as UIMessage, STREAMLIT_ROLE as ROLE
 
+def run_by_streamlit() -> bool:
+    """Checks if the script is executed by `streamlit run`, without importing streamlit otherwise."""
+    if "streamlit" not in sys.modules:
+        return False
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    return get_script_run_ctx() is not None
+
 # define function to display messages of variable types
 def display_single(message, role: ROLE, run_in_terminal=False, append_to_session=True):
     if not isinstance(message, UIMessage):
@@ -17,6 +24,7 @@ def display_single(message, role: ROLE, run_in_terminal=False, append_to_session
     if run_in_terminal:
         print(f"{message.role}: \n{content}")
         return
+    import streamlit as ui
     if isinstance(content, Mapping):
         if type(content) == dict:
             message_str = json.dumps(content, indent=4)
@@ -53,6 +61,7 @@ def chatbot(
             response = generate_response(prompt)
             display(response, "assistant", run_in_terminal)
     
+    import streamlit as ui
 
     #define the assistants opening message
     Opening_message = ui.chat_message("assistant")
@@ -0,0 +1,247 @@
+# MIT License
+# Copyright (c) 2025 Benedikt Horn, Sascha Tauchmann
+# See the LICENSE file for more details.
+
+from typing import List, Dict, Literal, Optional, Any, Iterator, Union, TypedDict, Tuple
+from pathlib import Path
+from threading import Lock
+import hashlib
+import json
+import os
+
+CHECKPOINT_STATUS = Literal["done", "failed"]
+
+class CheckpointRecord(TypedDict):
+    idx:int
+    hash:Optional[str]
+    status:CHECKPOINT_STATUS
+    output:Any
+
+def input_hash(input:Union[str, dict]) -> str:
+    """Content hash of a dataset input, which detects changed inputs at the same index on resume."""
+    content = input if isinstance(input, str) else json.dumps(input, sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+class CheckpointLog:
+    """
+    Append-only JSON Lines log of the results of a dataset run.
+    Every result or failure is written as one `CheckpointRecord` as soon as it is known,
+    so a crash only loses the items which were still in progress.
+
+    Attributes
+    ==========
+
+        path (Path): The `.jsonl` file of the log.
+        fsync_every (int): The number of records after which the log is synced to disk.
+            Every record is flushed to the operating system right away, the sync additionally protects against power loss.
+
+    Key Methods
+    ===========
+
+        **append**
+            Thread-safe appends a record.
+        **records**
+            Iterates over the stored records, ignoring an incomplete last line of a crashed run.
+        **records_with_offsets**
+            Iterates over the stored records and their file offsets, which allow to read a record back with `read_record`.
+        **latest**
+            Maps each input index to its last record, that still matches the hash of the input.
+        **compact**
+            Converts the latest records into the JSON format of the evaluation datasets.
+        **write_compacted**
+            Streams the latest records into the JSON format of the evaluation datasets.
+        **rewrite**
+            Atomically replaces the log with a set of records, e.g. the merged records of several shards.
+    """
+    def __init__(self, path:Path, fsync_every:int=16):
+        self.path = path
+        self.fsync_every = fsync_every
+        self._file = None
+        self._unsynced = 0
+        self._lock = Lock()
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def append(self, idx:int, input:Optional[Union[str, dict]], status:CHECKPOINT_STATUS, output:Any=None):
+        """
+        Appends the result of an input.
+
+        Args:
+            idx (int): The index of the input in the dataset.
+            input (Union[str, dict], optional): The input, whose hash is stored. None if the input is unknown.
+            status (CHECKPOINT_STATUS): "done" for a generated output, "failed" for a failed generation.
+            output (Any, optional): The generated output. Defaults to None.
+
+        Returns:
+            int: The file offset of the record, see `read_record`.
+        """
+        record:CheckpointRecord = {
+            "idx": idx,
+            "hash": input_hash(input) if input is not None else None,
+            "status": status,
+            "output": output
+        }
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                # binary mode, so the position of the file is the byte offset of the next record
+                self._file = open(self.path, "ab")
+                if self._ends_incomplete():
+                    # terminates the incomplete last line of a crashed run, so it does not corrupt the next record
+                    self._file.write(b"\n")
+            offset = self._file.tell()
+            self._file.write(line)
+            self._file.flush()
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every:
+                self._sync()
+        return offset
+
+    def _ends_incomplete(self) -> bool:
+        with open(self.path, "rb") as f:
+            if f.seek(0, os.SEEK_END) == 0:
+                return False
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b"\n"
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def records(self) -> Iterator[CheckpointRecord]:
+        return (record for _, record in self.records_with_offsets())
+
+    def records_with_offsets(self, inputs:Optional[List[Union[str, dict]]]=None) -> Iterator[Tuple[int, CheckpointRecord]]:
+        """
+        Iterates over the (file offset, record) pairs of the stored records.
+
+        Args:
+            inputs (List[Union[str, dict]], optional): The inputs of the dataset.
+                If given, records whose hash differs from the hash of the input at their index are skipped,
+                so changed inputs are evaluated again. Records without hash (migrated ones) always match. Defaults to None.
+        """
+        if not self.exists():
+            return
+        hashes:Dict[int, str] = {}
+        with open(self.path, "rb") as f:
+            while line := f.readline():
+                offset = f.tell() - len(line)
+                try:
+                    record:CheckpointRecord = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line of a crashed run may be incomplete
+                    continue
+                idx = record["idx"]
+                if inputs is not None and record["hash"] is not None:
+                    if idx >= len(inputs) or hashes.setdefault(idx, input_hash(inputs[idx])) != record["hash"]:
+                        continue
+                yield offset, record
+
+    def read_record(self, offset:int) -> CheckpointRecord:
+        """Reads the record at a file offset of `records_with_offsets` or `append`."""
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def latest(self, inputs:Optional[List[Union[str, dict]]]=None) -> Dict[int, CheckpointRecord]:
+        """
+        Maps each input index to its last record.
+
+        Args:
+            inputs (List[Union[str, dict]], optional): The inputs of the dataset, see `records_with_offsets`. Defaults to None.
+        """
+        return {record["idx"]: record for _, record in self.records_with_offsets(inputs)}
+
+    def status_index(self) -> Dict[int, Tuple[Optional[str], CHECKPOINT_STATUS]]:
+        """Maps each input index to the (hash, status) of its last record without keeping the outputs in memory."""
+        return {record["idx"]: (record["hash"], record["status"]) for record in self.records()}
+
+    def is_completed(
+        self, status_index:Dict[int, Tuple[Optional[str], CHECKPOINT_STATUS]], idx:int, input:Union[str, dict], retry_failed:bool=False
+    ) -> bool:
+        """
+        Whether the input at idx is logged with an unchanged hash, see `status_index`.
+        With `retry_failed`, failed inputs count as not completed, except for migrated failures, whose actual position is unknown.
+        """
+        if (entry := status_index.get(idx)) is None:
+            return False
+        hash, status = entry
+        if hash is None:
+            return True
+        return hash == input_hash(input) and not (retry_failed and status == "failed")
+
+    def migrate_legacy_outputs(self, outputs:List[Any], failed_generations:int):
+        """
+        Writes the outputs of a dataset file, that was created before the log, as records.
+        As these files only store the number of failed generations but not their position,
+        the outputs are assigned to the first indices, followed by the failures, which covers the same inputs as the old resume logic.
+        """
+        for idx, output in enumerate(outputs):
+            self.append(idx, None, "done", output)
+        for idx in range(len(outputs), len(outputs) + failed_generations):
+            self.append(idx, None, "failed")
+        self.close()
+
+    def compact(self, eval_type:str, rating_scale:int, inputs:Optional[List[Union[str, dict]]]=None) -> dict:
+        """Converts the latest records into the dataset format, see `compact_records`."""
+        return compact_records(self.latest(inputs), eval_type, rating_scale)
+
+    def write_compacted(self, path:Path, eval_type:str, rating_scale:int, inputs:Optional[List[Union[str, dict]]]=None):
+        """
+        Streams the latest records into a dataset file, which is identical to `json.dump(self.compact(...), f, indent=4)`,
+        while only the file offset and status of each record are held in memory.
+        """
+        latest:Dict[int, Tuple[int, CHECKPOINT_STATUS]] = {
+            record["idx"]: (offset, record["status"]) for offset, record in self.records_with_offsets(inputs)
+        }
+        self.path.touch()
+        with open(self.path, "rb") as f:
+            n_failed = sum(status == "failed" for _, status in latest.values())
+            output_offsets = [latest[idx][0] for idx in sorted(latest) if latest[idx][1] == "done"]
+            tmp_file = path.with_suffix(".tmp")
+            with open(tmp_file, "w", encoding="utf-8") as out:
+                out.write(f'{{\n    "failed_generations": {n_failed},\n    "rating_scale": {json.dumps(rating_scale)},\n    {json.dumps(eval_type)}: [')
+                for i, offset in enumerate(output_offsets):
+                    f.seek(offset)
+                    output = json.dumps(json.loads(f.readline())["output"], indent=4).replace("\n", "\n        ")
+                    out.write(("," if i else "") + "\n        " + output)
+                out.write("\n    ]\n}" if output_offsets else "]\n}")
+        tmp_file.replace(path)
+
+    def rewrite(self, records:Dict[int, CheckpointRecord]):
+        """Atomically replaces the log with the given records in index order."""
+        self.close()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.path.with_suffix(".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            for idx in sorted(records):
+                f.write(json.dumps(records[idx]) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        tmp_file.replace(self.path)
+
+def compact_records(records:Dict[int, CheckpointRecord], eval_type:str, rating_scale:int) -> dict:
+    """
+    Converts records into the dataset format
+    `{"failed_generations": int, "rating_scale": int, <eval_type>: [outputs in input order]}`.
+    """
+    return {
+        "failed_generations": sum(record["status"] == "failed" for record in records.values()),
+        "rating_scale": rating_scale,
+        eval_type: [records[idx]["output"] for idx in sorted(records) if records[idx]["status"] == "done"]
+    }
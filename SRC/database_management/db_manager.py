@@ -3,10 +3,11 @@
 # See the LICENSE file for more details.
 
 from evaluation_wrapper.evaluation import Evaluation
-from typing import Literal, List, Dict, get_args, Callable, Optional, Union, Mapping
+from typing import Literal, List, Dict, get_args, Callable, Optional, Union, Mapping, Iterator, Tuple, Any
 from pathlib import Path
+from threading import Lock
 import json
-import pandas as pd
+import os
 
 ANTHROPIC_MODEL = Literal[
     "claude-3-5-sonnet-latest", 
@@ -27,6 +28,19 @@ GROQ_API_KEY = "<insert your api key here>"
 
 ANTHROPIC_API_KEY = "<insert your api key here>"
 
+LLM_PROVIDER = Literal["groq", "anthropic"]
+
+def get_api_key(provider:LLM_PROVIDER) -> str:
+    """The API key of a provider. The environment variables `GROQ_API_KEY` and `ANTHROPIC_API_KEY` take precedence, e.g. to give each shard process its own key."""
+    default = {"groq": GROQ_API_KEY, "anthropic": ANTHROPIC_API_KEY}[provider]
+    return os.environ.get(f"{provider.upper()}_API_KEY", default)
+
+# maximum requests per second of each provider, shared by all LLM instances of a process (None disables the limit)
+REQUESTS_PER_SECOND:Dict[LLM_PROVIDER, Optional[float]] = {
+    "groq": None,
+    "anthropic": None
+}
+
 class Metrics:
     _single = Literal[
         "Correctness", 
@@ -84,6 +98,8 @@ prompt_templates = data_base_root / "prompt_templates"
 static_few_shots = data_base_root / "static_few_shots"
 last_messages = data_base_root / "last_messages"
 test_data = data_base_root / "test_data"
+evaluation_repository_file = data_base_root / "evaluations.sqlite"
+analytics_cache_file = data_base_root / "analytics_cache.pkl"
 
 TEST_DATA = Literal[
     "bad_requirements", 
@@ -92,6 +108,7 @@ TEST_DATA = Literal[
 EVAL_TYPE = Literal["evaluations", "judgements"]
 EVAL_APPROACH = Literal["successive", "iterative", "iterative_zero_shot"]
 LLM_ROLE = Literal["evaluator", "judge"]
+RETRIEVER_BACKEND = Literal["ragatouille", "chroma", "bm25", "dense", "dense_ivf"]
     
 PROMPT_VERSION = Literal[
     "template_demo", "only_query",
@@ -119,7 +136,7 @@ class PromptVersions:
         self.template = template
         self.evaluation_chain = evaluation_chain
 
-def data_base_file(name:str, ending:Literal["csv", "json", "md"], subdir:Path=data_base_root):
+def data_base_file(name:str, ending:Literal["csv", "json", "jsonl", "parquet", "md"], subdir:Path=data_base_root):
     return subdir / f"{name}.{ending}"
 
 def csv_file(name:str, subdir:Path=data_base_root):
@@ -131,18 +148,81 @@ def ragatouille_index_path(index_name:str):
 def chroma_index_path(index_name:str):
     return Path(".chroma", "indexes", index_name)
 
+def bm25_index_path(index_name:str):
+    return Path(".bm25", "indexes", index_name)
+
+def dense_index_path(index_name:str):
+    return Path(".dense", "indexes", index_name)
+
+def ivf_index_path(index_name:str):
+    return Path(".ivf", "indexes", index_name)
+
+def index_fingerprint_file(index_path:Path):
+    return index_path.parent / f"{index_path.name}.fingerprint"
+
 def json_file(name:str, subdir:Path=data_base_root):
     return data_base_file(name, "json", subdir)
 
+def jsonl_file(name:str, subdir:Path=data_base_root):
+    return data_base_file(name, "jsonl", subdir)
+
+def parquet_file(name:str, subdir:Path=data_base_root):
+    return data_base_file(name, "parquet", subdir)
+
 def prompt_file(version:PROMPT_VERSION):
     return data_base_file(version, "md", prompt_templates)
 
 def load_req_dict_from_csv_file(name:TEST_DATA, field_names:List[str]=["Type", "Requirement"], subdir:Path=data_base_root):
+    import pandas as pd
     df = pd.read_csv(csv_file(name, subdir), encoding="utf-8", encoding_errors="replace")
     requirements = {fn: df[fn].to_list() for fn in field_names}
     return requirements
 
+def stream_dataset_inputs(
+    source:Union[Path, Literal["-"]], field_name:str="Requirement", offset:int=0, chunk_size:int=10000
+) -> Iterator[Tuple[int, Any]]:
+    """
+    Lazily reads the inputs of a dataset run with bounded memory, e.g. for requirement exports that are too large to load at once.
+
+    Args:
+        source (Union[Path, Literal["-"]]): 
+            A `.csv` file, which is read in chunks of `chunk_size` rows, 
+            a `.jsonl` file with one JSON object (or string) per line, 
+            or "-" for stdin with one JSON object or plain requirement per line.
+        field_name (str, optional): The column or key of the input. Defaults to "Requirement".
+        offset (int, optional): The number of inputs to skip, e.g. to resume an interrupted run. Defaults to 0.
+        chunk_size (int, optional): The number of CSV rows parsed at once. Defaults to 10000.
+
+    Yields:
+        Tuple[int, Any]: (index of the input in the source, input)
+    """
+    def stream_lines(lines:Iterator[str], parse:Callable[[str], Any]):
+        for idx, line in enumerate(lines):
+            if idx < offset or not line.strip():
+                continue
+            input = parse(line.rstrip("\n"))
+            yield idx, input[field_name] if isinstance(input, dict) and field_name in input else input
+
+    if source == "-":
+        import sys
+        yield from stream_lines(sys.stdin, lambda line: json.loads(line) if line.startswith("{") else line)
+    elif Path(source).suffix == ".csv":
+        import pandas as pd
+        chunks = pd.read_csv(
+            source, encoding="utf-8", encoding_errors="replace", usecols=[field_name], 
+            skiprows=range(1, offset + 1), chunksize=chunk_size
+        )
+        idx = offset
+        for chunk in chunks:
+            for input in chunk[field_name].to_list():
+                yield idx, input
+                idx += 1
+    else:
+        with open(source, "r", encoding="utf-8") as f:
+            yield from stream_lines(f, json.loads)
+
 def save_req_dict_to_csv_file(file_name:str, requirements:Dict[str, List[str]], subdir:Path=data_base_root):
+    import pandas as pd
     df = pd.DataFrame(requirements)
     df.to_csv(csv_file(file_name, subdir), encoding="utf-8")
 
@@ -156,6 +236,113 @@ def load_dict_from_json_file(file_name:str, subdir:Path=data_base_root) -> Optio
             return json.load(f)
     except FileNotFoundError:
         return {}
+
+# columns of the flattened datasets, one row per requirement and metric
+EVALUATION_COLUMNS = [
+    "requirement_idx", "requirement", "metric", "rating", "rating_threshold", "comment",
+    "proposed_requirement", "overall_rating", "overall_rating_threshold"
+]
+JUDGEMENT_COLUMNS = [
+    "requirement_idx", "requirement", "metric", "rating", "accuracy_of_rating", "comment_on_accuracy",
+    "quality_of_justification", "comment_on_quality", "overall_evaluation_rating", "overall_requirement_rating",
+    "overall_alignment_with_metrics"
+]
+
+def flatten_dataset(dataset:dict, eval_type:EVAL_TYPE) -> Dict[str, list]:
+    """
+    Flattens the nested outputs of an evaluation or judgement dataset into columns with one row per requirement and metric.
+    Missing fields of incomplete outputs are None.
+
+    Args:
+        dataset (dict): A dataset in the format of the `test_data` JSON files, i.e. `{eval_type: [outputs], ...}`.
+        eval_type (EVAL_TYPE): The type of the outputs.
+
+    Returns:
+        Dict[str, list]: The columns `EVALUATION_COLUMNS` or `JUDGEMENT_COLUMNS`.
+    """
+    evaluations = eval_type == "evaluations"
+    columns:Dict[str, list] = {name: [] for name in (EVALUATION_COLUMNS if evaluations else JUDGEMENT_COLUMNS)}
+    metric_fields = [name for name in columns if name not in ["requirement_idx", "requirement", "metric"]]
+    for idx, output in enumerate(dataset.get(eval_type, [])):
+        if evaluations:
+            proposal = output.get("proposed_requirement")
+            output_fields = {
+                "requirement": output.get("requirement"),
+                "proposed_requirement": proposal.get("text") if isinstance(proposal, dict) else proposal,
+                "overall_rating": output.get("overall_rating"),
+                "overall_rating_threshold": output.get("overall_rating_threshold")
+            }
+        else:
+            proposal = output.get("Assessment_of_proposed_requirement")
+            output_fields = {
+                "requirement": output.get("original_requirement"),
+                "overall_evaluation_rating": output.get("overall_evaluation_rating"),
+                "overall_requirement_rating": output.get("overall_requirement_rating"),
+                "overall_alignment_with_metrics": proposal.get("overall_alignment_with_metrics") if isinstance(proposal, dict) else None
+            }
+        for metric, values in (output.get("evaluation") or {}).items():
+            if metric not in Metrics.all or not isinstance(values, dict):
+                continue
+            columns["requirement_idx"].append(idx)
+            columns["requirement"].append(output_fields["requirement"])
+            columns["metric"].append(metric)
+            for name in metric_fields:
+                columns[name].append(output_fields[name] if name in output_fields else values.get(name))
+    return columns
+
+def save_dataset_to_parquet(
+    dataset:dict, name:str, eval_type:EVAL_TYPE, subdir:Path=data_base_root, compression:str="zstd"
+) -> Path:
+    """
+    Writes the flattened dataset (see `flatten_dataset`) as Parquet file `<name>.parquet`,
+    so analytics can load single columns and filter rows without parsing the nested JSON file.
+    The numeric columns are stored as floats, as ratings may be missing or averaged.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    columns = flatten_dataset(dataset, eval_type)
+    text_columns = ["requirement", "metric", "comment", "proposed_requirement", "comment_on_accuracy", "comment_on_quality"]
+    schema = pa.schema([
+        (name, pa.int32() if name == "requirement_idx" else pa.string() if name in text_columns else pa.float64())
+        for name in columns
+    ])
+    table = pa.table(columns, schema=schema).replace_schema_metadata({
+        "eval_type": eval_type,
+        "rating_scale": json.dumps(dataset.get("rating_scale")),
+        "failed_generations": json.dumps(dataset.get("failed_generations"))
+    })
+    path = parquet_file(name, subdir)
+    pq.write_table(table, path, compression=compression)
+    return path
+
+def load_dataset_from_parquet(
+    name:str, subdir:Path=data_base_root, columns:Optional[List[str]]=None, filters:Optional[List[Tuple[str, str, Any]]]=None
+):
+    """
+    Loads a flattened dataset written by `save_dataset_to_parquet` as pandas DataFrame.
+
+    Args:
+        name (str): The name of the dataset file (w/o '.parquet').
+        subdir (Path, optional): The directory of the file. Defaults to data_base_root.
+        columns (List[str], optional): The columns to be read, all if None. Defaults to None.
+        filters (List[Tuple[str, str, Any]], optional): Row filters like `[("metric", "=", "Correctness"), ("rating", "<", 3)]`,
+            which are applied while reading, so row groups without matches are skipped. Defaults to None.
+    """
+    import pyarrow.parquet as pq
+    return pq.read_table(parquet_file(name, subdir), columns=columns, filters=filters).to_pandas()
+
+def convert_json_datasets_to_parquet(subdir:Path=test_data, overwrite:bool=False) -> List[Path]:
+    """Writes a Parquet file next to every evaluation and judgement JSON file in subdir, that has none or an outdated one."""
+    written = []
+    for file in sorted(subdir.glob("*.json")):
+        dataset = load_dict_from_json_file(file.stem, subdir)
+        eval_type = next((t for t in get_args(EVAL_TYPE) if t in dataset), None)
+        if eval_type is None:
+            continue
+        target = parquet_file(file.stem, subdir)
+        if overwrite or not target.exists() or target.stat().st_mtime < file.stat().st_mtime:
+            written.append(save_dataset_to_parquet(dataset, file.stem, eval_type, subdir))
+    return written
     
 def load_static_few_shots(file_name:STATIC_FEW_SHOTS):
     llm_role = "evaluator" if file_name in get_args(EVAL_FEW_SHOTS) else "judge"
@@ -174,13 +361,17 @@ def load_prompt_template(version:PROMPT_VERSION):
     with open(prompt_file(version), "r") as f:
         return f.read()
 
+# serializes the last message dumps of concurrent dataset workers, whose models count their invocations independently
+_last_message_lock = Lock()
+
 def save_last_message(message:str, type:Literal["prompt", "response"], idx:int=1):
-    last_messages.mkdir(parents=True, exist_ok=True)
-    if idx == 1:
-        for file in last_messages.glob(f"last_{type}_*.md"):
-            file.unlink()
-    with open(data_base_file(f"last_{type}_{idx}", "md", last_messages), "w", encoding="utf-8") as f:
-        f.write(message)
+    with _last_message_lock:
+        last_messages.mkdir(parents=True, exist_ok=True)
+        if idx == 1:
+            for file in last_messages.glob(f"last_{type}_*.md"):
+                file.unlink(missing_ok=True)
+        with open(data_base_file(f"last_{type}_{idx}", "md", last_messages), "w", encoding="utf-8") as f:
+            f.write(message)
 
 def get_dataset_file_name(
     dataset:TEST_DATA, 
@@ -194,4 +385,36 @@ def get_dataset_file_name(
     if eval_type == "judgements":
         eval_name = f"{judge_approach}_judgements_of_{eval_name}"
     return eval_name
+
+def parse_dataset_file_name(name:str) -> Optional[Dict[str, Optional[str]]]:
+    """
+    Inverse of `get_dataset_file_name`.
+
+    Returns:
+        Optional[Dict[str, Optional[str]]]: {"dataset", "evaluator", "eval_type", "eval_approach", "judge_approach"} 
+            or None, if the name does not follow the convention (e.g. shard logs or manifests).
+            The judge approach is None for evaluations.
+    """
+    import re
+    approaches = "|".join(sorted(get_args(EVAL_APPROACH), key=len, reverse=True))
+    match = re.fullmatch(
+        rf"(?:(?P<judge_approach>{approaches})_judgements_of_)?(?P<eval_approach>{approaches})_evaluations_of_(?P<dataset>.+)_by_(?P<evaluator>.+)",
+        name
+    )
+    evaluators = {evaluator.replace("-", "_").replace(".", "_"): evaluator for evaluator in get_args(EVALUATOR)}
+    if match is None or match["evaluator"] not in evaluators:
+        return None
+    return {
+        "dataset": match["dataset"],
+        "evaluator": evaluators[match["evaluator"]],
+        "eval_type": "judgements" if match["judge_approach"] else "evaluations",
+        "eval_approach": match["eval_approach"],
+        "judge_approach": match["judge_approach"]
+    }
+
+def get_shard_file_name(dataset_file_name:str, shard_idx:int, n_shards:int):
+    return f"{dataset_file_name}_shard_{shard_idx + 1}_of_{n_shards}"
+
+def get_shard_manifest_name(dataset_file_name:str):
+    return f"{dataset_file_name}_shards"
     
\ No newline at end of file
@@ -0,0 +1,294 @@
+# MIT License
+# Copyright (c) 2025 Benedikt Horn, Sascha Tauchmann
+# See the LICENSE file for more details.
+
+from database_management import db_manager as db
+from database_management.db_manager import Metrics as M
+from database_management.checkpoint_log import input_hash
+from typing import List, Dict, Optional, Any, Iterable, Tuple
+from datetime import datetime, timezone
+from pathlib import Path
+from threading import Lock
+import sqlite3
+import json
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS requirements (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    dataset TEXT NOT NULL,
+    model TEXT NOT NULL,
+    eval_type TEXT NOT NULL,
+    eval_approach TEXT NOT NULL,
+    judge_approach TEXT,
+    rating_scale INTEGER,
+    failed_generations INTEGER,
+    source_mtime REAL,
+    updated TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS evaluations (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    requirement_id INTEGER NOT NULL REFERENCES requirements(id),
+    proposed_requirement TEXT,
+    overall_rating REAL,
+    overall_rating_threshold REAL,
+    content TEXT NOT NULL,
+    UNIQUE (run_id, idx)
+);
+CREATE TABLE IF NOT EXISTS ratings (
+    evaluation_id INTEGER NOT NULL REFERENCES evaluations(id) ON DELETE CASCADE,
+    metric TEXT NOT NULL,
+    rating REAL,
+    rating_threshold REAL,
+    comment TEXT,
+    PRIMARY KEY (evaluation_id, metric)
+);
+CREATE TABLE IF NOT EXISTS judgements (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    requirement_id INTEGER NOT NULL REFERENCES requirements(id),
+    overall_evaluation_rating REAL,
+    overall_requirement_rating REAL,
+    content TEXT NOT NULL,
+    UNIQUE (run_id, idx)
+);
+CREATE TABLE IF NOT EXISTS judgement_ratings (
+    judgement_id INTEGER NOT NULL REFERENCES judgements(id) ON DELETE CASCADE,
+    metric TEXT NOT NULL,
+    rating REAL,
+    accuracy_of_rating REAL,
+    quality_of_justification REAL,
+    comment_on_accuracy TEXT,
+    comment_on_quality TEXT,
+    PRIMARY KEY (judgement_id, metric)
+);
+CREATE INDEX IF NOT EXISTS runs_model ON runs(model);
+CREATE INDEX IF NOT EXISTS runs_approach ON runs(eval_approach, judge_approach);
+CREATE INDEX IF NOT EXISTS runs_dataset ON runs(dataset);
+CREATE INDEX IF NOT EXISTS evaluations_requirement ON evaluations(requirement_id);
+CREATE INDEX IF NOT EXISTS judgements_requirement ON judgements(requirement_id);
+CREATE INDEX IF NOT EXISTS ratings_metric ON ratings(metric);
+CREATE INDEX IF NOT EXISTS judgement_ratings_metric ON judgement_ratings(metric);
+"""
+
+class EvaluationRepository:
+    """
+    Embedded SQLite repository of all evaluation and judgement runs,
+    which makes the results queryable across datasets, models and approaches instead of by file name.
+    The JSON files in `data_base/test_data` remain the primary format, the repository is filled from them
+    with `import_json_datasets` and kept up to date by `evaluate_dataset`.
+
+    Attributes
+    ==========
+
+        path (Path): The SQLite database file. Defaults to `db.evaluation_repository_file`.
+
+    Key Methods
+    ===========
+
+        **save_run**
+            Replaces all outputs of a run in a single transaction.
+        **import_json_datasets**
+            Imports the dataset files of a directory, whose name follows `db.get_dataset_file_name`.
+        **evaluations_of_requirement** / **judgements_of_requirement**
+            All outputs of a requirement by any model and approach, looked up by its content hash.
+        **ratings**
+            Per metric ratings filtered by dataset, model, approach and metric.
+    """
+    def __init__(self, path:Path=db.evaluation_repository_file):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute("PRAGMA foreign_keys = ON")
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.executescript(SCHEMA)
+        self._lock = Lock()
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _requirement_id(self, text:str) -> int:
+        hash = input_hash(text)
+        self._connection.execute("INSERT OR IGNORE INTO requirements (hash, text) VALUES (?, ?)", (hash, text))
+        return self._connection.execute("SELECT id FROM requirements WHERE hash = ?", (hash,)).fetchone()["id"]
+
+    def save_run(
+        self, name:str, dataset:dict, dataset_name:str, model:db.EVALUATOR, eval_type:db.EVAL_TYPE,
+        eval_approach:db.EVAL_APPROACH, judge_approach:Optional[db.EVAL_APPROACH]=None, source_mtime:Optional[float]=None
+    ) -> int:
+        """
+        Stores a dataset run, replacing the outputs of an earlier version of the run.
+        The run is written in one transaction, so readers see either the old or the new outputs.
+
+        Args:
+            name (str): The file name of the run, see `db.get_dataset_file_name`.
+            dataset (dict): The run in the format of the dataset JSON files.
+            dataset_name (str): The evaluated requirement dataset.
+            model (db.EVALUATOR): The model, which generated the evaluations.
+            eval_type (db.EVAL_TYPE): The type of the outputs.
+            eval_approach (db.EVAL_APPROACH): The evaluation approach.
+            judge_approach (db.EVAL_APPROACH, optional): The judgement approach of judgement runs. Defaults to None.
+            source_mtime (float, optional): The modification time of the imported file. Defaults to None.
+
+        Returns:
+            int: The id of the run.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM runs WHERE name = ?", (name,))
+            run_id = self._connection.execute(
+                """INSERT INTO runs (
+                    name, dataset, model, eval_type, eval_approach, judge_approach,
+                    rating_scale, failed_generations, source_mtime, updated
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    name, dataset_name, model, eval_type, eval_approach, judge_approach,
+                    dataset.get("rating_scale"), dataset.get("failed_generations"), source_mtime,
+                    datetime.now(timezone.utc).isoformat(timespec="seconds")
+                )
+            ).lastrowid
+            save_output = self._save_evaluation if eval_type == "evaluations" else self._save_judgement
+            for idx, output in enumerate(dataset.get(eval_type, [])):
+                save_output(run_id, idx, output)
+        return run_id
+
+    def _save_evaluation(self, run_id:int, idx:int, output:dict):
+        proposal = output.get("proposed_requirement")
+        evaluation_id = self._connection.execute(
+            """INSERT INTO evaluations (
+                run_id, idx, requirement_id, proposed_requirement, overall_rating, overall_rating_threshold, content
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (
+                run_id, idx, self._requirement_id(output.get("requirement") or ""),
+                proposal.get("text") if isinstance(proposal, dict) else proposal,
+                output.get("overall_rating"), output.get("overall_rating_threshold"), json.dumps(output)
+            )
+        ).lastrowid
+        self._connection.executemany(
+            "INSERT INTO ratings (evaluation_id, metric, rating, rating_threshold, comment) VALUES (?, ?, ?, ?, ?)",
+            [
+                (evaluation_id, metric, values.get("rating"), values.get("rating_threshold"), values.get("comment"))
+                for metric, values in _metric_items(output)
+            ]
+        )
+
+    def _save_judgement(self, run_id:int, idx:int, output:dict):
+        judgement_id = self._connection.execute(
+            """INSERT INTO judgements (
+                run_id, idx, requirement_id, overall_evaluation_rating, overall_requirement_rating, content
+            ) VALUES (?, ?, ?, ?, ?, ?)""",
+            (
+                run_id, idx, self._requirement_id(output.get("original_requirement") or ""),
+                output.get("overall_evaluation_rating"), output.get("overall_requirement_rating"), json.dumps(output)
+            )
+        ).lastrowid
+        self._connection.executemany(
+            """INSERT INTO judgement_ratings (
+                judgement_id, metric, rating, accuracy_of_rating, quality_of_justification, comment_on_accuracy, comment_on_quality
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            [
+                (
+                    judgement_id, metric, values.get("rating"), values.get("accuracy_of_rating"), values.get("quality_of_justification"),
+                    values.get("comment_on_accuracy"), values.get("comment_on_quality")
+                )
+                for metric, values in _metric_items(output)
+            ]
+        )
+
+    def import_json_datasets(self, subdir:Path=db.test_data, overwrite:bool=False) -> List[str]:
+        """
+        Imports the evaluation and judgement files of a directory. The run properties are parsed from the file names,
+        files with other names (e.g. shard logs) are skipped. Unchanged files are only imported again with `overwrite`.
+
+        Returns:
+            List[str]: The names of the imported runs.
+        """
+        imported_mtimes = {row["name"]: row["source_mtime"] for row in self._connection.execute("SELECT name, source_mtime FROM runs")}
+        imported = []
+        for file in sorted(subdir.glob("*.json")):
+            if (properties := db.parse_dataset_file_name(file.stem)) is None:
+                continue
+            mtime = file.stat().st_mtime
+            if not overwrite and imported_mtimes.get(file.stem) == mtime:
+                continue
+            self.save_run(
+                file.stem, db.load_dict_from_json_file(file.stem, subdir), properties["dataset"], properties["evaluator"],
+                properties["eval_type"], properties["eval_approach"], properties["judge_approach"], mtime
+            )
+            imported.append(file.stem)
+        return imported
+
+    def runs(self) -> List[Dict[str, Any]]:
+        return [dict(row) for row in self._connection.execute("SELECT * FROM runs ORDER BY name")]
+
+    def evaluations_of_requirement(self, requirement:str) -> List[Dict[str, Any]]:
+        """All evaluations of a requirement with the dataset, model and approach of their runs."""
+        rows = self._connection.execute(
+            """SELECT runs.dataset, runs.model, runs.eval_approach, evaluations.idx, evaluations.content
+            FROM evaluations
+            JOIN requirements ON requirements.id = evaluations.requirement_id
+            JOIN runs ON runs.id = evaluations.run_id
+            WHERE requirements.hash = ?
+            ORDER BY runs.name""",
+            (input_hash(requirement),)
+        )
+        return [{**dict(row), "content": json.loads(row["content"])} for row in rows]
+
+    def judgements_of_requirement(self, requirement:str) -> List[Dict[str, Any]]:
+        """All judgements of evaluations of a requirement with the dataset, model and approaches of their runs."""
+        rows = self._connection.execute(
+            """SELECT runs.dataset, runs.model, runs.eval_approach, runs.judge_approach, judgements.idx, judgements.content
+            FROM judgements
+            JOIN requirements ON requirements.id = judgements.requirement_id
+            JOIN runs ON runs.id = judgements.run_id
+            WHERE requirements.hash = ?
+            ORDER BY runs.name""",
+            (input_hash(requirement),)
+        )
+        return [{**dict(row), "content": json.loads(row["content"])} for row in rows]
+
+    def ratings(
+        self, dataset:Optional[str]=None, model:Optional[db.EVALUATOR]=None,
+        eval_approach:Optional[db.EVAL_APPROACH]=None, metric:Optional[M._single]=None
+    ) -> List[Dict[str, Any]]:
+        """The per metric ratings of all evaluations, optionally filtered by dataset, model, approach and metric."""
+        filters = [("runs.dataset", dataset), ("runs.model", model), ("runs.eval_approach", eval_approach), ("ratings.metric", metric)]
+        conditions, parameters = _where(filters)
+        rows = self._connection.execute(
+            f"""SELECT runs.dataset, runs.model, runs.eval_approach, evaluations.idx, requirements.text AS requirement,
+                ratings.metric, ratings.rating, ratings.rating_threshold, ratings.comment
+            FROM ratings
+            JOIN evaluations ON evaluations.id = ratings.evaluation_id
+            JOIN requirements ON requirements.id = evaluations.requirement_id
+            JOIN runs ON runs.id = evaluations.run_id
+            {conditions}
+            ORDER BY runs.name, evaluations.idx""",
+            parameters
+        )
+        return [dict(row) for row in rows]
+
+def _metric_items(output:dict) -> Iterable[Tuple[str, dict]]:
+    return [
+        (metric, values) for metric, values in (output.get("evaluation") or {}).items()
+        if metric in M.all and isinstance(values, dict)
+    ]
+
+def _where(filters:List[Tuple[str, Any]]) -> Tuple[str, list]:
+    active = [(column, value) for column, value in filters if value is not None]
+    if not active:
+        return "", []
+    return "WHERE " + " AND ".join(f"{column} = ?" for column, _ in active), [value for _, value in active]
@@ -1,5 +1,6 @@
 import re
 import json
+import unicodedata
 from typing import List, Callable
 
 def remove_non_utf_8_characters(s:str):
@@ -32,6 +33,24 @@ def normalize_string(s: str) -> str:
         return re.sub(r'\W+', ' ', s).strip().lower()
     except TypeError:
         return s
+
+
+def canonical_string(s: str) -> str:
+    """
+    Stronger normalization than `normalize_string`, which also unifies unicode variants (NFKC), 
+    casefolds and drops the articles "a", "an" and "the", e.g. to detect duplicate requirements.
+
+    Args:
+        s (str): The input string to be normalized.
+
+    Returns:
+        str: The canonical string.
+    """
+    try:
+        words = normalize_string(unicodedata.normalize("NFKC", s).casefold()).split()
+    except TypeError:
+        return s
+    return " ".join(word for word in words if word not in ("a", "an", "the"))
     
 def format_dict(d:dict, escape_brackets:bool=True):
     """
@@ -230,6 +230,44 @@ def process_metric_section(section:str, metrics:M._list, step:Optional[int]=None
             }
     return multiply_process_section(section, MetricVarToVal(), metrics)
 
+def render_one_shot_fragment(section:str, evaluation:dict, rating_scale:int):
+    """
+    Processes the templates one-shot section for a single evaluation, but keeps the `{os_id}` placeholder.
+    This way, the fragment of an evaluation can be rendered once and numbered by `join_one_shot_fragments` at any position.
+
+    Args:
+        section (str): The template content of the one shot section.
+        evaluation (dict): The evaluation to be inserted into the section.
+        rating_scale (int): The scale used for rating evaluations.
+
+    Returns:
+        str: The processed section with the `{os_id}` placeholder.
+    """
+    return process_variables(section, {
+        "os_rating": get_rating_expression(evaluation, rating_scale), 
+        "os_req": evaluation["requirement"], 
+        "os_eval": sh.format_dict(evaluation, escape_brackets=True)
+    })
+
+def join_one_shot_fragments(fragments:List[str]):
+    """
+    Numbers the given one-shot fragments consecutively and joins them with double new lines.
+
+    Args:
+        fragments (List[str]): The fragments rendered by `render_one_shot_fragment`.
+
+    Returns:
+        str: The formatted output with double new lines separating each fragment.
+    """
+    class OneShotIdVarToVal(VarToVal):
+        @staticmethod
+        def get(i:int, _:str) -> VAR_TO_VAL:
+            return {"os_id": str(i+1)}
+    return sh.double_new_lines([
+        process_variables(fragment, OneShotIdVarToVal.get(i, fragment))
+        for i, fragment in enumerate(fragments)
+    ])
+
 def process_one_shot_section(section:str, evaluations:List[dict], rating_scale:int):
     """
     Processes and multiplies the templates one-shot section for each given evaluation and returns the formatted output.
@@ -242,16 +280,9 @@ def process_one_shot_section(section:str, evaluations:List[dict], rating_scale:i
     Returns:
         str: The formatted output with double new lines separating each processed evaluation.
     """
-    class OneShotVarToVal(VarToVal):
-        @staticmethod
-        def get(i:int, ev:dict) -> VAR_TO_VAL:
-            return {
-                "os_id": str(i+1), 
-                "os_rating": get_rating_expression(ev, rating_scale), 
-                "os_req": ev["requirement"], 
-                "os_eval": sh.format_dict(ev, escape_brackets=True)
-            }
-    return multiply_process_section(section, OneShotVarToVal(), evaluations)
+    return join_one_shot_fragments([
+        render_one_shot_fragment(section, ev, rating_scale) for ev in evaluations
+    ])
 
 def process_few_shots_section(section:str, use_RAG:bool, n_shots:int, metrics:M._list, version:db.STATIC_FEW_SHOTS = "eval_rating_5"):
     """
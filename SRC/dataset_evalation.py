@@ -2,11 +2,24 @@
 # Copyright (c) 2025 Benedikt Horn, Sascha Tauchmann
 # See the LICENSE file for more details.
 
-from groq import RateLimitError, InternalServerError
 import database_management.db_manager as db
+from database_management import string_helper as sh
 from evaluation_wrapper.evaluation_wrapper import Evaluation, GeneralEval, GeneralJudgement
-from typing import List, Callable, Union, Literal
+from typing import List, Dict, Callable, Union, Literal, Optional, Any, Tuple, Iterable, Deque
+from collections import deque
+from copy import deepcopy
+from itertools import islice, takewhile
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, Future
+from queue import SimpleQueue, Empty
+from functools import partial
+from database_management.checkpoint_log import CheckpointLog, CheckpointRecord, compact_records
+from database_management.evaluation_repository import EvaluationRepository
+from run_telemetry import RunTelemetry, cache_stats_delta, save_run_manifest
+import run_telemetry
+import multiprocessing
+import time
+import os
 
 
 def evaluate_dataset(
@@ -17,12 +30,37 @@ def evaluate_dataset(
     judge_approach:db.EVAL_APPROACH,
     field_name:str, stop_idx:int=None,
     database_subdir:Path=db.test_data,
-    rating_scale:int=5
-):
+    rating_scale:int=5,
+    prefetch_contexts:Optional[Callable[[List[str]], Any]]=None,
+    prefetch_size:int=16,
+    add_to_RAG:Optional[Callable[[List[dict]], Any]]=None,
+    n_workers:int=1,
+    evaluator_factory:Optional[Callable[[], Callable[[Union[str, Evaluation]], Evaluation]]]=None,
+    retry_failed:bool=False,
+    shard:Optional[Tuple[int, int]]=None,
+    input_stream:Optional[Iterable[Tuple[int, Union[str, dict]]]]=None,
+    deduplication:Optional[Literal["normalized", "canonical"]]=None,
+    cache_stats:Optional[Callable[[], Dict[str, Dict[str, int]]]]=None,
+    save_parquet:bool=False,
+    repository:Optional[EvaluationRepository]=None
+) -> Dict[str, Any]:
     """
     This function loads the dataset, performs evaluations using the specified evaluator, and saves the results to a JSON file. 
-    If evaluations already exist, it resumes from where it left off. It handles rate limit errors, internal server errors, 
-    and other exceptions, and retries evaluations up to a specified recursion limit.
+    It handles rate limit errors, internal server errors, and other exceptions, and retries evaluations up to a specified recursion limit.
+
+    Each result and failure is appended to the checkpoint log `<dest>.jsonl` as soon as it is generated, see `CheckpointLog`.
+    A resumed run skips exactly the inputs, which are in the log with an unchanged content hash. 
+    At the end, the log is compacted into the JSON file `<dest>.json`.
+    Dataset files created before the log was introduced are migrated into it on the first resume.
+
+    With `n_workers > 1`, up to `n_workers` requirements are evaluated concurrently, each worker using its own evaluator.
+    The outputs keep the order of the dataset, as they are committed in order once all of their predecessors are done.
+    An exception of a single requirement only counts it as failed generation, 
+    whereas rate limit and internal server errors stop the run after the last committed requirement, so it can be resumed.
+
+    Each run appends a manifest to `<dest>_run_manifest.json` with its configuration, wall time, requirements per minute, 
+    latency percentiles per requirement and chain link, token usage per model, retries and failures by error type 
+    and cache hit rates, see `run_telemetry.RunTelemetry`.
     
     Args:
         evaluator (Callable[[Union[str, Evaluation]], Evaluation]): The evaluator to be used.
@@ -35,30 +73,88 @@ def evaluate_dataset(
         stop_idx (int, optional): The index at which to stop the evaluation. Defaults to None.
         database_subdir (Path, optional): The directory in which the dataset is stored. Defaults to db.test_data.
         rating_scale (int, optional): The rating scale to be used. Defaults to 5.
+        prefetch_contexts (Callable[[List[str]], Any], optional): 
+            Retrieves the RAG contexts of a list of upcoming requirements (e.g. `RAG.batch_retrieve`). 
+            It runs in a background thread, so retrieval is not blocking the LLM calls. Only used for evaluations. Defaults to None.
+        prefetch_size (int, optional): The number of requirements prefetched at once. Defaults to 16.
+        add_to_RAG (Callable[[List[dict]], Any], optional): 
+            Receives the evaluations generated in this run after they are saved (e.g. `RAG.add_evaluations`), 
+            to extend the index of the RAG dataset which is written to. Only used for evaluations. Defaults to None.
+        n_workers (int, optional): The number of requirements evaluated concurrently. Defaults to 1.
+        evaluator_factory (Callable[[], Callable[[Union[str, Evaluation]], Evaluation]], optional): 
+            Creates an additional evaluator for a worker, as evaluators hold the state of their current chain step. 
+            Required if `n_workers > 1`. Defaults to None.
+        retry_failed (bool, optional): Whether to evaluate inputs again, whose generation failed in a previous run. Defaults to False.
+        shard (Tuple[int, int], optional): (shard index, number of shards). Only evaluates the contiguous range of the shard 
+            into its own log, see `load_shard_manifest`. The shards can run in separate processes or on separate machines 
+            and are combined into the dataset file by `merge_shards`. Defaults to None.
+        input_stream (Iterable[Tuple[int, Union[str, dict]]], optional): Lazily read (index, input) pairs, 
+            e.g. from `db.stream_dataset_inputs`, which replace the inputs of the dataset, 
+            so that very large exports are evaluated with bounded memory. `dataset_name` then only names the output files.
+            Defaults to None.
+        deduplication (Literal["normalized", "canonical"], optional): Groups requirements by `sh.normalize_string` 
+            or the stronger `sh.canonical_string`, evaluates only the first requirement of each group 
+            and copies its output, with the requirement text replaced, to the other ones. 
+            A resumed run also copies the outputs of requirements completed in earlier runs. 
+            Completed outputs are read back from the log for their duplicates instead of being kept in memory. Defaults to None.
+        cache_stats (Callable[[], Dict[str, Dict[str, int]]], optional): Returns the hits and misses of the caches 
+            used by the evaluator (e.g. `RAG.cache_stats`), whose hit rates in this run are added to the manifest. Defaults to None.
+        save_parquet (bool, optional): Whether to also write the flattened dataset as `<dest>.parquet` 
+            for columnar analytics, see `db.save_dataset_to_parquet`. Defaults to False.
+        repository (EvaluationRepository, optional): The repository, in which the compacted run is stored in one transaction,
+            replacing an earlier version of the run. Not used for shards. Defaults to None.
+
+    Returns:
+        Dict[str, Any]: The number of generated outputs of the selected inputs, including those of earlier runs, 
+            the number of evaluations saved by deduplication in this run and the run manifest.
     """
+    from groq import RateLimitError, InternalServerError
+    if input_stream is not None and shard is not None:
+        raise ValueError("Shards require a dataset with a known number of inputs, not an input stream")
+    inputs = None if input_stream is not None else load_dataset_inputs(
+        dataset_name, model, eval_type, eval_approach, field_name, database_subdir
+    )
     if eval_type == "judgements":
-        field_name = "evaluations"
-        new_dataset_name = db.get_dataset_file_name(dataset_name, model, "evaluations", eval_approach)
-        input_dict = db.load_dict_from_json_file(new_dataset_name, database_subdir)
-        input_parser = lambda input: GeneralEval()(input)
+        input_parser = GeneralEval()
     else:
-        input_dict = db.load_req_dict_from_csv_file(
-            dataset_name, [field_name], database_subdir
-        )
         input_parser = lambda input: input
     dest_json_name = db.get_dataset_file_name(dataset_name, model, eval_type, eval_approach, judge_approach)
-    if db.json_file(dest_json_name, database_subdir).exists():
-        output_dict = db.load_dict_from_json_file(dest_json_name, database_subdir)
+    if shard is None:
+        log = CheckpointLog(db.jsonl_file(dest_json_name, database_subdir))
+        if not log.exists() and db.json_file(dest_json_name, database_subdir).exists():
+            legacy_dict = db.load_dict_from_json_file(dest_json_name, database_subdir)
+            log.migrate_legacy_outputs(legacy_dict[eval_type], legacy_dict["failed_generations"])
+            rating_scale = legacy_dict.get("rating_scale", rating_scale)
     else:
-        output_dict = {
-            "failed_generations":0,
-            "rating_scale":rating_scale,
-            eval_type:[]
-        }
-    outputs:list = output_dict[eval_type]
-    start_idx = len(outputs) + output_dict["failed_generations"]
-    
-    inputs:List[Union[str, dict]] = input_dict[field_name][start_idx:stop_idx]
+        shard_idx, n_shards = shard
+        manifest = load_shard_manifest(dest_json_name, len(inputs), n_shards, database_subdir)
+        shard_info = manifest["shards"][shard_idx]
+        log = CheckpointLog(db.jsonl_file(shard_info["name"], database_subdir))
+    if input_stream is None:
+        selected = range(len(inputs))[:stop_idx]
+        if shard is not None:
+            selected = range(shard_info["start"], min(shard_info["stop"], len(selected)))
+        input_stream = ((idx, inputs[idx]) for idx in selected)
+        n_selected = len(selected)
+    else:
+        input_stream = takewhile(lambda item: stop_idx is None or item[0] < stop_idx, input_stream)
+        n_selected = None
+    status_index = log.status_index()
+    n_generated = 0
+    telemetry = RunTelemetry()
+    # requirements committed in this run, including failed generations
+    n_processed = 0
+    cache_stats_before = cache_stats() if cache_stats else {}
+
+    def read_pending():
+        nonlocal n_generated
+        for idx, input in input_stream:
+            if not log.is_completed(status_index, idx, input, retry_failed):
+                yield idx, input
+            elif status_index[idx][1] == "done":
+                n_generated += 1
+    pending = read_pending()
+    new_outputs:list = []
 
     def output_parser(eval:Evaluation, input:Union[str, Evaluation]):
         output = eval.content
@@ -67,38 +163,361 @@ def evaluate_dataset(
         output["overall_requirement_rating"] = input["overall_rating"]
         return output
 
-    def try_generate_evaluation(input:Union[str, Evaluation], recursion_count:int=0, recursion_limit:int=2):
+    def try_generate_evaluation(evaluator, input:Union[str, Evaluation], recursion_count:int=0, recursion_limit:int=2):
         recursion_count += 1
         eval = evaluator(input)
         if eval.is_valid():
             return output_parser(eval, input)
         if recursion_count <= recursion_limit:
-            return try_generate_evaluation(input, recursion_count, recursion_limit)
+            telemetry.record_retry(eval["error"]["type"])
+            return try_generate_evaluation(evaluator, input, recursion_count, recursion_limit)
+        telemetry.record_failure(eval["error"]["type"])
         print(f"Could not generate evaluation for input: {input}")
         return None
-    
-    for input in inputs:
+
+    if n_workers > 1 and evaluator_factory is None:
+        raise ValueError("An evaluator_factory is required to evaluate with more than one worker")
+    # idle evaluators, a worker creates a new one if all of them are in use
+    evaluators:SimpleQueue = SimpleQueue()
+    evaluators.put(evaluator)
+
+    def evaluate(input:Union[str, dict]):
         try:
-            if evaluation := try_generate_evaluation(input_parser(input)):
-                outputs.append(evaluation)
-                print(f"Generated evaluation {len(outputs)}/{start_idx + len(inputs)}")
-            else:
-                output_dict["failed_generations"] += 1
-            continue
-        except RateLimitError:
-            print("Rate limit error occurred.")
-        except InternalServerError:
-            print("Internal server error occurred.")
+            worker_evaluator = evaluators.get_nowait()
+        except Empty:
+            worker_evaluator = evaluator_factory()
+        start = time.perf_counter()
+        try:
+            output = try_generate_evaluation(worker_evaluator, input_parser(input))
         except Exception as e:
-            print(f"Unknown error occurred: {e}")
-        break
-    print("Saving generated evaluations.")
-    db.save_dict_to_json_file(output_dict, dest_json_name, database_subdir)
+            telemetry.record_failure(type(e).__name__)
+            raise
+        finally:
+            evaluators.put(worker_evaluator)
+        telemetry.record_requirement(time.perf_counter() - start)
+        return output
+
+    def log_result(idx:int, input:Union[str, dict], duplicate_key:Optional[str], future:Future):
+        # every finished item is logged right away, independent of the commit order
+        if future.cancelled() or isinstance(future.exception(), (RateLimitError, InternalServerError)):
+            return
+        if future.exception() is None and (output := future.result()) is not None:
+            offset = log.append(idx, input, "done", output)
+            if duplicate_key is not None:
+                # later duplicates read the output back from the log, so the output is not kept in memory
+                representatives[duplicate_key] = offset
+        else:
+            log.append(idx, input, "failed")
+            if duplicate_key is not None:
+                # the next duplicate is evaluated itself
+                representatives.pop(duplicate_key, None)
+
+    prefetcher = None
+    if prefetch_contexts and eval_type == "evaluations":
+        prefetcher = ThreadPoolExecutor(max_workers=1)
+    # inputs read from the source but not submitted yet, at most two chunks of prefetch_size
+    buffered:Deque[Tuple[int, Union[str, dict]]] = deque()
+    def read_chunk(in_background:bool=True):
+        chunk = list(islice(pending, prefetch_size))
+        buffered.extend(chunk)
+        if prefetcher and (requirements := [input for _, input in chunk if isinstance(input, str)]):
+            if in_background:
+                prefetcher.submit(prefetch_contexts, requirements)
+            else:
+                prefetch_contexts(requirements)
+    # the contexts of the first chunk are retrieved before the evaluation starts, later ones in the background
+    read_chunk(in_background=False)
+
+    # the first evaluated input of each group of duplicates in this or an earlier run, 
+    # as future while it is evaluated and as log offset of its output afterwards, see `log_result`
+    representatives:Dict[str, Union[Future, int]] = {}
+    n_deduplicated = 0
+    normalize = {None: None, "normalized": sh.normalize_string, "canonical": sh.canonical_string}[deduplication]
+    get_duplicate_key = lambda input: normalize(input) if normalize and isinstance(input, str) else None
+    if normalize:
+        # requirements completed in earlier runs represent their duplicates as well, 
+        # the log is streamed, so only the duplicate key and the offset of the last record of each input are kept
+        completed:Dict[int, Tuple[str, int]] = {}
+        for offset, record in log.records_with_offsets(inputs):
+            idx, output = record["idx"], record["output"]
+            key = None
+            if record["status"] == "done" and isinstance(output, dict):
+                key = get_duplicate_key(inputs[idx] if inputs is not None and idx < len(inputs) else output.get("requirement"))
+            if key is not None:
+                completed[idx] = (key, offset)
+            else:
+                completed.pop(idx, None)
+        for idx in sorted(completed):
+            key, offset = completed[idx]
+            representatives.setdefault(key, offset)
+        del completed
+
+    def copy_output(output:Any, input:str) -> Any:
+        if isinstance(output, dict) and "requirement" in output:
+            output["requirement"] = input
+        return output
+
+    def fan_out(duplicate:Future, input:str, representative:Future):
+        if representative.cancelled():
+            duplicate.cancel()
+        elif (error := representative.exception()) is not None:
+            duplicate.set_exception(error)
+        elif (output := representative.result()) is None:
+            duplicate.set_result(None)
+        else:
+            duplicate.set_result(copy_output(deepcopy(output), input))
+
+    with run_telemetry.activate(telemetry):
+        workers = ThreadPoolExecutor(max_workers=n_workers)
+        # bounds the number of submitted but uncommitted requirements
+        max_in_flight = 2 * n_workers
+        in_flight:Deque[Tuple[int, Future]] = deque()
+        while True:
+            while len(in_flight) < max_in_flight:
+                if len(buffered) <= prefetch_size:
+                    read_chunk()
+                if not buffered:
+                    break
+                idx, input = buffered.popleft()
+                key = get_duplicate_key(input)
+                if (representative := representatives.get(key) if key is not None else None) is None:
+                    future = workers.submit(evaluate, input)
+                    if key is not None:
+                        representatives[key] = future
+                else:
+                    # the duplicate is not evaluated, but receives the result of its representative
+                    future = Future()
+                    if isinstance(representative, Future):
+                        representative.add_done_callback(partial(fan_out, future, input))
+                    else:
+                        future.set_result(copy_output(log.read_record(representative)["output"], input))
+                    n_deduplicated += 1
+                future.add_done_callback(partial(log_result, idx, input, key if representative is None else None))
+                in_flight.append((idx, future))
+            if not in_flight:
+                break
+            idx, future = in_flight.popleft()
+            try:
+                evaluation = future.result()
+                n_processed += 1
+                if evaluation:
+                    if add_to_RAG:
+                        new_outputs.append(evaluation)
+                    n_generated += 1
+                    print(f"Generated evaluation {n_generated}" + (f"/{n_selected}" if n_selected is not None else ""))
+                continue
+            except RateLimitError:
+                print("Rate limit error occurred.")
+            except InternalServerError:
+                print("Internal server error occurred.")
+            except Exception as e:
+                n_processed += 1
+                print(f"Unknown error occurred for input {idx}: {e}")
+                continue
+            break
+        # items, which are already in progress, are still finished and logged
+        workers.shutdown(wait=True, cancel_futures=True)
+        if prefetcher:
+            prefetcher.shutdown(wait=False, cancel_futures=True)
+    log.close()
+    if shard is None:
+        print("Saving generated evaluations.")
+        log.write_compacted(db.json_file(dest_json_name, database_subdir), eval_type, rating_scale, inputs)
+        if save_parquet or repository:
+            dataset = db.load_dict_from_json_file(dest_json_name, database_subdir)
+            if save_parquet:
+                db.save_dataset_to_parquet(dataset, dest_json_name, eval_type, database_subdir)
+            if repository:
+                repository.save_run(
+                    dest_json_name, dataset, dataset_name, model, eval_type, eval_approach,
+                    judge_approach if eval_type == "judgements" else None,
+                    db.json_file(dest_json_name, database_subdir).stat().st_mtime
+                )
+    else:
+        print(f"Saved generated evaluations of shard {shard[0] + 1}/{shard[1]}, merge the shards with `merge_shards`.")
+    if deduplication:
+        print(f"Deduplication saved {n_deduplicated} evaluations.")
+    manifest = telemetry.manifest(
+        n_processed,
+        config={
+            "dataset": dataset_name, "model": model, "eval_type": eval_type, 
+            "eval_approach": eval_approach, "judge_approach": judge_approach,
+            "n_workers": n_workers, "deduplication": deduplication, "shard": shard
+        },
+        cache_stats=cache_stats_delta(cache_stats_before, cache_stats()) if cache_stats else {}
+    )
+    manifest["deduplicated"] = n_deduplicated
+    save_run_manifest(manifest, dest_json_name if shard is None else shard_info["name"], database_subdir)
+    print(f"Processed {n_processed} requirements in {manifest['wall_time_s']:.1f}s ({manifest['requirements_per_minute']:.1f}/min).")
+    if add_to_RAG and eval_type == "evaluations" and new_outputs:
+        add_to_RAG(new_outputs)
+    return {"generated": n_generated, "deduplicated": n_deduplicated, "manifest": manifest}
 
+def load_dataset_inputs(
+    dataset_name:db.TEST_DATA, model:db.MODEL, eval_type:db.EVAL_TYPE, eval_approach:db.EVAL_APPROACH,
+    field_name:str, database_subdir:Path=db.test_data
+) -> List[Union[str, dict]]:
+    """The inputs of a dataset run: the requirements of the dataset for evaluations or the evaluations of the model for judgements."""
+    if eval_type == "judgements":
+        evaluations_name = db.get_dataset_file_name(dataset_name, model, "evaluations", eval_approach)
+        return db.load_dict_from_json_file(evaluations_name, database_subdir)["evaluations"]
+    return db.load_req_dict_from_csv_file(dataset_name, [field_name], database_subdir)[field_name]
+
+def shard_ranges(n_items:int, n_shards:int) -> List[Tuple[int, int]]:
+    """Splits n items into n_shards contiguous (start, stop) ranges, whose sizes differ by at most one."""
+    size, remainder = divmod(n_items, n_shards)
+    bounds = [i * size + min(i, remainder) for i in range(n_shards + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def load_shard_manifest(dest_json_name:str, n_items:int, n_shards:int, database_subdir:Path=db.test_data) -> dict:
+    """
+    Loads the manifest of a sharded dataset run or creates it on the first call.
+    The manifest lists the input range and the log name of each shard. 
+    As the shards are deterministic, every process or machine creates the same manifest.
+
+    Raises:
+        ValueError: If an existing manifest was created for a different number of inputs or shards.
+    """
+    manifest_name = db.get_shard_manifest_name(dest_json_name)
+    if manifest := db.load_dict_from_json_file(manifest_name, database_subdir):
+        if (manifest["n_items"], manifest["n_shards"]) != (n_items, n_shards):
+            raise ValueError(
+                f"The shard manifest {manifest_name} was created for {manifest['n_items']} inputs in {manifest['n_shards']} shards, "
+                f"not for {n_items} inputs in {n_shards} shards"
+            )
+        return manifest
+    manifest = {
+        "dataset": dest_json_name,
+        "n_items": n_items,
+        "n_shards": n_shards,
+        "shards": [
+            {"name": db.get_shard_file_name(dest_json_name, i, n_shards), "start": start, "stop": stop}
+            for i, (start, stop) in enumerate(shard_ranges(n_items, n_shards))
+        ]
+    }
+    db.save_dict_to_json_file(manifest, manifest_name, database_subdir)
+    return manifest
+
+def merge_shards(
+    dataset_name:db.TEST_DATA, model:db.MODEL, eval_type:db.EVAL_TYPE, 
+    eval_approach:db.EVAL_APPROACH, judge_approach:db.EVAL_APPROACH, field_name:str="Requirement",
+    database_subdir:Path=db.test_data, rating_scale:int=5, allow_missing:bool=False
+) -> dict:
+    """
+    Merges the logs of the shards of a dataset run into its log and JSON file, which have the same format as unsharded runs.
+    The merged files are rewritten from the shard logs only, so merging again yields the same files.
+
+    Args:
+        See `evaluate_dataset`.
+        allow_missing (bool, optional): Whether to merge, although some inputs are in no shard log yet. Defaults to False.
+
+    Returns:
+        dict: {"n_items", "n_done", "n_failed", "missing": [input indices], "duplicates": [input indices]}
+
+    Raises:
+        ValueError: If an input is logged with different outputs by several shards, or by a shard it does not belong to, 
+            or if inputs are missing and `allow_missing` is False.
+    """
+    inputs = load_dataset_inputs(dataset_name, model, eval_type, eval_approach, field_name, database_subdir)
+    dest_json_name = db.get_dataset_file_name(dataset_name, model, eval_type, eval_approach, judge_approach)
+    manifest_name = db.get_shard_manifest_name(dest_json_name)
+    if not (manifest := db.load_dict_from_json_file(manifest_name, database_subdir)):
+        raise ValueError(f"No shard manifest {manifest_name} found in {database_subdir}")
+    manifest = load_shard_manifest(dest_json_name, len(inputs), manifest["n_shards"], database_subdir)
+    merged:Dict[int, CheckpointRecord] = {}
+    duplicates:List[int] = []
+    for shard_info in manifest["shards"]:
+        for idx, record in CheckpointLog(db.jsonl_file(shard_info["name"], database_subdir)).latest(inputs).items():
+            if not shard_info["start"] <= idx < shard_info["stop"]:
+                raise ValueError(f"Input {idx} is logged by shard {shard_info['name']}, but does not belong to it")
+            if idx in merged:
+                duplicates.append(idx)
+                if merged[idx] != record:
+                    raise ValueError(f"Input {idx} is logged with different results by several shards")
+            merged[idx] = record
+    missing = [idx for idx in range(len(inputs)) if idx not in merged]
+    if missing and not allow_missing:
+        raise ValueError(f"{len(missing)} inputs are missing in the shard logs, e.g. {missing[:10]}")
+    CheckpointLog(db.jsonl_file(dest_json_name, database_subdir)).rewrite(merged)
+    db.save_dict_to_json_file(compact_records(merged, eval_type, rating_scale), dest_json_name, database_subdir)
+    return {
+        "n_items": len(inputs),
+        "n_done": sum(record["status"] == "done" for record in merged.values()),
+        "n_failed": sum(record["status"] == "failed" for record in merged.values()),
+        "missing": missing,
+        "duplicates": duplicates
+    }
+
+def _evaluate_shard(generator_kwargs:dict, api_keys:Dict[db.LLM_PROVIDER, str], evaluate_kwargs:dict):
+    # runs in a separate process, so the evaluator is created here and the API keys only apply to this process
+    from response_generation import init_response_generator
+    for provider, api_key in api_keys.items():
+        os.environ[f"{provider.upper()}_API_KEY"] = api_key
+    evaluate_dataset(
+        init_response_generator(**generator_kwargs),
+        evaluator_factory=partial(init_response_generator, **generator_kwargs),
+        **evaluate_kwargs
+    )
+
+def run_shards(
+    generator_kwargs:dict, n_shards:int, 
+    api_keys:Optional[Dict[db.LLM_PROVIDER, List[str]]]=None, 
+    merge:bool=True, allow_missing:bool=False, **evaluate_kwargs
+) -> Optional[dict]:
+    """
+    Evaluates a dataset in `n_shards` parallel processes on this machine and merges the shards afterwards.
+    To run shards on several machines, call `evaluate_dataset` with `shard=(i, n_shards)` on each of them, 
+    copy the shard logs into one `database_subdir` and call `merge_shards`.
+
+    Args:
+        generator_kwargs (dict): The arguments of `init_response_generator`, which creates the evaluators of each process.
+        n_shards (int): The number of shards and processes.
+        api_keys (Dict[db.LLM_PROVIDER, List[str]], optional): API keys per provider, which are assigned round robin to the shards,
+            so each shard can use its own quota. Defaults to the keys of `db.get_api_key`.
+        merge (bool, optional): Whether to merge the shards after all processes finished. Defaults to True.
+        allow_missing (bool, optional): Whether to merge, although some inputs are in no shard log, see `merge_shards`. Defaults to False.
+        **evaluate_kwargs: The arguments of `evaluate_dataset` except for the evaluator.
+
+    Returns:
+        Optional[dict]: The result of `merge_shards`, if merged.
+
+    Raises:
+        RuntimeError: If a shard process exited with an error. The shards are not merged then, 
+            their logs are kept, so the failed shards can be resumed.
+    """
+    api_keys = api_keys or {}
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=_evaluate_shard, args=(
+            generator_kwargs,
+            {provider: keys[i % len(keys)] for provider, keys in api_keys.items() if keys},
+            dict(evaluate_kwargs, shard=(i, n_shards))
+        ))
+        for i in range(n_shards)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    failed = {i: process.exitcode for i, process in enumerate(processes) if process.exitcode != 0}
+    if failed:
+        raise RuntimeError(
+            f"{len(failed)} of {n_shards} shard processes failed, exit codes by shard: {failed}. "
+            "Rerun them with `evaluate_dataset(..., shard=(i, n_shards))` before merging."
+        )
+    if not merge:
+        return None
+    merge_kwargs = {
+        key: evaluate_kwargs[key] for key in [
+            "dataset_name", "model", "eval_type", "eval_approach", "judge_approach", 
+            "field_name", "database_subdir", "rating_scale"
+        ] if key in evaluate_kwargs
+    }
+    return merge_shards(**merge_kwargs, allow_missing=allow_missing)
 
 def parse_ratings_of_dataset(dataset:db.TEST_DATA, evaluator:db.EVALUATOR, eval_approach:db.EVAL_APPROACH, eval_type:db.EVAL_TYPE):
     """
-    Parses the ratings of a given dataset and saves the parsed evaluations back to the file.
+    Parses the ratings of a given dataset at once (see `EvaluationBatch.parse_ratings`) and saves the parsed evaluations back to the file.
 
     Args:
         dataset (db.TEST_DATA): The dataset to be evaluated.
@@ -108,9 +527,11 @@ def parse_ratings_of_dataset(dataset:db.TEST_DATA, evaluator:db.EVALUATOR, eval_
     """
     file_name = db.get_dataset_file_name(dataset, evaluator, eval_type, eval_approach)
     evaluations = db.load_dict_from_json_file(file_name, db.test_data)[eval_type]
+    from evaluation_wrapper.evaluation_batch import EvaluationBatch
     eval_wrapper = GeneralEval() if eval_type == "evaluations" else GeneralJudgement()
-    parsed_evaluations = [eval_wrapper(eval, parse_rating_on_init=True).content for eval in evaluations]
-    db.save_dict_to_json_file({eval_type: parsed_evaluations}, file_name, db.test_data)
+    batch = EvaluationBatch.from_contents(evaluations, eval_wrapper)
+    batch.parse_ratings()
+    db.save_dict_to_json_file({eval_type: batch.contents}, file_name, db.test_data)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,95 @@
+# MIT License
+# Copyright (c) 2025 Benedikt Horn, Sascha Tauchmann
+# See the LICENSE file for more details.
+
+import database_management.db_manager as db
+from typing import List, Tuple
+from pathlib import Path
+import pandas as pd
+
+# columns of the analytics frame, which identify the dataset file of a row, see `db.parse_dataset_file_name`
+FILE_COLUMNS = ["dataset", "evaluator", "eval_type", "eval_approach", "judge_approach"]
+ANALYTICS_COLUMNS = FILE_COLUMNS + list(dict.fromkeys(db.EVALUATION_COLUMNS + db.JUDGEMENT_COLUMNS))
+
+def _files_key(subdir:Path) -> Tuple:
+    """Identifies the state of the dataset files in subdir by their names, modification times and sizes."""
+    return (str(subdir),) + tuple(
+        (file.name, (stat := file.stat()).st_mtime_ns, stat.st_size) for file in sorted(subdir.glob("*.json"))
+    )
+
+def build_analytics_frame(subdir:Path=db.test_data) -> pd.DataFrame:
+    """
+    Builds one tidy DataFrame of all evaluation and judgement datasets in subdir,
+    with one row per requirement and metric (see `db.flatten_dataset`) and the columns `ANALYTICS_COLUMNS`.
+    Columns of the other output type are NaN. Files which do not follow the naming convention are skipped.
+    """
+    frames = []
+    for file in sorted(subdir.glob("*.json")):
+        if (info := db.parse_dataset_file_name(file.stem)) is None:
+            continue
+        dataset = db.load_dict_from_json_file(file.stem, subdir)
+        frame = pd.DataFrame(db.flatten_dataset(dataset, info["eval_type"]))
+        for column in FILE_COLUMNS:
+            frame[column] = info[column]
+        frames.append(frame)
+    frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=ANALYTICS_COLUMNS)
+    frame = frame.reindex(columns=ANALYTICS_COLUMNS)
+    for column in FILE_COLUMNS + ["metric"]:
+        frame[column] = frame[column].astype("category")
+    return frame
+
+def load_analytics_frame(subdir:Path=db.test_data, use_cache:bool=True) -> pd.DataFrame:
+    """
+    The analytics frame of subdir (see `build_analytics_frame`), which is cached in `db.analytics_cache_file`.
+    The cache is rebuilt, once a dataset file in subdir is added, removed or modified.
+    """
+    key = _files_key(subdir)
+    cache_file = db.analytics_cache_file
+    if use_cache and cache_file.exists():
+        try:
+            cached_key, frame = pd.read_pickle(cache_file)
+            if cached_key == key:
+                return frame
+        except Exception:
+            # an unreadable cache, e.g. of another pandas version, is rebuilt
+            pass
+    frame = build_analytics_frame(subdir)
+    if use_cache:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        pd.to_pickle((key, frame), cache_file)
+    return frame
+
+def select_outputs(
+    frame:pd.DataFrame, eval_type:db.EVAL_TYPE, datasets:List[db.TEST_DATA],
+    eval_approaches:List[db.EVAL_APPROACH], evaluators:List[db.EVALUATOR], judge_approach:db.EVAL_APPROACH="iterative"
+) -> pd.DataFrame:
+    """
+    The rows of the given output type, datasets, approaches and evaluators, ordered by evaluator, approach and dataset
+    as given in the lists (see `order_outputs`) and by the order of the rows in their files.
+    """
+    selection = frame[
+        (frame["eval_type"] == eval_type)
+        & frame["dataset"].isin(datasets)
+        & frame["eval_approach"].isin(eval_approaches)
+        & frame["evaluator"].isin(evaluators)
+    ]
+    if eval_type == "judgements":
+        selection = selection[selection["judge_approach"] == judge_approach]
+    return order_outputs(selection, datasets, eval_approaches, evaluators)
+
+def order_outputs(
+    outputs:pd.DataFrame, datasets:List[db.TEST_DATA], eval_approaches:List[db.EVAL_APPROACH], evaluators:List[db.EVALUATOR]
+) -> pd.DataFrame:
+    """Stable sort of the rows by evaluator, approach and dataset as given in the lists."""
+    order = {
+        "evaluator": list(dict.fromkeys(evaluators)),
+        "eval_approach": list(dict.fromkeys(eval_approaches)),
+        "dataset": list(dict.fromkeys(datasets))
+    }
+    return outputs.sort_values(
+        list(order), kind="stable", key=lambda column: column.astype(str).map({v: i for i, v in enumerate(order[column.name])})
+    )
+
+def per_requirement(outputs:pd.DataFrame) -> pd.DataFrame:
+    """One row per output, for the columns which are equal for all metrics, e.g. `overall_rating`."""
+    return outputs.drop_duplicates(FILE_COLUMNS + ["requirement_idx"])
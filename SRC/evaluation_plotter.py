@@ -7,12 +7,81 @@ from database_management.db_manager import Metrics as M
 import matplotlib.pyplot as plt
 from matplotlib.axes import Axes
 import seaborn as sns
-from typing import Literal, List, get_args, Dict, Optional, Union, Tuple
+from typing import Literal, List, get_args, Dict, Union, Tuple
 import numpy as np
+import pandas as pd
+import evaluation_analytics as ea
 
 EVAL_TYPE = Literal["successive", "iterative"]
 PLOT_METRIC = Literal[M._single, "Overall", "Worst Metric", "Overall Difference", "Metric Difference", "Proposed Requirement"]
 
+def get_rating_distributions(
+    frame:pd.DataFrame, datasets: List[db.TEST_DATA], eval_approaches: List[db.EVAL_APPROACH], evaluators: List[db.EVALUATOR],
+    plot_metrics: PLOT_METRIC = M.all, difference_to: Tuple[db.EVAL_APPROACH, db.EVALUATOR] = ("successive", "human"),
+    merge_datasets: bool = False
+) -> Dict[PLOT_METRIC, Dict[str, List[Union[int, float]]]]:
+    """
+    The ratings of each plot metric and label (approach/dataset/evaluator) of `plot_evaluation_rating_distribution`,
+    computed with groupbys and joins on the analytics frame (see `evaluation_analytics`).
+    Combinations without the reference evaluations of the differences or without judgements of the proposed requirements are skipped.
+    """
+    keys = ["evaluator", "eval_approach", "dataset"]
+    evaluations = ea.select_outputs(frame, "evaluations", datasets, eval_approaches, evaluators)
+    values:List[pd.DataFrame] = []
+    def add_values(plot_metric:PLOT_METRIC, rows:pd.DataFrame, column:str):
+        values.append(rows[keys].astype(str).assign(plot_metric=plot_metric, value=rows[column].to_numpy()))
+
+    for metric in set(plot_metrics).intersection(M.all):
+        add_values(metric, evaluations[evaluations["metric"] == metric], "rating")
+    per_requirement = ea.per_requirement(evaluations)
+    if "Overall" in plot_metrics:
+        add_values("Overall", per_requirement, "overall_rating")
+    if "Worst Metric" in plot_metrics:
+        worst = evaluations.groupby(keys + ["requirement_idx"], observed=True, sort=False)["rating"].min().reset_index()
+        add_values("Worst Metric", worst, "rating")
+    if set(["Overall Difference", "Metric Difference"]) & set(plot_metrics):
+        ref_approach, ref_evaluator = difference_to
+        references = ea.select_outputs(frame, "evaluations", datasets, [ref_approach], [ref_evaluator])
+        evaluations = evaluations[evaluations["dataset"].isin(references["dataset"].unique())]
+        if "Overall Difference" in plot_metrics:
+            differences = ea.per_requirement(evaluations).merge(
+                ea.per_requirement(references)[["dataset", "requirement_idx", "overall_rating"]], 
+                on=["dataset", "requirement_idx"], suffixes=("", "_ref"), sort=False
+            )
+            differences["difference"] = (differences["overall_rating"] - differences["overall_rating_ref"]).abs()
+            add_values("Overall Difference", differences, "difference")
+        if "Metric Difference" in plot_metrics:
+            differences = evaluations.merge(
+                references[["dataset", "requirement_idx", "metric", "rating"]], 
+                on=["dataset", "requirement_idx", "metric"], suffixes=("", "_ref"), sort=False
+            )
+            differences["difference"] = (differences["rating"] - differences["rating_ref"]).abs()
+            # metric by metric as in `M.all`
+            differences = differences.sort_values(
+                "metric", kind="stable", key=lambda metric: metric.astype(str).map({m: i for i, m in enumerate(M.all)})
+            )
+            add_values("Metric Difference", differences, "difference")
+    available = evaluations[keys].astype(str).drop_duplicates()
+    if "Proposed Requirement" in plot_metrics:
+        judgements = ea.per_requirement(ea.select_outputs(frame, "judgements", datasets, eval_approaches, evaluators))
+        add_values("Proposed Requirement", judgements, "overall_alignment_with_metrics")
+        available = available.merge(judgements[keys].astype(str).drop_duplicates())
+    if not values:
+        return {}
+
+    values = ea.order_outputs(pd.concat(values, ignore_index=True).merge(available), datasets, eval_approaches, evaluators)
+    approaches = values["eval_approach"].astype(str).str[:4]
+    labels = approaches if merge_datasets else approaches + "/" + values["dataset"].astype(str).str[:-13]
+    values["label"] = labels + "/" + values["evaluator"].astype(str)
+    if not merge_datasets:
+        # combinations with the same label (e.g. "iter" of both iterative approaches) replace each other as before
+        combinations = values.groupby(keys, sort=False).ngroup()
+        values = values[combinations == combinations.groupby(values["label"]).transform("max")]
+    ratings:Dict[PLOT_METRIC, Dict[str, List[Union[int, float]]]] = {}
+    for (plot_metric, label), group in values.groupby(["plot_metric", "label"], sort=False):
+        ratings.setdefault(plot_metric, {})[label] = group["value"].tolist()
+    return ratings
+
 def plot_evaluation_rating_distribution(
     datasets: List[db.TEST_DATA], eval_approaches: List[db.EVAL_APPROACH], evaluators: List[db.EVALUATOR],
     plot_metrics: PLOT_METRIC = M.all, difference_to: Tuple[db.EVAL_APPROACH, db.EVALUATOR] = ("successive", "human"),
@@ -30,46 +99,6 @@ def plot_evaluation_rating_distribution(
         merge_datasets (bool, optional): Whether to merge the different datasets in the plot. Defaults to False.
         cut_to_equal_length (int, optional): Cut ratings to specific equal length . If 0, no cutting is applied. If -1, cut to the minimum length. Defaults to 0.
     """
-    def get_ratings_of_dataset(
-        dataset:db.TEST_DATA, eval_approach:db.EVAL_APPROACH, evaluator:db.EVALUATOR
-    ) -> Optional[Dict[PLOT_METRIC, List[int]]]:
-        file_name = db.get_dataset_file_name(dataset, evaluator, "evaluations", eval_approach)
-        if not (eval_dict := db.load_dict_from_json_file(file_name, db.test_data)):
-            return None
-        evaluations:List[Dict[str, Union[dict, any]]] = eval_dict["evaluations"]
-        rating_dict:Dict[PLOT_METRIC, List[int]] = {
-            metric: [d["rating"] for e in evaluations for m, d in e["evaluation"].items() if m == metric] 
-            for metric in list(set(plot_metrics).intersection(M.all))
-        }
-        if "Overall" in plot_metrics:
-            rating_dict["Overall"] = [e["overall_rating"] for e in evaluations]
-        if "Worst Metric" in plot_metrics:
-            rating_dict["Worst Metric"] = [min([d["rating"] for d in e["evaluation"].values()]) for e in evaluations]
-        if set(["Overall Difference", "Metric Difference"]) & set(plot_metrics):
-            ref_approach, ref_evaluator = difference_to
-            ref_eval_file = db.get_dataset_file_name(dataset, ref_evaluator, "evaluations", ref_approach)
-            if not (ref_eval_dict := db.load_dict_from_json_file(ref_eval_file, db.test_data)):
-                return None
-            ref_evals = ref_eval_dict["evaluations"]
-            if "Overall Difference" in plot_metrics:
-                rating_dict["Overall Difference"] = [
-                    np.abs(ev["overall_rating"] - ref["overall_rating"]) for ev, ref in zip(evaluations, ref_evals)
-                ]
-            else: # if "Metric Difference" in plot_metrics
-                r = lambda e, m: e["evaluation"][m]["rating"]
-                rating_dict["Metric Difference"] = [
-                    np.abs(r(ev, m) - r(ref, m)) for m in M.all for ev, ref in zip(evaluations, ref_evals)
-                ]
-        if "Proposed Requirement" in plot_metrics:
-            file_name = db.get_dataset_file_name(dataset, evaluator, "judgements", eval_approach)
-            if not (judgement_dict := db.load_dict_from_json_file(file_name, db.test_data)):
-                return None
-            judgements = judgement_dict["judgements"]
-            rating_dict["Proposed Requirement"] = [
-                j["Assessment_of_proposed_requirement"]["overall_alignment_with_metrics"] for j in judgements
-            ]
-        return rating_dict
-    
     def plot_rating_distribution(ax:Axes, ratings:Dict[str, List[int]], min_val:int=1, max_val:int=5):
         data = list(ratings.values())
         print("Sum:", sum([sum(d) for d in data]))
@@ -78,18 +107,9 @@ def plot_evaluation_rating_distribution(
         ax.set_xticks(range(min_val, max_val+1))
         ax.set_ylim(0, 1)
     
-    ratings:Dict[PLOT_METRIC, Dict[str, List[int]]] = {}
-    for evaluator in evaluators:
-        for eval_approach in eval_approaches:
-            for dataset in datasets:
-                if not (d_ratings := get_ratings_of_dataset(dataset, eval_approach, evaluator)):
-                    continue
-                label = eval_approach[:4] if merge_datasets else f"{eval_approach[:4]}/{dataset[:-13]}"
-                label = f"{label}/{evaluator}"
-                for metric, d_r in d_ratings.items():
-                    if metric not in ratings:
-                        ratings[metric] = {}
-                    ratings[metric][label] = ratings[metric].get(label, []) + d_r if merge_datasets else d_r
+    ratings = get_rating_distributions(
+        ea.load_analytics_frame(), datasets, eval_approaches, evaluators, plot_metrics, difference_to, merge_datasets
+    )
     
     if (num_plots:=len(ratings)) <= 4:
         nrows, ncols = num_plots, 1
@@ -140,26 +160,14 @@ def scatter_evaluation_and_judgement_ratings(
         evaluators (List[db.EVALUATOR]): List of evaluators.
 
     """
-    def get_judgements(eval_approach:db.EVAL_APPROACH, dataset:db.TEST_DATA, evaluator:db.EVALUATOR) -> Optional[List[dict]]:
-        return db.load_dict_from_json_file(
-            file_name=db.get_dataset_file_name(dataset, evaluator, "judgements", eval_approach),
-            subdir=db.test_data
-        ).get("judgements", [])
-    
-    def get_data_points(eval_approach:db.EVAL_APPROACH, evaluator:db.EVALUATOR) -> Tuple[List[dict], np.ndarray]:
-        judgements = [j for d in datasets for j in get_judgements(eval_approach, d, evaluator)]
-        return judgements, np.array([(j["overall_requirement_rating"], j["overall_evaluation_rating"]) for j in judgements])
-    
-    for evaluator in evaluators:
-        for eval_approach in eval_approches:
-            judgements, data = get_data_points(eval_approach, evaluator)
-            if len(data) != 0:
-                label = f"{eval_approach}/{evaluator}"
-                x, y = data[:, 0], data[:, 1]
-                sns.regplot(x=x, y=y, order=2, scatter=True)
-                plt.scatter(x, y, label=label)
-                for np_func, type in zip([np.argmax, np.argmin], ["best", "worst"]):
-                    print(f"{label} {type} Evaluation: {judgements[np_func(y)]['original_requirement']}")
+    judgements = ea.per_requirement(ea.select_outputs(ea.load_analytics_frame(), "judgements", datasets, eval_approches, evaluators))
+    for (evaluator, eval_approach), data in judgements.groupby(["evaluator", "eval_approach"], observed=True, sort=False):
+        label = f"{eval_approach}/{evaluator}"
+        x, y = data["overall_requirement_rating"].to_numpy(), data["overall_evaluation_rating"].to_numpy()
+        sns.regplot(x=x, y=y, order=2, scatter=True)
+        plt.scatter(x, y, label=label)
+        for np_func, type in zip([np.argmax, np.argmin], ["best", "worst"]):
+            print(f"{label} {type} Evaluation: {data['requirement'].iloc[np_func(y)]}")
 
     plt.ylim(0, 1.1)
     plt.xlabel("Evaluation")
@@ -4,27 +4,159 @@
 
 from __future__ import annotations
 from collections.abc import Mapping
-from typing import Callable, Union, Tuple, Literal, get_origin, get_args, Optional
+from typing import Callable, Union, Tuple, Literal, get_origin, get_args, Optional, Any, TYPE_CHECKING
+from functools import lru_cache
 import json
 import database_management.string_helper as sh
 
+if TYPE_CHECKING:
+    from evaluation_wrapper.evaluation_wrapper import EvalWrapper
+
 class EvalError: 
     WRONG_REQ = "Wrong Requirement Evaluated"
     OK = "ok"
     NO_PROPOSAL = "No Proposed Requirement given"
     FORMAT_ERROR = "Wrong Format"
 
+FORMAT_VALIDATOR = Callable[[Any], Tuple[bool, Optional[str]]]
+
+# key of the output of a streamed generation, that was cancelled by a `StreamValidator`, holding its error
+STREAM_ABORT_KEY = "stream_aborted"
+
+class _FrozenFormat(tuple):
+    """Hashable (key, value) pairs of a format dummy, nested dicts are frozen as well."""
+
+def freeze_format(format_dummy:dict) -> _FrozenFormat:
+    return _FrozenFormat(
+        (key, freeze_format(value) if isinstance(value, dict) else value) 
+        for key, value in format_dummy.items()
+    )
+
+def compile_format_validator(format_dummy:dict) -> FORMAT_VALIDATOR:
+    """
+    Compiles a format dummy into a tree of closures, which checks a content dict like `Evaluation._check_format_recursive`
+    with identical results and error messages, but resolves the expected types of the dummy only once.
+    Validators are cached by the structure of the dummy, so wrappers created per call (e.g. `GeneralEval()(input)`) reuse them.
+
+    Returns:
+        FORMAT_VALIDATOR: `validate(content) -> (is_valid, error message or None)`
+    """
+    return _compile_frozen_format(freeze_format(format_dummy))
+
+@lru_cache(maxsize=None)
+def _compile_frozen_format(frozen_dummy:_FrozenFormat, sub_key:str="top_level") -> FORMAT_VALIDATOR:
+    # (key, nested validator or None, expected type(s) or None)
+    checks = []
+    for key, value in frozen_dummy:
+        if get_origin(value) is Union:
+            value = get_args(value)
+        if isinstance(value, _FrozenFormat):
+            checks.append((key, _compile_frozen_format(value, key), None))
+        else:
+            checks.append((key, None, value))
+
+    def validate(d) -> Tuple[bool, Optional[str]]:
+        if not isinstance(d, dict):
+            return False, f"Expected dict, got {type(d)} at {sub_key}"
+        for key, nested, expected in checks:
+            if key not in d:
+                return False, f"Key {key} not found at {sub_key}"
+            if nested is not None:
+                is_valid, msg = nested(d[key])
+                if not is_valid:
+                    return False, msg
+            elif not isinstance(d[key], expected):
+                return False, f"Expected {expected}, got {type(d[key])} at {key}"
+        return True, None
+    return validate
+
+@lru_cache(maxsize=None)
+def _compile_frozen_partial_format(frozen_dummy:_FrozenFormat) -> FORMAT_VALIDATOR:
+    # (key, nested validator or None, expected type(s) or None)
+    checks = []
+    for key, value in frozen_dummy:
+        if get_origin(value) is Union:
+            value = get_args(value)
+        if isinstance(value, _FrozenFormat):
+            checks.append((key, _compile_frozen_partial_format(value), None))
+        else:
+            expected = value if isinstance(value, tuple) else (value,)
+            # a partially streamed integer may still become a float, but not the other way round
+            checks.append((key, None, expected + (int,) if float in expected else expected))
+
+    def validate(d) -> Tuple[bool, Optional[str]]:
+        if not isinstance(d, dict):
+            return False, f"Expected dict, got {type(d)}"
+        for key, nested, expected in checks:
+            if key not in d:
+                continue
+            if nested is not None:
+                is_valid, msg = nested(d[key])
+                if not is_valid:
+                    return False, msg if isinstance(d[key], dict) else f"Expected dict, got {type(d[key])} at {key}"
+            elif not isinstance(d[key], expected):
+                return False, f"Expected {expected[0] if len(expected) == 1 else expected}, got {type(d[key])} at {key}"
+        return True, None
+    return validate
+
+class StreamValidator:
+    """
+    Validates the JSON text of an evaluation while it is streamed, so the generation can be cancelled 
+    as soon as it can no longer become a valid evaluation, instead of paying for the complete response.
+    Only violations which are certain for every continuation of the text are reported:
+    a response which is no JSON object, a value of a wrong type, or a `requirement` that diverges from the input requirement.
+    Missing keys are checked on the complete output as before.
+    """
+    def __init__(self, format_dummy:dict, input_requirement:Optional[str]=None):
+        from langchain_core.utils.json import parse_partial_json
+        self._parse = parse_partial_json
+        self._validate = _compile_frozen_partial_format(freeze_format(format_dummy))
+        self._input_requirement = sh.normalize_string(input_requirement) if isinstance(input_requirement, str) else None
+
+    def __call__(self, text:str) -> Optional[dict]:
+        """
+        Args:
+            text (str): The JSON text streamed so far.
+
+        Returns:
+            Optional[dict]: The error `{"type": EvalError, "info": str}` of the violation, or None if the text may still become valid.
+        """
+        text = text.lstrip()
+        if not text:
+            return None
+        if not text.startswith("{"):
+            return {"type": EvalError.FORMAT_ERROR, "info": f"Expected a JSON object, got {text[:20]!r}"}
+        try:
+            partial = self._parse(text)
+        except ValueError:
+            return None
+        if not isinstance(partial, dict):
+            return None
+        is_valid, info = self._validate(partial)
+        if not is_valid:
+            return {"type": EvalError.FORMAT_ERROR, "info": info}
+        if self._input_requirement is not None and isinstance(requirement := partial.get("requirement"), str):
+            requirement = sh.normalize_string(requirement)
+            # the requirement is complete, once a further key follows
+            is_complete = next(reversed(partial)) != "requirement"
+            if requirement != self._input_requirement if is_complete else not self._input_requirement.startswith(requirement):
+                return {"type": EvalError.WRONG_REQ, "info": f"Evaluated requirement diverges: {partial['requirement']}"}
+        return None
 
 class Evaluation(Mapping):
     """
     Wrapper class to handle and validate requirement evaluations based on a desired format schema and parsing functions.
     The class behaves like a dictionary with additional features to validate and parse the evaluation content. 
+    It only holds the content, the input requirement and a reference to its `EvalWrapper` in slots, 
+    and validates the content on the first access of its error, so large result sets stay small and fast to wrap.
+    For whole datasets see `EvaluationBatch`, which does not create an object per evaluation at all.
     
     Attributes
     ==========
 
         content (dict): The evaluation content to be validated.
         dict (dict): A dictionary containing the content and validation error status.
+        wrapper (EvalWrapper): The wrapper, which provides the format validator and the parsing functions:
         rating_parser (Callable[[Evaluation], Union[int, float]]): A function to parse the rating from the evaluation.
         proposed_req_parser (Callable[[Evaluation], str]): A function to parse the proposed requirement from the evaluation.
         no_proposal_condition (Callable[[Evaluation], bool]): A function to determine if there is no proposal condition.
@@ -33,7 +165,7 @@ class Evaluation(Mapping):
     ===========
         
         **_check_evaluation**
-            Validates the evaluation content based on the format dummy, input requirement, and no proposal condition.
+            Validates the evaluation content based on the format validator, input requirement, and no proposal condition.
         **is_valid**
             Checks if the evaluation is valid, meaning the format is correct and the input requirement equals to the evaluated requirement.
         **is_complete**
@@ -43,24 +175,43 @@ class Evaluation(Mapping):
         **get_proposed_requirement**
             Gets the proposed requirement if the evaluation is complete or valid.
     """
-    def __init__(
-        self, content:dict, input_requirement:Optional[str], format_dummy:dict,
-        rating_parser:Callable[[Evaluation], Union[int, float]],
-        proposed_req_parser:Callable[[Evaluation], str],
-        no_proposal_condition:Callable[[Evaluation], bool]
-    ):
+    __slots__ = ("content", "wrapper", "_input_requirement", "_error", "_extra")
+
+    def __init__(self, content:dict, input_requirement:Optional[str], wrapper:EvalWrapper):
         self.content:dict = content
-        self.dict = {
-            "message": content, 
-            "error": self._check_evaluation(
-                format_dummy, input_requirement, no_proposal_condition
+        self.wrapper = wrapper
+        self._input_requirement = input_requirement
+        # validated on first access, see `error`
+        self._error:Optional[dict] = None
+        # further keys set by `__setitem__`
+        self._extra:Optional[dict] = None
+
+    @property
+    def rating_parser(self) -> Callable[[Evaluation], Union[int, float]]:
+        return self.wrapper._rating_parser
+
+    @property
+    def proposed_req_parser(self) -> Callable[[Evaluation], str]:
+        return self.wrapper._proposed_req_parser
+
+    @property
+    def no_proposal_condition(self) -> Callable[[Evaluation], bool]:
+        return self.wrapper._no_proposal_condition
+
+    @property
+    def error(self) -> dict:
+        if self._error is None:
+            self._error = self._check_evaluation(
+                self.wrapper.format_validator, self._input_requirement, self.wrapper._no_proposal_condition
             )
-        }
-        self.rating_parser = rating_parser
-        self.proposed_req_parser = proposed_req_parser
-        
-        
+        return self._error
+
+    @property
+    def dict(self) -> dict:
+        return {"message": self.content, "error": self.error, **(self._extra or {})}
+
     def _check_format_recursive(self, d:dict, dummy:dict, sub_key:str="top_level") -> Tuple[bool, Union[str, None]]:
+        """Interpreting reference implementation of the compiled format validators, see `compile_format_validator`."""
         if not isinstance(d, dict):
             return False, f"Expected dict, got {type(d)} at {sub_key}"
         for key, value in dummy.items():
@@ -77,11 +228,15 @@ class Evaluation(Mapping):
         return True, None
     
     def _check_evaluation(
-        self, format_dummy:dict,
+        self, format_dummy:Union[dict, FORMAT_VALIDATOR],
         input_requirement:Optional[str],
         no_proposal_condition:Callable[[Evaluation], bool]
     ) -> str:
-        format_is_valid, info = self._check_format_recursive(self.content, format_dummy)
+        if isinstance(self.content, dict) and isinstance(abort := self.content.get(STREAM_ABORT_KEY), dict):
+            # the generation was cancelled while streaming, see `StreamValidator`
+            return abort
+        validate_format = format_dummy if callable(format_dummy) else compile_format_validator(format_dummy)
+        format_is_valid, info = validate_format(self.content)
         if not format_is_valid:
             error = EvalError.FORMAT_ERROR
         elif input_requirement and (sh.normalize_string(input_requirement) != sh.normalize_string(self.get("requirement"))):
@@ -93,10 +248,10 @@ class Evaluation(Mapping):
         return {"type": error, "info": info}
     
     def is_valid(self):
-        return self["error"]["type"] in [EvalError.OK, EvalError.NO_PROPOSAL]
+        return self.error["type"] in [EvalError.OK, EvalError.NO_PROPOSAL]
     
     def is_complete(self) -> bool:
-        return self["error"]["type"] == EvalError.OK
+        return self.error["type"] == EvalError.OK
 
     def parse_rating(self):
         if not self.is_valid():
@@ -111,22 +266,34 @@ class Evaluation(Mapping):
         return None
         
     def __getitem__(self, key):
-        try:
-            return self.dict[key]
-        except (KeyError, AttributeError):
-            return self.content[key]
+        if key == "error":
+            return self.error
+        if key == "message":
+            return self.content
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        return self.content[key]
     
     def __setitem__(self, key, value):
-        self.dict[key] = value
+        if key == "error":
+            self._error = value
+        elif key == "message":
+            self.content = value
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
 
     def __delitem__(self, key):
-        del self.dict[key]
+        if self._extra is None or key not in self._extra:
+            raise KeyError(key)
+        del self._extra[key]
 
     def __iter__(self):
         return iter(self.dict)
 
     def __len__(self):
-        return len(self.dict)
+        return 2 + len(self._extra or {})
 
     def __str__(self):
         return json.dumps(self.dict, indent=4)
@@ -0,0 +1,180 @@
+# MIT License
+# Copyright (c) 2025 Benedikt Horn, Sascha Tauchmann
+# See the LICENSE file for more details.
+
+from __future__ import annotations
+from evaluation_wrapper.evaluation import Evaluation, EvalError
+from evaluation_wrapper.evaluation_wrapper import EvalWrapper
+import database_management.string_helper as sh
+from typing import List, Dict, Optional, Union, Sequence, Iterable
+import numpy as np
+
+ERROR_TYPES = [EvalError.OK, EvalError.NO_PROPOSAL, EvalError.WRONG_REQ, EvalError.FORMAT_ERROR]
+OK, NO_PROPOSAL, WRONG_REQ, FORMAT_ERROR = range(len(ERROR_TYPES))
+
+class StringTable:
+    """Deduplicated strings, which are referenced by integer codes. The code -1 stands for None."""
+    def __init__(self):
+        self.strings:List[str] = []
+        self._codes:Dict[str, int] = {}
+
+    def encode(self, string:Optional[str]) -> int:
+        if not isinstance(string, str):
+            return -1
+        if (code := self._codes.get(string)) is None:
+            code = self._codes[string] = len(self.strings)
+            self.strings.append(string)
+        return code
+
+    def decode(self, codes:Iterable[int]) -> List[Optional[str]]:
+        return [self.strings[code] if code >= 0 else None for code in codes]
+
+    def __len__(self):
+        return len(self.strings)
+
+class EvaluationBatch:
+    """
+    Array backed container of the evaluations (or judgements) of a whole dataset.
+    The ratings are stored in one NumPy matrix and the texts as codes of a shared `StringTable`,
+    so bulk operations run over the arrays without creating an `Evaluation` per item.
+    Single items are wrapped into an `Evaluation` on demand.
+
+    Attributes
+    ==========
+
+        contents (List[dict]): The raw evaluation contents.
+        wrapper (EvalWrapper): The wrapper of the evaluations, which provides the format validator.
+        metrics (List[str]): The metric keys of the rating columns.
+        ratings (np.ndarray): (n_evaluations, n_metrics) ratings, NaN if missing or invalid.
+        valid (np.ndarray): Whether each evaluation is valid, see `Evaluation.is_valid`.
+        error_types (np.ndarray): The index of the error type of each evaluation in `ERROR_TYPES`.
+        texts (StringTable): The requirements and proposed requirements.
+        requirement_codes (np.ndarray): The code of the requirement of each evaluation in `texts`.
+        proposal_codes (np.ndarray): The code of the proposed requirement of each evaluation in `texts`.
+
+    Key Methods
+    ===========
+
+        **from_contents**
+            Validates the contents and builds the arrays.
+        **select**
+            A batch of a subset of the evaluations, which shares the string table.
+        **parse_ratings**
+            Computes the overall ratings of all valid evaluations at once and writes them into the contents.
+        **metric_means** / **below_threshold**
+            Bulk statistics over the rating matrix.
+    """
+    def __init__(
+        self, contents:List[dict], wrapper:EvalWrapper, metrics:List[str], ratings:np.ndarray, error_types:np.ndarray,
+        texts:StringTable, requirement_codes:np.ndarray, proposal_codes:np.ndarray
+    ):
+        self.contents = contents
+        self.wrapper = wrapper
+        self.metrics = metrics
+        self.ratings = ratings
+        self.error_types = error_types
+        self.valid = error_types <= NO_PROPOSAL
+        self.texts = texts
+        self.requirement_codes = requirement_codes
+        self.proposal_codes = proposal_codes
+
+    @classmethod
+    def from_contents(
+        cls, contents:List[dict], wrapper:EvalWrapper, metrics:Optional[List[str]]=None,
+        input_requirements:Optional[Sequence[str]]=None, rating_key:str="rating"
+    ) -> EvaluationBatch:
+        """
+        Args:
+            contents (List[dict]): The evaluation contents, e.g. of a dataset file.
+            wrapper (EvalWrapper): The wrapper, whose format validator and proposal condition are applied to the raw contents.
+            metrics (List[str], optional): The metric keys in `content["evaluation"]`.
+                Defaults to the metrics of the format dummy of the wrapper.
+            input_requirements (Sequence[str], optional): The evaluated requirement of each content,
+                which marks evaluations of another requirement as invalid. Defaults to None.
+            rating_key (str, optional): The key of the rating of a metric. Defaults to "rating".
+        """
+        if metrics is None:
+            metrics = list(evaluation) if isinstance(evaluation := wrapper.format_dummy.get("evaluation"), dict) else []
+        requirement_key = next((key for key in ["requirement", "original_requirement"] if key in wrapper.format_dummy), None)
+        texts = StringTable()
+        n = len(contents)
+        nan_row = [np.nan] * len(metrics)
+        rows:List[List[float]] = [nan_row] * n
+        error_types = [FORMAT_ERROR] * n
+        requirement_codes = [-1] * n
+        proposal_codes = [-1] * n
+        validate_format = wrapper.format_validator
+        no_proposal_condition = wrapper._no_proposal_condition
+        for i, content in enumerate(contents):
+            if not validate_format(content)[0]:
+                continue
+            requirement = content.get(requirement_key) if requirement_key else None
+            requirement_codes[i] = texts.encode(requirement)
+            if input_requirements is not None and input_requirements[i] and (
+                sh.normalize_string(input_requirements[i]) != sh.normalize_string(requirement)
+            ):
+                error_types[i] = WRONG_REQ
+                continue
+            # the parsers of the wrappers only use the item access of the evaluation, which the raw content provides as well
+            if no_proposal_condition(content):
+                error_types[i] = NO_PROPOSAL
+            else:
+                error_types[i] = OK
+                proposal_codes[i] = texts.encode(wrapper._proposed_req_parser(content))
+            evaluation = content.get("evaluation", {})
+            try:
+                rows[i] = [evaluation[m][rating_key] for m in metrics]
+            except (KeyError, TypeError, AttributeError):
+                rows[i] = [_rating(evaluation.get(m), rating_key) for m in metrics]
+        ratings = np.array(rows, dtype=float).reshape(n, len(metrics))
+        error_types = np.array(error_types, dtype=np.int8)
+        requirement_codes = np.array(requirement_codes, dtype=np.int32)
+        proposal_codes = np.array(proposal_codes, dtype=np.int32)
+        return cls(contents, wrapper, metrics, ratings, error_types, texts, requirement_codes, proposal_codes)
+
+    def __len__(self):
+        return len(self.contents)
+
+    def __getitem__(self, idx:int) -> Evaluation:
+        return self.wrapper(self.contents[idx])
+
+    @property
+    def requirements(self) -> List[Optional[str]]:
+        return self.texts.decode(self.requirement_codes)
+
+    @property
+    def proposed_requirements(self) -> List[Optional[str]]:
+        return self.texts.decode(self.proposal_codes)
+
+    def select(self, indices:Union[np.ndarray, Sequence[int]]) -> EvaluationBatch:
+        """A batch of the evaluations at the given indices or boolean mask, e.g. `batch.select(batch.valid)`."""
+        indices = np.flatnonzero(indices) if np.asarray(indices).dtype == bool else np.asarray(indices, dtype=np.intp)
+        return EvaluationBatch(
+            [self.contents[i] for i in indices], self.wrapper, self.metrics, self.ratings[indices],
+            self.error_types[indices], self.texts, self.requirement_codes[indices], self.proposal_codes[indices]
+        )
+
+    def parse_ratings(self) -> np.ndarray:
+        """
+        Vectorized `Evaluation.parse_rating` of all evaluations, see the `_batch_rating_parser` of the wrapper.
+        Like the single evaluation parsers, the overall ratings and thresholds are written into the contents.
+
+        Returns:
+            np.ndarray: The rating of each evaluation, NaN if invalid.
+        """
+        return self.wrapper._batch_rating_parser(self)
+
+    def metric_means(self) -> Dict[str, float]:
+        """The mean rating of each metric over the valid evaluations."""
+        ratings = self.ratings[self.valid]
+        counts = np.sum(~np.isnan(ratings), axis=0)
+        sums = np.nansum(ratings, axis=0)
+        return {m: float(s / c) if c else float("nan") for m, s, c in zip(self.metrics, sums, counts)}
+
+    def below_threshold(self, thresholds:Dict[str, float]) -> np.ndarray:
+        """(n_evaluations, n_metrics) mask of the ratings below the threshold of their metric, e.g. `Metrics.offsets`."""
+        return self.ratings < np.array([thresholds.get(m, np.nan) for m in self.metrics])
+
+def _rating(metric_evaluation:Optional[dict], rating_key:str) -> float:
+    rating = metric_evaluation.get(rating_key) if isinstance(metric_evaluation, dict) else None
+    return rating if isinstance(rating, (int, float)) else np.nan
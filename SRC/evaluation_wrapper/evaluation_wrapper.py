@@ -2,11 +2,20 @@
 # Copyright (c) 2025 Benedikt Horn, Sascha Tauchmann
 # See the LICENSE file for more details.
 
-from evaluation_wrapper.evaluation import Evaluation
+from __future__ import annotations
+from evaluation_wrapper.evaluation import Evaluation, StreamValidator, compile_format_validator, freeze_format
 from abc import abstractmethod
-from typing import Union, Optional, get_args, Callable
+from typing import Union, Optional, get_args, Callable, Dict, Hashable, Any, TYPE_CHECKING
+from threading import Lock
 from database_management.db_manager import Metrics as M
-from pydantic import create_model
+
+if TYPE_CHECKING:
+    from evaluation_wrapper.evaluation_batch import EvaluationBatch
+
+# generated schema models and their JSON schemas, keyed by the wrapper configuration, see `EvalWrapper.schema`
+_schemas:Dict[Hashable, type] = {}
+_json_schemas:Dict[Hashable, Dict[str, Any]] = {}
+_schema_lock = Lock()
 
 class EvalWrapper:
     """
@@ -19,15 +28,24 @@ class EvalWrapper:
             A dictionary defining the desired format (keys and value types)
         limit_schema_layers (int, optional): 
             The maximum number of nested layers to be considered in an auto-generated schema model.
+        format_validator (FORMAT_VALIDATOR):
+            The format dummy compiled once into a validator, which is shared by all wrapped Evaluations.
     
     Key Methods
     ===========
         **__call__**
             Wrapps and parses the given content into an Evaluation object.
+        **stream_validator**
+            Creates a validator of the streamed JSON text of an evaluation, which detects violations before the generation is complete.
         **schema**
-            Generates a schema model based on the format_dummy attribute.
+            Generates a schema model based on the format_dummy attribute, once per wrapper configuration and process.
+        **json_schema**
+            The JSON schema of the schema model, e.g. for tool calling.
         **_rating_parser**
             Abstract method to parse and extract the rating from the evaluation. Must be implemented by subclasses.
+        **_batch_rating_parser**
+            Parses the ratings of all valid evaluations of an `EvaluationBatch` at once. 
+            Subclasses may override it with a vectorized implementation.
         **_proposed_req_parser**
             If exists, extracts the proposed requirement from the evaluation.
         **_no_proposal_condition**
@@ -36,18 +54,46 @@ class EvalWrapper:
     def __init__(self, format_dummy:dict, limit_schema_layers:int=None):
         self.format_dummy = format_dummy
         self.limit_schema_layers = limit_schema_layers
+        self.format_validator = compile_format_validator(format_dummy)
+        self._frozen_schema_key:Optional[Hashable] = None
 
     def __call__(self, content:dict, input_requirement:Optional[str]=None, parse_rating_on_init:bool=False) -> Evaluation:
-        eval = Evaluation(
-            content, input_requirement, self.format_dummy, 
-            self._rating_parser, self._proposed_req_parser, self._no_proposal_condition
-        )
+        eval = Evaluation(content, input_requirement, self)
         if parse_rating_on_init:
             eval.parse_rating()
         return eval
     
+    def stream_validator(self, input_requirement:Optional[str]=None) -> StreamValidator:
+        return StreamValidator(self.format_dummy, input_requirement)
+
+    @property
+    def _schema_key(self) -> Hashable:
+        if self._frozen_schema_key is None:
+            self._frozen_schema_key = (freeze_format(self.format_dummy), self.limit_schema_layers, self.__doc__)
+        return self._frozen_schema_key
+
     @property
     def schema(self):
+        """
+        The pydantic model of the format dummy. Wrappers with the same format, layer limit and docstring share the same model class,
+        so it is created once per process and can be used for identity based caching, e.g. by `LLM.update_schema`.
+        """
+        key = self._schema_key
+        if (schema := _schemas.get(key)) is None:
+            with _schema_lock:
+                if (schema := _schemas.get(key)) is None:
+                    schema = _schemas[key] = self._create_schema()
+        return schema
+
+    @property
+    def json_schema(self) -> Dict[str, Any]:
+        key = self._schema_key
+        if (json_schema := _json_schemas.get(key)) is None:
+            json_schema = _json_schemas.setdefault(key, self.schema.model_json_schema())
+        return json_schema
+
+    def _create_schema(self):
+        from pydantic import create_model
         def create_model_from_dict(d:dict, name:str="EvaluationSchema", doc:str=None, layer:int=1):
             field_definitions = {}
             for k, v in d.items():
@@ -69,6 +115,11 @@ class EvalWrapper:
     @abstractmethod
     def _rating_parser(self, eval:Evaluation) -> Union[float, int]:
         raise NotImplementedError("Rating parser not implemented")
+
+    def _batch_rating_parser(self, batch:EvaluationBatch):
+        import numpy as np
+        ratings = [self(content).parse_rating() if valid else None for content, valid in zip(batch.contents, batch.valid)]
+        return np.array([np.nan if rating is None else rating for rating in ratings], dtype=float)
     
     def _proposed_req_parser(self, eval:Evaluation) -> str:
         return eval.get("proposed_requirement", "no proposal")
@@ -79,6 +130,10 @@ class EvalWrapper:
 
 class GeneralEval(EvalWrapper):
     """justified requirement evaluation based on different metrics"""
+    # normalization of the cumulative rating of all metrics relative to their acceptable ratings
+    max_rating, min_rating = [sum(i - mo for mo in M.offsets.values()) for i in [5, 1]]
+    overall_rating_threshold = (0 - min_rating) / (max_rating - min_rating)
+
     def __init__(self, metrics:M._list=M.all):
         format_dummy = {
             "requirement": str,
@@ -96,18 +151,32 @@ class GeneralEval(EvalWrapper):
         super().__init__(format_dummy)
 
     def _rating_parser(self, eval:Evaluation):
-           
-        max_rating, min_rating = [sum(i - mo for mo in M.offsets.values()) for i in [5, 1]]
-
         cumulative_rating = 0
         for m, d in eval.content["evaluation"].items():
             d["rating_threshold"] = M.offsets[m]
             cumulative_rating += d["rating"] - M.offsets[m]
 
         # Normalize the cumulative rating to the scale [0, 1]
-        eval.content["overall_rating"] = (cumulative_rating - min_rating) / (max_rating - min_rating)
-        eval.content["overall_rating_threshold"] = (0 - min_rating) / (max_rating - min_rating) 
+        eval.content["overall_rating"] = (cumulative_rating - self.min_rating) / (self.max_rating - self.min_rating)
+        eval.content["overall_rating_threshold"] = self.overall_rating_threshold
         return eval.content["overall_rating"]
+
+    def _batch_rating_parser(self, batch:EvaluationBatch):
+        import numpy as np
+        offsets = np.array([M.offsets[m] for m in batch.metrics], dtype=float)
+        overall_ratings = (np.sum(batch.ratings - offsets, axis=1) - self.min_rating) / (self.max_rating - self.min_rating)
+        overall_ratings[~batch.valid] = np.nan
+        for i in np.flatnonzero(batch.valid).tolist():
+            content = batch.contents[i]
+            if len(content["evaluation"]) != len(batch.metrics):
+                # further metrics than those of the format are rated as well
+                overall_ratings[i] = self._rating_parser(self(content))
+                continue
+            for m, d in content["evaluation"].items():
+                d["rating_threshold"] = M.offsets[m]
+            content["overall_rating"] = float(overall_ratings[i])
+            content["overall_rating_threshold"] = self.overall_rating_threshold
+        return overall_ratings
     
     def _proposed_req_parser(self, eval:Evaluation) -> str:
         return eval["proposed_requirement"]["text"]
@@ -168,6 +237,19 @@ class GeneralJudgement(EvalWrapper):
         normalized_rating = (overall_rating - 1) / (max_rating - 1)
         eval.content["overall_evaluation_rating"] = normalized_rating
         return normalized_rating
+
+    def _batch_rating_parser(self, batch:EvaluationBatch):
+        import numpy as np
+        max_rating = 5
+        normalized_ratings = (np.mean(batch.ratings, axis=1) - 1) / (max_rating - 1)
+        normalized_ratings[~batch.valid] = np.nan
+        for i in np.flatnonzero(batch.valid).tolist():
+            content = batch.contents[i]
+            if len(content["evaluation"]) != len(batch.metrics):
+                normalized_ratings[i] = self._rating_parser(self(content))
+                continue
+            content["overall_evaluation_rating"] = float(normalized_ratings[i])
+        return normalized_ratings
     
     def _no_proposal_condition(self, eval:Evaluation):
         return False
@@ -187,6 +269,18 @@ class MetricJudgement(EvalWrapper):
         rating = 0.6 * eval["accuracy_of_rating"] + 0.4 * eval["quality_of_justification"]
         eval.content["rating"] = rating
         return rating
+
+    def _batch_rating_parser(self, batch:EvaluationBatch):
+        import numpy as np
+        valid = np.flatnonzero(batch.valid).tolist()
+        scores = np.array(
+            [(batch.contents[i]["accuracy_of_rating"], batch.contents[i]["quality_of_justification"]) for i in valid], dtype=float
+        ).reshape(-1, 2)
+        ratings = np.full(len(batch), np.nan)
+        ratings[valid] = scores @ np.array([0.6, 0.4])
+        for i, rating in zip(valid, ratings[valid].tolist()):
+            batch.contents[i]["rating"] = rating
+        return ratings
     
     def _no_proposal_condition(self, eval:Evaluation):
         return False
@@ -0,0 +1,78 @@
+# MIT License
+# Copyright (c) 2025 Benedikt Horn, Sascha Tauchmann
+# See the LICENSE file for more details.
+
+import subprocess
+import sys
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+SRC = Path(__file__).parent
+
+# modules, which must only be imported by the features that need them
+HEAVY_MODULES = [
+    "torch", "ragatouille", "chromadb", "langchain_chroma", "langchain_huggingface", "sentence_transformers",
+    "streamlit", "groq", "langchain_groq", "anthropic", "langchain_anthropic",
+    "pandas", "pyarrow", "scipy", "matplotlib", "seaborn"
+]
+
+# cold import time budget in seconds of each entry point
+IMPORT_BUDGETS:Dict[str, float] = {
+    "main": 1.0,
+    "response_generation": 1.0,
+    "dataset_evalation": 0.5,
+}
+
+def measure_import(module:str) -> Tuple[float, List[Tuple[str, float]]]:
+    """
+    Imports a module in a fresh interpreter with `-X importtime`.
+
+    Args:
+        module (str): The module to import, relative to the SRC directory.
+
+    Returns:
+        (float, List[(str, float)]): (cumulative import time of the module in seconds, [(imported module, self time in seconds)])
+    """
+    env = {**os.environ, "PYTHONPATH": str(SRC)}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env, cwd=SRC.parent
+    )
+    if result.returncode != 0:
+        raise ImportError(f"Could not import {module}:\n{result.stderr.splitlines()[-1]}")
+    total = 0.0
+    imports:List[Tuple[str, float]] = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        imports.append((name.strip(), int(self_us) / 1e6))
+        if name.strip() == module:
+            total = int(cumulative_us) / 1e6
+    return total, imports
+
+def import_time_report(budgets:Dict[str, float]=IMPORT_BUDGETS, n_slowest:int=5) -> bool:
+    """
+    Prints the import time and the slowest imported modules of each entry point
+    and checks them against their budget and the list of heavy modules.
+
+    Returns:
+        bool: True if no entry point exceeds its budget or imports a heavy module.
+    """
+    passed = True
+    for module, budget in budgets.items():
+        total, imports = measure_import(module)
+        heavy = sorted({name.split(".")[0] for name, _ in imports} & set(HEAVY_MODULES))
+        ok = total <= budget and not heavy
+        passed &= ok
+        print(f"{'OK' if ok else 'FAILED'} {module}: {total:.3f}s (budget {budget:.1f}s)")
+        if heavy:
+            print(f"    heavy modules imported: {', '.join(heavy)}")
+        for name, self_time in sorted(imports, key=lambda i: i[1], reverse=True)[:n_slowest]:
+            print(f"    {self_time*1e3:8.1f} ms  {name}")
+    return passed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if import_time_report() else 1)
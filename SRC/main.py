@@ -2,12 +2,10 @@
 # Copyright (c) 2025 Benedikt Horn, Sascha Tauchmann
 # See the LICENSE file for more details.
 
-import streamlit as ui
-from streamlit.runtime.scriptrunner import get_script_run_ctx
 from response_generation import init_response_generator
 from database_management import db_manager as db
 from database_management.db_manager import PromptVersions, Metrics as M
-from chatbot import chatbot
+from chatbot import chatbot, run_by_streamlit
 from dataset_evalation import evaluate_dataset
 from langsmith_tracing import enable_tracing
 from typing import Literal
@@ -23,51 +21,68 @@ def main(
 ):
     enable_tracing("LLM4RE", False)
 
-    run_with_streamlit = get_script_run_ctx() is not None and mode == "chat_bot"
+    run_with_streamlit = run_by_streamlit() and mode == "chat_bot"
 
     generate_response = None
 
     if run_with_streamlit:
+        import streamlit as ui
         if (init := ui.session_state.get("init")) is not None:
             generate_response = init["generate_response"]
+    generator_kwargs = dict(
+        llm_model=eval_model,
+        structured_output=True,
+        use_RAG=True,
+        load_retriever=False, # only applied if useRAG=True, an up-to-date index is reused anyway
+        RAG_dataset_name=db.get_dataset_file_name("average_requirements", "llama-3.1-8b-instant", "evaluations", evaluation_mode), # only applied if useRAG=True
+        RAG_backend=None, # "ragatouille", "chroma", "bm25", "dense" or "dense_ivf", defaults to the platform specific backend
+        n_shots=3, # disable few shot prompting with n_shots=0
+        use_system_message=False,
+        memory_size=0,
+        use_evaluation_chain=(evaluation_mode in ["iterative", "iterative_zero_shot"] or generate_RAG_data), 
+        metrics=M.all,
+        judge_evaluation=judge_evaluation,
+        judge_model="llama-3.3-70b-versatile", 
+        individual_judgement=(judgement_mode == "iterative"),
+        prompt_versions=PromptVersions(
+            metric_definitions=6, # refers to list index [i-1] of each metric in metric_description/metric_definitions.json
+            rating_definitions=6, # refers to list index [i-1] of each metric in metric_description/rating_definitions.json
+            static_few_shots="eval_rating_5", # refers to file name in data_base/static_few_shots/evaluator/<file>.json
+            template="successive_approach_r5", # refers to template name in prompt_templates/<template>.md
+            evaluation_chain="RAG_successive_data" # refers to callable chain in evaluation_chain/implementations.py
+        ),
+        early_abort=False # streams structured outputs and cancels them on the first format or requirement violation
+    )
     if generate_response is None:
-        generate_response = init_response_generator(
-            llm_model=eval_model,
-            structured_output=True,
-            use_RAG=True,
-            load_retriever=False, # only applied if useRAG=True
-            RAG_dataset_name=db.get_dataset_file_name("average_requirements", "llama-3.1-8b-instant", "evaluations", evaluation_mode), # only applied if useRAG=True
-            n_shots=3, # disable few shot prompting with n_shots=0
-            use_system_message=False,
-            memory_size=0,
-            use_evaluation_chain=(evaluation_mode in ["iterative", "iterative_zero_shot"] or generate_RAG_data), 
-            metrics=M.all,
-            judge_evaluation=judge_evaluation,
-            judge_model="llama-3.3-70b-versatile", 
-            individual_judgement=(judgement_mode == "iterative"),
-            prompt_versions=PromptVersions(
-                metric_definitions=6, # refers to list index [i-1] of each metric in metric_description/metric_definitions.json
-                rating_definitions=6, # refers to list index [i-1] of each metric in metric_description/rating_definitions.json
-                static_few_shots="eval_rating_5", # refers to file name in data_base/static_few_shots/evaluator/<file>.json
-                template="successive_approach_r5", # refers to template name in prompt_templates/<template>.md
-                evaluation_chain="RAG_successive_data" # refers to callable chain in evaluation_chain/implementations.py
-            )
-        )
+        generate_response = init_response_generator(**generator_kwargs)
         if run_with_streamlit:
             ui.session_state["init"] = {"generate_response": generate_response}
 
     if mode == "dataset":
+        dataset_name = "average_requirements"
+        rag = generate_response.RAG
+        # the RAG index grows with the new evaluations, if they are written to its own dataset
+        extends_RAG_dataset = rag and generate_RAG_data and not judge_evaluation and (
+            rag.dataset_name == db.get_dataset_file_name(dataset_name, eval_model, "evaluations", evaluation_mode)
+        )
         return evaluate_dataset(
             generate_response, 
             model=eval_model,
-            dataset_name="average_requirements", 
+            dataset_name=dataset_name, 
             eval_approach=evaluation_mode,
             eval_type="judgements" if judge_evaluation else "evaluations",
             judge_approach=judgement_mode,
             field_name="Requirement",
             stop_idx=10,
             database_subdir=db.RAG_data if generate_RAG_data else db.test_data,
-            rating_scale=5
+            rating_scale=5,
+            prefetch_contexts=rag.batch_retrieve if rag else None,
+            add_to_RAG=rag.add_evaluations if extends_RAG_dataset else None,
+            n_workers=1, # concurrent requirements, set db.REQUESTS_PER_SECOND to the rate limits of your account before raising it
+            evaluator_factory=lambda: init_response_generator(**generator_kwargs), # workers share the RAG instance
+            deduplication=None, # "normalized" or "canonical" evaluates duplicate requirements only once
+            cache_stats=rag.cache_stats if rag else None, # cache hit rates of the run manifest
+            repository=None # EvaluationRepository() additionally stores the run in data_base/evaluations.sqlite
         )
     
     intro = "My purpose is to evaluate requirements. Please enter a requirement in order to learn how well it is constructed."
@@ -77,7 +92,7 @@ def main(
         generate_response=generate_response, 
         intro=intro,
         input_hint=input_hint,
-        run_in_terminal=get_script_run_ctx() is None,
+        run_in_terminal=not run_by_streamlit(),
         history_length=8
     )
 
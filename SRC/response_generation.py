@@ -8,7 +8,7 @@ import database_management.db_manager as db
 from database_management.db_manager import Metrics as M, PromptVersions
 from evaluation_wrapper.evaluation_wrapper import GeneralEval, MetricEval, Evaluation, GeneralJudgement
 from evaluation_chain.implementations import evaluation_chains
-from typing import Union, Any
+from typing import Union, Any, Optional
 
 def init_response_generator(
         llm_model:db.MODEL,
@@ -25,6 +25,8 @@ def init_response_generator(
         individual_judgement:bool,
         judge_model:db.MODEL,
         prompt_versions:PromptVersions=PromptVersions(template="successive_approach_r5"),
+        RAG_backend:Optional[db.RETRIEVER_BACKEND]=None,
+        early_abort:bool=False,
 ):
     evaluation_wrapper=MetricEval() if use_evaluation_chain else GeneralEval(metrics)
     llm = LLM(llm_model, structured_output, evaluation_wrapper.schema, memory_size)
@@ -35,6 +37,7 @@ def init_response_generator(
             dataset_name=RAG_dataset_name,
             load_retriever=load_retriever,
             n_retrieved_docs=n_shots,
+            retriever_backend=RAG_backend,
         )
     else:
         RAG_kwargs = None
@@ -50,7 +53,8 @@ def init_response_generator(
         memory_size=memory_size,
         metrics=metrics,
         set_chain_on_init=not use_evaluation_chain,
-        prompt_versions=prompt_versions
+        prompt_versions=prompt_versions,
+        early_abort=early_abort
     )
     if use_evaluation_chain:
         eval_chain = evaluation_chains[prompt_versions.evaluation_chain](metrics).with_evaluator(evaluator)
@@ -62,11 +66,13 @@ def init_response_generator(
         if isinstance(response:=pre_generate_response(prompt), Evaluation) and not judge_evaluation:
             response.parse_rating()
         return response
+    # exposes the RAG instance for dataset runs, e.g. to prefetch contexts
+    generate_response.RAG = evaluator.RAG if use_RAG else None
 
     if judge_evaluation:
         judgement_wrapper=GeneralJudgement(metrics)
         judge_llm = LLM(judge_model, structured_output, judgement_wrapper.schema)
-        one_step_judge = Judge(judge_llm, judgement_wrapper, not individual_judgement, prompt_versions)
+        one_step_judge = Judge(judge_llm, judgement_wrapper, not individual_judgement, prompt_versions, early_abort)
         if individual_judgement:
             judge = evaluation_chains["judge_chain"](metrics).with_evaluator(one_step_judge)
         else:
@@ -84,7 +90,8 @@ def init_response_generator(
                 return judgement
             evaluation.parse_rating()
             return (evaluation, judgement)
-            
+        
+        generate_judgement.RAG = generate_response.RAG
         return generate_judgement
     else:
         return generate_response
@@ -0,0 +1,249 @@
+# MIT License
+# Copyright (c) 2025 Benedikt Horn, Sascha Tauchmann
+# See the LICENSE file for more details.
+
+from RAG import retriever_backends, default_retriever_backend, GetIVFRetriever
+import database_management.db_manager as db
+from typing import List, Dict, Optional, get_args
+from pathlib import Path
+from sys import platform
+import numpy as np
+import json
+import time
+import os
+
+def load_requirements(dataset:db.TEST_DATA, subdir=db.test_data, limit:Optional[int]=None) -> List[str]:
+    requirements = db.load_req_dict_from_csv_file(dataset, ["Requirement"], subdir)["Requirement"]
+    return [r for r in requirements if isinstance(r, str)][:limit]
+
+def load_evaluated_requirements(subdir=db.test_data) -> List[str]:
+    """The distinct requirements of all evaluation datasets in `subdir`, in the order of the file names."""
+    requirements:List[str] = []
+    for file in sorted(subdir.glob("*_evaluations_of_*.json")):
+        if "_judgements_of_" in file.name:
+            continue
+        requirements.extend(e["requirement"] for e in db.load_dict_from_json_file(file.stem, subdir).get("evaluations", []))
+    return list(dict.fromkeys(r for r in requirements if isinstance(r, str)))
+
+def directory_size(path:Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file()) if path.exists() else 0
+
+def retrieve_with_backend(
+    backend:db.RETRIEVER_BACKEND, documents:List[str], queries:List[str], k:int, n_single_queries:int=0
+) -> Dict[str, object]:
+    """
+    Builds an index of the given backend over the documents, reloads it with a new retriever instance 
+    and retrieves the top k documents for each query in a single batch.
+    The first query after the reload is timed separately, as it includes lazily loaded parts of the retriever,
+    e.g. the embedding model of the `dense` and `dense_ivf` backends.
+
+    Args:
+        backend (db.RETRIEVER_BACKEND): The retriever backend.
+        documents (List[str]): The texts to index.
+        queries (List[str]): The queries of the batched search.
+        k (int): The number of retrieved documents per query.
+        n_single_queries (int, optional): The number of queries, which are additionally retrieved one by one
+            after the first query to measure the latency of a single query. Defaults to 0.
+
+    Returns:
+        Dict[str, object]: The retrieved texts per query ("results") and the measured times in seconds and the index size in bytes.
+    """
+    index_name = f"benchmark_{backend}_index"
+    get_retriever = retriever_backends[backend]()
+    try:
+        start = time.perf_counter()
+        get_retriever(documents, k, index_name, load_from_index=False)
+        build_time = time.perf_counter() - start
+        index_size = directory_size(get_retriever.index_path(index_name))
+        get_retriever = retriever_backends[backend]()
+        start = time.perf_counter()
+        retriever = get_retriever(documents, k, index_name, load_from_index=True)
+        load_time = time.perf_counter() - start
+        first_query_time = None
+        if queries:
+            start = time.perf_counter()
+            retriever.invoke(queries[0])
+            first_query_time = time.perf_counter() - start
+        single_query_times = []
+        for query in queries[1:n_single_queries+1]:
+            start = time.perf_counter()
+            retriever.invoke(query)
+            single_query_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        results = get_retriever.batch_search(queries, k)
+        query_time = time.perf_counter() - start
+    finally:
+        get_retriever.remove_index(index_name)
+    return {
+        "results": [[doc.page_content for doc in docs] for docs in results],
+        "build_time": build_time,
+        "index_size": index_size,
+        "load_time": load_time,
+        "first_query_time": first_query_time,
+        "single_query_times": single_query_times,
+        "query_time": query_time
+    }
+
+def overlap_at_k(results:List[List[str]], reference:List[List[str]]) -> float:
+    """Mean share of the reference top k documents, that are also retrieved in the top k results. NaN if there is nothing to compare."""
+    overlaps = [len(set(r) & set(ref)) / len(ref) for r, ref in zip(results, reference) if ref]
+    return sum(overlaps) / len(overlaps) if overlaps else float("nan")
+
+def compare_recall(
+    backends:List[db.RETRIEVER_BACKEND]=["bm25"],
+    reference:Optional[db.RETRIEVER_BACKEND]=None,
+    k:int=3, n_queries:int=200
+):
+    """
+    Compares the retrieval results of the given backends with those of a reference backend.
+    The documents are the requirements of `RAG_data/average_requirements.csv`,
+    the queries are the requirements of `test_data/bad_requirements.csv`.
+
+    Args:
+        backends (List[db.RETRIEVER_BACKEND], optional): The backends to compare. Defaults to ["bm25"].
+        reference (db.RETRIEVER_BACKEND, optional): The reference backend. Defaults to the platform default (RAGaTouille or Chroma).
+        k (int, optional): The number of retrieved documents per query. Defaults to 3.
+        n_queries (int, optional): The number of queries. Defaults to 200.
+    """
+    reference = reference or default_retriever_backend()
+    documents = load_requirements("average_requirements", db.RAG_data)
+    queries = load_requirements("bad_requirements", db.test_data, n_queries)
+    ref = retrieve_with_backend(reference, documents, queries, k)
+    print(f"{reference} (reference): build {ref['build_time']:.2f}s, query {ref['query_time']:.2f}s")
+    for backend in backends:
+        out = retrieve_with_backend(backend, documents, queries, k)
+        print(
+            f"{backend}: build {out['build_time']:.2f}s, query {out['query_time']:.2f}s, "
+            f"recall@{k} to {reference}: {overlap_at_k(out['results'], ref['results']):.3f}"
+        )
+
+def benchmark_suite(
+    backends:Optional[List[db.RETRIEVER_BACKEND]]=None,
+    reference:Optional[db.RETRIEVER_BACKEND]=None,
+    k:int=3, n_queries:int=200, n_single_queries:int=50,
+    report_file:Optional[Path]=Path("Results", "retrieval_benchmark.json")
+) -> dict:
+    """
+    Benchmarks the retriever backends offline on the CPU and writes a JSON report.
+    The documents are the evaluated requirements of all evaluation datasets in `test_data`, 
+    the queries are the requirements of `test_data/bad_requirements.csv`.
+
+    For each backend the report contains the index build time, the index size on disk, the time to load the index
+    with a new retriever, the latency of the first query after the load, the mean, median and 95th percentile latency 
+    of the following single queries, the latency per query of a batched search and the overlap@k with the reference backend.
+    Lazily loaded models are loaded during the first query, so only the load time plus the first query latency
+    is comparable between backends as cold start time.
+    Backends, that are not installed or whose model is not cached locally, are skipped and their error is reported.
+
+    Args:
+        backends (List[db.RETRIEVER_BACKEND], optional): The backends to benchmark. Defaults to all backends.
+        reference (db.RETRIEVER_BACKEND, optional): The reference backend of the overlap@k. 
+            Defaults to the platform default (RAGaTouille or Chroma), if it is available, otherwise to the first available backend.
+        k (int, optional): The number of retrieved documents per query. Defaults to 3.
+        n_queries (int, optional): The number of queries of the batched search. Defaults to 200.
+        n_single_queries (int, optional): The number of queries, that are retrieved one by one. Defaults to 50.
+        report_file (Path, optional): The file to write the report to. Defaults to `Results/retrieval_benchmark.json`.
+
+    Returns:
+        dict: The report.
+    """
+    # no model downloads and no GPU, so that the numbers are comparable between machines
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+    backends = backends or list(get_args(db.RETRIEVER_BACKEND))
+    reference = reference or default_retriever_backend()
+    documents = load_evaluated_requirements(db.test_data)
+    queries = load_requirements("bad_requirements", db.test_data, n_queries)
+    outputs:Dict[str, Dict[str, object]] = {}
+    for backend in dict.fromkeys([reference, *backends]):
+        try:
+            outputs[backend] = retrieve_with_backend(backend, documents, queries, k, n_single_queries)
+        except Exception as e:
+            outputs[backend] = {"error": f"{type(e).__name__}: {e}"}
+        print(f"{backend}: {outputs[backend].get('error', 'done')}")
+    if "error" in outputs[reference]:
+        reference = next((b for b in backends if "error" not in outputs[b]), None)
+    report = {
+        "platform": platform,
+        "k": k,
+        "n_documents": len(documents),
+        "n_queries": len(queries),
+        "reference": reference,
+        "backends": {}
+    }
+    for backend in backends:
+        out = outputs[backend]
+        if "error" in out:
+            report["backends"][backend] = {"error": out["error"]}
+            continue
+        single_query_times = np.array(out["single_query_times"]) * 1e3
+        report["backends"][backend] = {
+            "build_time_s": out["build_time"],
+            "index_size_bytes": out["index_size"],
+            "load_time_s": out["load_time"],
+            "first_query_latency_ms": out["first_query_time"] * 1e3 if out["first_query_time"] is not None else None,
+            "single_query_latency_ms": {
+                "mean": float(single_query_times.mean()),
+                "p50": float(np.percentile(single_query_times, 50)),
+                "p95": float(np.percentile(single_query_times, 95))
+            } if len(single_query_times) else None,
+            "batched_latency_ms_per_query": out["query_time"] / len(queries) * 1e3,
+            f"overlap@{k}": overlap_at_k(out["results"], outputs[reference]["results"]) if reference else None
+        }
+    if report_file:
+        report_file.parent.mkdir(parents=True, exist_ok=True)
+        db.save_dict_to_json_file(report, report_file.stem, report_file.parent)
+    return report
+
+def compare_ann(
+    n_probes:List[int]=[1, 2, 4, 8, 16, 32],
+    n_lists:Optional[int]=None,
+    k:int=3, n_queries:int=200
+):
+    """
+    Compares the recall@k and the query latency of the IVF index (`dense_ivf`) with exact dense search for several `n_probe`.
+    The documents are the requirements of `RAG_data` and `test_data`, the queries are the requirements of `test_data/bad_requirements.csv`.
+    Documents and queries are only embedded once, so the latency excludes the embedding of the queries.
+
+    Args:
+        n_probes (List[int], optional): The numbers of probed inverted lists to compare. Defaults to [1, 2, 4, 8, 16, 32].
+        n_lists (int, optional): The number of inverted lists. Defaults to 4·sqrt(n_documents).
+        k (int, optional): The number of retrieved documents per query. Defaults to 3.
+        n_queries (int, optional): The number of queries. Defaults to 200.
+    """
+    from search_index import DenseIndex, IVFIndex
+    get_retriever = GetIVFRetriever()
+    documents = list(dict.fromkeys(
+        load_requirements("average_requirements", db.RAG_data)
+        + load_requirements("average_requirements", db.test_data)
+        + load_requirements("bad_requirements", db.test_data)
+    ))
+    queries = load_requirements("bad_requirements", db.test_data, n_queries)
+    embeddings = {
+        text: embedding for text, embedding 
+        in zip(documents + queries, DenseIndex.normalize(get_retriever.embed(documents + queries)))
+    }
+    embed = lambda texts: [embeddings[text] for text in texts]
+    document_embeddings = DenseIndex.normalize(embed(documents)).astype(get_retriever.settings["dtype"])
+    exact_index = DenseIndex(documents, document_embeddings, embed)
+    start = time.perf_counter()
+    exact = exact_index.search(queries, k)
+    exact_time = time.perf_counter() - start
+    print(f"exact: {len(documents)} documents, {exact_time / len(queries) * 1e3:.3f}ms/query")
+    start = time.perf_counter()
+    ivf_index = IVFIndex.from_embeddings(documents, document_embeddings, embed, n_lists, get_retriever.settings["n_iter"])
+    print(f"IVF: {len(ivf_index.centroids)} lists, build {time.perf_counter() - start:.2f}s")
+    for n_probe in n_probes:
+        ivf_index.n_probe = n_probe
+        start = time.perf_counter()
+        approximate = ivf_index.search(queries, k)
+        query_time = time.perf_counter() - start
+        print(
+            f"n_probe={n_probe}: {query_time / len(queries) * 1e3:.3f}ms/query, "
+            f"recall@{k} to exact: {overlap_at_k([list(r) for r in approximate], [list(r) for r in exact]):.3f}"
+        )
+
+
+if __name__ == "__main__":
+    print(json.dumps(benchmark_suite(), indent=4))
@@ -0,0 +1,130 @@
+# MIT License
+# Copyright (c) 2025 Benedikt Horn, Sascha Tauchmann
+# See the LICENSE file for more details.
+
+from database_management import db_manager as db
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from threading import Lock
+from pathlib import Path
+from typing import Dict, List, Optional, Any
+import math
+import time
+
+def percentiles(values:List[float], ps:List[int]=[50, 95, 99]) -> Dict[str, float]:
+    """Nearest-rank percentiles, the mean and the count of a list of values."""
+    if not values:
+        return {"n": 0}
+    ordered = sorted(values)
+    summary = {f"p{p}": ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)] for p in ps}
+    return {"n": len(ordered), "mean": sum(ordered) / len(ordered), **summary}
+
+class RunTelemetry:
+    """
+    Thread-safe collector of the performance figures of a dataset run, which are summarized in a run manifest.
+    While a telemetry is activated (see `activate`), the dataset run, chain links and LLMs report to it via `current()`,
+    so no component needs to pass it on explicitly.
+
+    Attributes
+    ==========
+
+        link_latencies (Dict[str, List[float]]): Seconds per invocation of each prompt link, keyed by "<prompt version> step <step>".
+        requirement_latencies (List[float]): Seconds per requirement including retries.
+        tokens (Dict[str, Counter]): Input tokens, output tokens and calls per model.
+        retries (Counter): Retried generations by `EvalError` type.
+        failures (Counter): Failed requirements by `EvalError` type or exception name.
+
+    Key Methods
+    ===========
+
+        **record_link** / **record_requirement** / **record_tokens** / **record_retry** / **record_failure**
+            Record a single observation.
+        **manifest**
+            Summarizes the run with throughput, latency percentiles, token usage, retries, failures and cache statistics.
+    """
+    def __init__(self):
+        self.started = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self._lock = Lock()
+        self.link_latencies:Dict[str, List[float]] = defaultdict(list)
+        self.requirement_latencies:List[float] = []
+        self.tokens:Dict[str, Counter] = defaultdict(Counter)
+        self.retries:Counter = Counter()
+        self.failures:Counter = Counter()
+
+    def record_link(self, name:str, seconds:float):
+        with self._lock:
+            self.link_latencies[name].append(seconds)
+
+    def record_requirement(self, seconds:float):
+        with self._lock:
+            self.requirement_latencies.append(seconds)
+
+    def record_tokens(self, model:str, input_tokens:int, output_tokens:int):
+        with self._lock:
+            self.tokens[model].update(input=input_tokens, output=output_tokens, calls=1)
+
+    def record_retry(self, error_type:str):
+        with self._lock:
+            self.retries[error_type] += 1
+
+    def record_failure(self, error_type:str):
+        with self._lock:
+            self.failures[error_type] += 1
+
+    def manifest(self, n_requirements:int, config:Dict[str, Any]={}, cache_stats:Dict[str, Any]={}) -> dict:
+        """
+        Args:
+            n_requirements (int): The number of requirements processed in this run.
+            config (Dict[str, Any], optional): The run configuration to be stored with the figures. Defaults to {}.
+            cache_stats (Dict[str, Any], optional): Hits and misses of the caches used in this run. Defaults to {}.
+        """
+        wall_time = time.perf_counter() - self._start
+        to_ms = lambda values: [1e3 * v for v in values]
+        with self._lock:
+            return {
+                "started": self.started.isoformat(timespec="seconds"),
+                "config": config,
+                "wall_time_s": wall_time,
+                "requirements": n_requirements,
+                "requirements_per_minute": 60 * n_requirements / wall_time if wall_time else 0.0,
+                "latency_ms": {
+                    "requirement": percentiles(to_ms(self.requirement_latencies)),
+                    "links": {name: percentiles(to_ms(values)) for name, values in self.link_latencies.items()}
+                },
+                "tokens": {model: dict(counts) for model, counts in self.tokens.items()},
+                "retries": dict(self.retries),
+                "failures": dict(self.failures),
+                "cache": cache_stats
+            }
+
+_current:Optional[RunTelemetry] = None
+
+def current() -> Optional[RunTelemetry]:
+    """The activated telemetry of the running dataset evaluation, if any."""
+    return _current
+
+@contextmanager
+def activate(telemetry:RunTelemetry):
+    global _current
+    previous, _current = _current, telemetry
+    try:
+        yield telemetry
+    finally:
+        _current = previous
+
+def cache_stats_delta(before:Dict[str, Dict[str, int]], after:Dict[str, Dict[str, int]]) -> Dict[str, Dict[str, float]]:
+    """Hits, misses and hit rate of each cache between two snapshots of `{cache: {"hits": int, "misses": int}}`."""
+    delta = {}
+    for name, stats in after.items():
+        hits = stats["hits"] - before.get(name, {}).get("hits", 0)
+        misses = stats["misses"] - before.get(name, {}).get("misses", 0)
+        delta[name] = {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses) if hits + misses else None}
+    return delta
+
+def save_run_manifest(manifest:dict, dataset_file_name:str, subdir:Path=db.test_data):
+    """Appends the manifest to the runs in `<dataset_file_name>_run_manifest.json` next to the dataset file."""
+    name = f"{dataset_file_name}_run_manifest"
+    runs = db.load_dict_from_json_file(name, subdir).get("runs", [])
+    db.save_dict_to_json_file({"runs": runs + [manifest]}, name, subdir)
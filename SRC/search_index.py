@@ -0,0 +1,434 @@
+# MIT License
+# Copyright (c) 2025 Benedikt Horn, Sascha Tauchmann
+# See the LICENSE file for more details.
+
+from __future__ import annotations
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from scipy import sparse
+from pathlib import Path
+from collections import Counter
+from typing import List, Dict, Callable, Any, Optional
+import numpy as np
+import json
+from database_management import string_helper as sh
+
+def tokenize(text:str) -> List[str]:
+    """Splits a text into lowercase alphanumeric tokens, see `string_helper.normalize_string`."""
+    return sh.normalize_string(text).split()
+
+def top_k_indices(scores:np.ndarray, k:int) -> np.ndarray:
+    """
+    Selects the indices of the k highest scores of each row in descending order.
+
+    Args:
+        scores (np.ndarray): (n_queries, n_documents) matrix of similarity scores.
+        k (int): The number of indices to select per row. Is clipped to the number of documents.
+
+    Returns:
+        np.ndarray: (n_queries, k) matrix of document indices.
+    """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
+
+class BM25Index:
+    """
+    Okapi BM25 index over a list of texts, based on a sparse (documents x terms) matrix of term counts.
+    The BM25 term weights are precomputed from the counts, so a query is scored against all documents 
+    at once by a sparse matrix product with its own term counts.
+
+    Attributes
+    ==========
+
+        texts (List[str]): The indexed texts.
+        vocabulary (Dict[str, int]): Maps each term to its column in the count and weight matrices.
+        term_counts (sparse.csr_matrix): (n_documents, n_terms) matrix of term counts.
+        weights (sparse.csr_matrix): (n_documents, n_terms) matrix of BM25 term weights.
+
+    Key Methods
+    ===========
+
+        **build**
+            Creates the index from a list of texts.
+        **add**
+            Appends texts to the index and updates the term weights.
+        **score**
+            Computes the (n_queries, n_documents) BM25 score matrix for a list of queries.
+        **search**
+            Selects the indices of the k best scored documents for each query.
+        **save** / **load**
+            Persists the index to or restores it from a directory.
+    """
+    def __init__(
+        self, texts:List[str], vocabulary:Dict[str, int], term_counts:sparse.csr_matrix, 
+        k1:float=1.5, b:float=0.75, tokenizer:Callable[[str], List[str]]=tokenize
+    ):
+        self.texts = texts
+        self.vocabulary = vocabulary
+        self.term_counts = term_counts
+        self.k1 = k1
+        self.b = b
+        self.tokenizer = tokenizer
+        self.weights = self._compute_weights()
+
+    @classmethod
+    def build(cls, texts:List[str], k1:float=1.5, b:float=0.75, tokenizer:Callable[[str], List[str]]=tokenize):
+        index = cls([], {}, sparse.csr_matrix((0, 0), dtype=np.float32), k1, b, tokenizer)
+        index.add(texts)
+        return index
+
+    def _count_terms(self, texts:List[str], extend_vocabulary:bool) -> sparse.csr_matrix:
+        rows, cols, counts = [], [], []
+        for i, text in enumerate(texts):
+            for term, count in Counter(self.tokenizer(text)).items():
+                if extend_vocabulary:
+                    col = self.vocabulary.setdefault(term, len(self.vocabulary))
+                elif (col := self.vocabulary.get(term)) is None:
+                    continue
+                rows.append(i)
+                cols.append(col)
+                counts.append(count)
+        return sparse.csr_matrix(
+            (np.array(counts, dtype=np.float32), (rows, cols)),
+            shape=(len(texts), len(self.vocabulary)), dtype=np.float32
+        )
+
+    def _compute_weights(self) -> sparse.csr_matrix:
+        tf = self.term_counts.tocoo()
+        n_docs = tf.shape[0]
+        doc_freq = np.bincount(tf.col, minlength=tf.shape[1]).astype(np.float32)
+        idf = np.log1p((n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+        doc_lengths = np.asarray(self.term_counts.sum(axis=1)).ravel()
+        avg_length = max(doc_lengths.mean(), 1.0) if n_docs else 1.0
+        length_norm = self.k1 * (1 - self.b + self.b * doc_lengths[tf.row] / avg_length)
+        values = idf[tf.col] * tf.data * (self.k1 + 1) / (tf.data + length_norm)
+        return sparse.csr_matrix((values, (tf.row, tf.col)), shape=tf.shape, dtype=np.float32)
+
+    def add(self, texts:List[str]):
+        new_counts = self._count_terms(texts, extend_vocabulary=True)
+        old_counts = self.term_counts.copy()
+        old_counts.resize((old_counts.shape[0], len(self.vocabulary)))
+        self.term_counts = sparse.vstack([old_counts, new_counts], format="csr")
+        self.texts = self.texts + list(texts)
+        self.weights = self._compute_weights()
+
+    def score(self, queries:List[str]) -> np.ndarray:
+        return (self._count_terms(queries, extend_vocabulary=False) @ self.weights.T).toarray()
+
+    def search(self, queries:List[str], k:int) -> np.ndarray:
+        return top_k_indices(self.score(queries), k)
+
+    def save(self, path:Path):
+        path.mkdir(parents=True, exist_ok=True)
+        sparse.save_npz(path / "term_counts.npz", self.term_counts)
+        with open(path / "index.json", "w", encoding="utf-8") as f:
+            json.dump({"texts": self.texts, "vocabulary": self.vocabulary, "k1": self.k1, "b": self.b}, f)
+
+    @classmethod
+    def load(cls, path:Path, tokenizer:Callable[[str], List[str]]=tokenize):
+        with open(path / "index.json", "r", encoding="utf-8") as f:
+            index = json.load(f)
+        term_counts = sparse.load_npz(path / "term_counts.npz").tocsr()
+        return cls(index["texts"], index["vocabulary"], term_counts, index["k1"], index["b"], tokenizer)
+
+def max_marginal_relevance(
+    query_embedding:np.ndarray, candidate_embeddings:np.ndarray, k:int, lambda_mult:float=0.5
+) -> List[int]:
+    """
+    Greedily selects k of the candidates, that are similar to the query but diverse among each other.
+
+    Args:
+        query_embedding (np.ndarray): (dim,) normalized query embedding.
+        candidate_embeddings (np.ndarray): (n_candidates, dim) normalized candidate embeddings.
+        k (int): The number of candidates to select.
+        lambda_mult (float, optional): 1 for maximum similarity to the query, 0 for maximum diversity. Defaults to 0.5.
+
+    Returns:
+        List[int]: The positions of the selected candidates in selection order, empty if there are no candidates.
+    """
+    if k < 1 or len(candidate_embeddings) == 0:
+        return []
+    query_similarity = candidate_embeddings @ query_embedding
+    pairwise_similarity = candidate_embeddings @ candidate_embeddings.T
+    selected = [int(np.argmax(query_similarity))]
+    redundancy = pairwise_similarity[selected[0]].copy()
+    for _ in range(min(k, len(candidate_embeddings)) - 1):
+        mmr = lambda_mult * query_similarity - (1 - lambda_mult) * redundancy
+        mmr[selected] = -np.inf
+        selected.append(int(np.argmax(mmr)))
+        redundancy = np.maximum(redundancy, pairwise_similarity[selected[-1]])
+    return selected
+
+class DenseIndex:
+    """
+    Exact nearest neighbour index over a contiguous matrix of normalized text embeddings, 
+    which is stored as `.npy` file and memory-mapped on load. 
+    Queries are scored by cosine similarity in a single matrix multiplication per chunk of documents.
+
+    Attributes
+    ==========
+
+        texts (List[str]): The indexed texts.
+        embeddings (np.ndarray): (n_documents, dim) matrix of normalized float32 or float16 embeddings.
+        embed (Callable[[List[str]], np.ndarray]): Computes the (n_texts, dim) embeddings of a list of texts.
+        mmr (bool): Whether to re-rank the nearest `fetch_k` documents by maximal marginal relevance.
+        fetch_k (int): The number of candidates for the MMR re-ranking.
+        lambda_mult (float): The MMR trade-off between similarity (1) and diversity (0).
+
+    Key Methods
+    ===========
+
+        **build**
+            Embeds and normalizes the texts.
+        **add**
+            Embeds and appends texts to the index.
+        **score**
+            Computes the (n_queries, n_documents) cosine similarity matrix for a list of queries.
+        **search**
+            Selects the indices of the k nearest documents for each query, optionally re-ranked by MMR.
+        **save** / **load**
+            Persists the index to or memory-maps it from a directory.
+    """
+    chunk_size = 65536
+
+    def __init__(
+        self, texts:List[str], embeddings:np.ndarray, embed:Callable[[List[str]], np.ndarray],
+        mmr:bool=False, fetch_k:int=20, lambda_mult:float=0.5
+    ):
+        self.texts = texts
+        self.embeddings = embeddings
+        self.embed = embed
+        self.mmr = mmr
+        self.fetch_k = fetch_k
+        self.lambda_mult = lambda_mult
+
+    @staticmethod
+    def normalize(embeddings:np.ndarray) -> np.ndarray:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+
+    @classmethod
+    def build(cls, texts:List[str], embed:Callable[[List[str]], np.ndarray], dtype:str="float32", **kwargs):
+        embeddings = cls.normalize(embed(texts)).astype(dtype)
+        return cls(texts, embeddings, embed, **kwargs)
+
+    def add(self, texts:List[str]):
+        new_embeddings = self.normalize(self.embed(texts)).astype(self.embeddings.dtype)
+        self.embeddings = np.concatenate([self.embeddings, new_embeddings], axis=0)
+        self.texts = self.texts + list(texts)
+
+    def _embed_queries(self, queries:List[str]) -> np.ndarray:
+        return self.normalize(self.embed(queries))
+
+    def _score_embeddings(self, query_embeddings:np.ndarray) -> np.ndarray:
+        scores = np.empty((len(query_embeddings), len(self.embeddings)), dtype=np.float32)
+        # chunking bounds the memory of the float32 copies of float16 embeddings
+        for i in range(0, len(self.embeddings), self.chunk_size):
+            chunk = self.embeddings[i:i+self.chunk_size].astype(np.float32, copy=False)
+            scores[:, i:i+self.chunk_size] = query_embeddings @ chunk.T
+        return scores
+
+    def score(self, queries:List[str]) -> np.ndarray:
+        return self._score_embeddings(self._embed_queries(queries))
+
+    def search(self, queries:List[str], k:int) -> np.ndarray:
+        query_embeddings = self._embed_queries(queries)
+        scores = self._score_embeddings(query_embeddings)
+        if not self.mmr:
+            return top_k_indices(scores, k)
+        candidates = top_k_indices(scores, max(k, self.fetch_k))
+        return np.array([
+            row[max_marginal_relevance(
+                query, self.embeddings[row].astype(np.float32), k, self.lambda_mult
+            )]
+            for query, row in zip(query_embeddings, candidates)
+        ])
+
+    def save(self, path:Path):
+        path.mkdir(parents=True, exist_ok=True)
+        # the new file replaces the old one instead of overwriting it, as the old one may still be memory-mapped
+        tmp_file = path / "embeddings.tmp"
+        with open(tmp_file, "wb") as f:
+            np.save(f, self.embeddings)
+        tmp_file.replace(path / "embeddings.npy")
+        with open(path / "texts.json", "w", encoding="utf-8") as f:
+            json.dump(self.texts, f)
+
+    @classmethod
+    def load(cls, path:Path, embed:Callable[[List[str]], np.ndarray], **kwargs):
+        with open(path / "texts.json", "r", encoding="utf-8") as f:
+            texts = json.load(f)
+        return cls(texts, np.load(path / "embeddings.npy", mmap_mode="r"), embed, **kwargs)
+
+def train_centroids(embeddings:np.ndarray, n_lists:int, n_iter:int=10, seed:int=0) -> np.ndarray:
+    """
+    Clusters normalized embeddings by spherical k-means.
+
+    Args:
+        embeddings (np.ndarray): (n_samples, dim) normalized training embeddings.
+        n_lists (int): The number of clusters. Is clipped to the number of samples.
+        n_iter (int, optional): The number of k-means iterations. Defaults to 10.
+        seed (int, optional): Seed of the initial centroid sampling, so that the clustering is deterministic. Defaults to 0.
+
+    Returns:
+        np.ndarray: (n_lists, dim) normalized float32 centroids.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    n_lists = min(n_lists, len(embeddings))
+    rng = np.random.default_rng(seed)
+    centroids = embeddings[np.sort(rng.choice(len(embeddings), n_lists, replace=False))]
+    for _ in range(n_iter):
+        assignments = assign_to_centroids(embeddings, centroids)
+        membership = sparse.csr_matrix(
+            (np.ones(len(assignments), dtype=np.float32), (assignments, np.arange(len(assignments)))),
+            shape=(n_lists, len(assignments))
+        )
+        sums = np.asarray(membership @ embeddings)
+        # empty clusters keep their previous centroid
+        not_empty = np.asarray(membership.sum(axis=1)).ravel() > 0
+        centroids[not_empty] = DenseIndex.normalize(sums[not_empty])
+    return centroids
+
+def assign_to_centroids(embeddings:np.ndarray, centroids:np.ndarray, chunk_size:int=65536) -> np.ndarray:
+    """Assigns each of the (n, dim) normalized embeddings to the position of its most similar centroid."""
+    assignments = np.empty(len(embeddings), dtype=np.int32)
+    for i in range(0, len(embeddings), chunk_size):
+        chunk = np.asarray(embeddings[i:i+chunk_size], dtype=np.float32)
+        assignments[i:i+chunk_size] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+class IVFIndex(DenseIndex):
+    """
+    Approximate nearest neighbour index, which partitions the embeddings of a `DenseIndex` into inverted lists
+    by k-means centroids. A query is only compared with the documents of its `n_probe` most similar lists,
+    so the search cost grows with `n_probe / n_lists` of the corpus instead of the whole corpus.
+    `n_probe` trades recall for latency; with `n_probe == n_lists` the search is exact.
+    The embeddings are kept in their original order, so the position of a document stays its ID.
+
+    Attributes
+    ==========
+
+        centroids (np.ndarray): (n_lists, dim) normalized float32 centroids of the inverted lists.
+        assignments (np.ndarray): (n_documents,) position of the inverted list of each document.
+        n_probe (int): The number of inverted lists searched per query.
+
+        See `DenseIndex` for the remaining attributes.
+
+    Key Methods
+    ===========
+
+        **build** / **from_embeddings**
+            Trains the centroids on a sample of the embeddings and assigns every document to its list.
+        **add**
+            Embeds and appends texts to the lists of their nearest centroids. The centroids are not retrained.
+        **search**
+            Selects the indices of the k nearest documents among the probed lists for each query.
+        **save** / **load**
+            Persists the index to or memory-maps it from a directory.
+    """
+    # maximum number of training samples per inverted list
+    train_samples_per_list = 256
+
+    def __init__(
+        self, texts:List[str], embeddings:np.ndarray, embed:Callable[[List[str]], np.ndarray],
+        centroids:np.ndarray, assignments:np.ndarray, n_probe:int=8, **kwargs
+    ):
+        super().__init__(texts, embeddings, embed, **kwargs)
+        self.centroids = centroids
+        self.n_probe = n_probe
+        self._set_assignments(assignments)
+
+    def _set_assignments(self, assignments:np.ndarray):
+        self.assignments = assignments
+        # documents of list l are list_members[list_offsets[l]:list_offsets[l+1]]
+        self.list_members = np.argsort(assignments, kind="stable")
+        self.list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=len(self.centroids)))])
+
+    @staticmethod
+    def default_n_lists(n_documents:int) -> int:
+        return max(1, int(4 * np.sqrt(n_documents)))
+
+    @classmethod
+    def from_embeddings(
+        cls, texts:List[str], embeddings:np.ndarray, embed:Callable[[List[str]], np.ndarray],
+        n_lists:Optional[int]=None, n_iter:int=10, seed:int=0, **kwargs
+    ):
+        """Builds the index from already normalized embeddings."""
+        n_lists = min(n_lists or cls.default_n_lists(len(texts)), len(texts))
+        rng = np.random.default_rng(seed)
+        n_samples = min(len(texts), n_lists * cls.train_samples_per_list)
+        sample = np.sort(rng.choice(len(texts), n_samples, replace=False))
+        centroids = train_centroids(embeddings[sample], n_lists, n_iter, seed)
+        return cls(texts, embeddings, embed, centroids, assign_to_centroids(embeddings, centroids), **kwargs)
+
+    @classmethod
+    def build(
+        cls, texts:List[str], embed:Callable[[List[str]], np.ndarray], dtype:str="float32",
+        n_lists:Optional[int]=None, n_iter:int=10, seed:int=0, **kwargs
+    ):
+        embeddings = cls.normalize(embed(texts)).astype(dtype)
+        return cls.from_embeddings(texts, embeddings, embed, n_lists, n_iter, seed, **kwargs)
+
+    def add(self, texts:List[str]):
+        new_embeddings = self.normalize(self.embed(texts))
+        new_assignments = assign_to_centroids(new_embeddings, self.centroids)
+        self.embeddings = np.concatenate([self.embeddings, new_embeddings.astype(self.embeddings.dtype)], axis=0)
+        self.texts = self.texts + list(texts)
+        self._set_assignments(np.concatenate([self.assignments, new_assignments]))
+
+    def candidates(self, query_embedding:np.ndarray) -> np.ndarray:
+        """The sorted positions of the documents in the `n_probe` lists, whose centroids are most similar to the query."""
+        probed = top_k_indices((self.centroids @ query_embedding)[None, :], self.n_probe)[0]
+        return np.sort(np.concatenate([
+            self.list_members[self.list_offsets[l]:self.list_offsets[l+1]] for l in probed
+        ]))
+
+    def search(self, queries:List[str], k:int) -> List[np.ndarray]:
+        # rows may be shorter than k, if the probed lists contain less than k documents
+        results = []
+        for query in self._embed_queries(queries):
+            candidates = self.candidates(query)
+            candidate_embeddings = np.asarray(self.embeddings[candidates], dtype=np.float32)
+            if self.mmr:
+                nearest = top_k_indices((candidate_embeddings @ query)[None, :], max(k, self.fetch_k))[0]
+                nearest = nearest[max_marginal_relevance(query, candidate_embeddings[nearest], k, self.lambda_mult)]
+            else:
+                nearest = top_k_indices((candidate_embeddings @ query)[None, :], k)[0]
+            results.append(candidates[nearest])
+        return results
+
+    def save(self, path:Path):
+        super().save(path)
+        np.save(path / "centroids.npy", self.centroids)
+        np.save(path / "assignments.npy", self.assignments)
+
+    @classmethod
+    def load(cls, path:Path, embed:Callable[[List[str]], np.ndarray], **kwargs):
+        with open(path / "texts.json", "r", encoding="utf-8") as f:
+            texts = json.load(f)
+        return cls(
+            texts, np.load(path / "embeddings.npy", mmap_mode="r"), embed,
+            np.load(path / "centroids.npy"), np.load(path / "assignments.npy"), **kwargs
+        )
+
+class IndexRetriever(BaseRetriever):
+    """
+    LangChain retriever that returns the top k documents of an in-process index, which scores all documents at once.
+    The position of a document in the index is provided as `ID` in its metadata.
+    """
+    index:Any
+    k:int = 2
+
+    def search(self, queries:List[str], k:Optional[int]=None) -> List[List[Document]]:
+        """Retrieves the top k documents for each of the given queries with a single search pass."""
+        top_k = self.index.search(queries, k or self.k)
+        return [[Document(page_content=self.index.texts[i], metadata={"ID": int(i)}) for i in row] for row in top_k]
+
+    def _get_relevant_documents(self, query:str, *, run_manager:CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.search([query])[0]
@@ -0,0 +1,86 @@
+# MIT License
+# Copyright (c) 2025 Benedikt Horn, Sascha Tauchmann
+# See the LICENSE file for more details.
+
+from evaluation_wrapper.evaluation import Evaluation
+from evaluation_wrapper.evaluation_wrapper import EvalWrapper, GeneralEval, GeneralJudgement
+import database_management.db_manager as db
+from typing import List, Dict, Tuple, Any, Callable
+from copy import deepcopy
+from pathlib import Path
+import time
+
+def load_outputs(subdir:Path=db.test_data) -> Dict[str, List[dict]]:
+    """All evaluations and judgements of the dataset files in `subdir`, keyed by their type."""
+    outputs:Dict[str, List[dict]] = {"evaluations": [], "judgements": []}
+    for file in sorted(subdir.glob("*.json")):
+        dataset = db.load_dict_from_json_file(file.stem, subdir)
+        for eval_type in outputs:
+            outputs[eval_type].extend(dataset.get(eval_type, []))
+    return outputs
+
+def corrupt(outputs:List[dict]) -> List[Any]:
+    """Invalid variants of the outputs, so that every error message of the format check is exercised."""
+    variants = []
+    for i, output in enumerate(outputs):
+        variant = deepcopy(output)
+        key = list(variant)[i % len(variant)]
+        if i % 3 == 0:
+            del variant[key]
+        elif i % 3 == 1:
+            variant[key] = 1.5
+        elif isinstance(variant.get("evaluation"), dict) and variant["evaluation"]:
+            metric = list(variant["evaluation"])[i % len(variant["evaluation"])]
+            variant["evaluation"][metric] = {"comment": None}
+        variants.append(variant)
+    return variants + [None, "not a dict", []]
+
+def time_validation(validate:Callable[[Any], Tuple[bool, Any]], contents:List[Any], repeat:int) -> Tuple[float, List[Tuple[bool, Any]]]:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = [validate(content) for content in contents]
+    return (time.perf_counter() - start) / repeat, results
+
+def validation_benchmark(subdir:Path=db.test_data, repeat:int=20) -> Dict[str, Dict[str, float]]:
+    """
+    Measures the throughput of the interpreting format check `Evaluation._check_format_recursive`
+    and the compiled validator of the wrapper on all outputs in `subdir` and invalid variants of them,
+    and verifies that both return the same results and error messages.
+
+    Returns:
+        Dict[str, Dict[str, float]]: Per output type the number of checked contents,
+            the checks per second of both implementations and the speedup.
+
+    Raises:
+        AssertionError: If the compiled validator differs from the reference implementation.
+    """
+    # the stored judgements are keyed by the metric names
+    wrappers:Dict[str, EvalWrapper] = {"evaluations": GeneralEval(), "judgements": GeneralJudgement(metric_wrapper=lambda m: m)}
+    # the reference implementation only uses the instance for the recursion
+    reference = Evaluation.__new__(Evaluation)
+    report = {}
+    for eval_type, outputs in load_outputs(subdir).items():
+        wrapper = wrappers[eval_type]
+        contents = outputs + corrupt(outputs)
+        reference_time, reference_results = time_validation(
+            lambda content: reference._check_format_recursive(content, wrapper.format_dummy), contents, repeat
+        )
+        compiled_time, compiled_results = time_validation(wrapper.format_validator, contents, repeat)
+        assert compiled_results == reference_results, f"The compiled validator of the {eval_type} differs from the reference"
+        report[eval_type] = {
+            "contents": len(contents),
+            "invalid": sum(not is_valid for is_valid, _ in reference_results),
+            "reference_per_s": len(contents) / reference_time,
+            "compiled_per_s": len(contents) / compiled_time,
+            "speedup": reference_time / compiled_time
+        }
+    return report
+
+
+if __name__ == "__main__":
+    for eval_type, result in validation_benchmark().items():
+        print(
+            f"{eval_type}: {result['contents']} contents ({result['invalid']} invalid), "
+            f"reference {result['reference_per_s']:,.0f}/s, compiled {result['compiled_per_s']:,.0f}/s, "
+            f"speedup {result['speedup']:.1f}x"
+        )
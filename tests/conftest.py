@@ -0,0 +1,12 @@
+# MIT License
+# Copyright (c) 2025 Benedikt Horn, Sascha Tauchmann
+# See the LICENSE file for more details.
+
+import os
+import sys
+from pathlib import Path
+
+# the modules are run from the project root with SRC on the path, see SRC/main.py
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "SRC"))
+os.chdir(ROOT)
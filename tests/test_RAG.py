@@ -0,0 +1,48 @@
+# MIT License
+# Copyright (c) 2025 Benedikt Horn, Sascha Tauchmann
+# See the LICENSE file for more details.
+
+import pytest
+from database_management import db_manager as db, template_processing as tp
+from RAG import RAG
+
+def metric_evaluation(requirement:str, rating:int) -> dict:
+    return {"requirement": requirement, "rating": rating, "justification": "...", "proposed_requirement": None}
+
+def test_malformed_entry_only_breaks_its_own_context(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "RAG_data", tmp_path)
+    monkeypatch.setattr(db, "bm25_index_path", lambda index_name: tmp_path / ".bm25" / index_name)
+    good = ["The system shall refresh the display every 60 seconds.", "The user shall export reports as PDF files."]
+    bad = "The printer shall staple printed documents."
+    db.save_dict_to_json_file({
+        "rating_scale": 5,
+        "evaluations": [
+            {"requirement": req, "evaluation": {"Correctness": metric_evaluation(req, 4)}} for req in good
+        ] + [
+            # the metric of the context is missing
+            {"requirement": bad, "evaluation": {"Unambiguity": metric_evaluation(bad, 2)}}
+        ]
+    }, "rag_test", tmp_path)
+    rag = RAG("rag_test", n_retrieved_docs=1, retriever_backend="bm25")
+    context_template = tp.get_sections(db.load_prompt_template("evaluation_chain_step"), "one_shot", only_content=True)[0]
+    context = rag.get_inputs(context_template, ["Correctness"])["context"]
+
+    assert good[1] in context.invoke("export reports as PDF files")
+    assert good[0] in context.invoke("refresh the display every 60 seconds")
+    with pytest.raises(ValueError, match="RAG evaluation 2 of rag_test"):
+        context.invoke("staple printed documents")
+
+def test_added_evaluations_extend_the_fragments(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "RAG_data", tmp_path)
+    monkeypatch.setattr(db, "bm25_index_path", lambda index_name: tmp_path / ".bm25" / index_name)
+    old, new = "The system shall refresh the display every 60 seconds.", "The user shall export reports as PDF files."
+    db.save_dict_to_json_file({
+        "rating_scale": 5, "evaluations": [{"requirement": old, "evaluation": {"Correctness": metric_evaluation(old, 4)}}]
+    }, "rag_test", tmp_path)
+    rag = RAG("rag_test", n_retrieved_docs=1, retriever_backend="bm25")
+    context_template = tp.get_sections(db.load_prompt_template("evaluation_chain_step"), "one_shot", only_content=True)[0]
+    context = rag.get_inputs(context_template, ["Correctness"])["context"]
+    assert old in context.invoke("refresh the display every 60 seconds")
+
+    rag.add_evaluations([{"requirement": new, "evaluation": {"Correctness": metric_evaluation(new, 3)}}])
+    assert new in context.invoke("export reports as PDF files")
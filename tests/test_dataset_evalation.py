@@ -0,0 +1,104 @@
+# MIT License
+# Copyright (c) 2025 Benedikt Horn, Sascha Tauchmann
+# See the LICENSE file for more details.
+
+import pytest
+pytest.importorskip("groq")
+import time
+import pandas as pd
+from langchain_core.runnables import RunnableLambda
+from database_management import db_manager as db
+import dataset_evalation
+from dataset_evalation import evaluate_dataset, run_shards
+from evaluation_wrapper.evaluation_wrapper import GeneralEval
+from LLMs import LLM
+
+def fake_evaluation(requirement:str) -> dict:
+    # slow enough, that the workers invoke their models concurrently
+    time.sleep(0.002)
+    return {
+        "requirement": requirement,
+        "evaluation": {m: {"rating": 4, "comment": "..."} for m in db.Metrics.all},
+        "proposed_requirement": {"text": requirement, "justification": "..."}
+    }
+
+def test_concurrent_workers_with_llm_wrappers(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "last_messages", tmp_path / "last_messages")
+    # the wrapper is real, only the provider model is replaced
+    monkeypatch.setattr(LLM, "_init_llm", lambda self: RunnableLambda(fake_evaluation))
+    requirements = [f"The system shall process request {i} within {i} seconds." for i in range(120)]
+    pd.DataFrame({"Requirement": requirements}).to_csv(tmp_path / "requirements.csv", index=False)
+
+    def evaluator_factory():
+        llm = LLM("llama-3.1-8b-instant")
+        wrapper = GeneralEval()
+        return lambda requirement: wrapper(llm.invoke(requirement), requirement)
+
+    result = evaluate_dataset(
+        evaluator_factory(), "llama-3.1-8b-instant", "requirements", "successive", "evaluations", None, "Requirement",
+        database_subdir=tmp_path, n_workers=4, evaluator_factory=evaluator_factory
+    )
+    assert result["generated"] == len(requirements)
+    assert result["manifest"]["failures"] == {}
+    assert any((tmp_path / "last_messages").glob("last_response_*.md"))
+
+def test_resumed_run_deduplicates_against_earlier_runs(tmp_path):
+    originals = [f"The system shall archive record {i} daily." for i in range(10)]
+    # the duplicates only differ in whitespace and case
+    requirements = originals + [f"  the system shall ARCHIVE record {i} daily. " for i in range(10)]
+    pd.DataFrame({"Requirement": requirements}).to_csv(tmp_path / "requirements.csv", index=False)
+    evaluated = []
+    def evaluator(requirement:str):
+        evaluated.append(requirement)
+        return GeneralEval()(fake_evaluation(requirement), requirement)
+    kwargs = dict(database_subdir=tmp_path, deduplication="normalized")
+
+    evaluate_dataset(
+        evaluator, "llama-3.1-8b-instant", "requirements", "successive", "evaluations", None, "Requirement", 
+        stop_idx=len(originals), **kwargs
+    )
+    result = evaluate_dataset(
+        evaluator, "llama-3.1-8b-instant", "requirements", "successive", "evaluations", None, "Requirement", **kwargs
+    )
+    assert evaluated == originals
+    assert result["generated"] == len(requirements)
+    assert result["deduplicated"] == len(requirements) - len(originals)
+    dataset = db.load_dict_from_json_file(db.get_dataset_file_name("requirements", "llama-3.1-8b-instant", "evaluations", "successive"), tmp_path)
+    assert [e["requirement"] for e in dataset["evaluations"]] == requirements
+
+def test_duplicates_during_and_after_the_evaluation_of_their_representative(tmp_path):
+    originals = [f"The system shall archive record {i} daily." for i in range(10)]
+    # each original is directly followed by a duplicate, which is submitted while the original is evaluated,
+    # and repeated at the end, after the original is logged
+    requirements = [r for original in originals for r in (original, original.upper())] + [f" {r} " for r in originals]
+    pd.DataFrame({"Requirement": requirements}).to_csv(tmp_path / "requirements.csv", index=False)
+    evaluated = []
+    def evaluator(requirement:str):
+        evaluated.append(requirement)
+        return GeneralEval()(fake_evaluation(requirement), requirement)
+
+    result = evaluate_dataset(
+        evaluator, "llama-3.1-8b-instant", "requirements", "successive", "evaluations", None, "Requirement",
+        database_subdir=tmp_path, deduplication="normalized"
+    )
+    assert evaluated == originals
+    assert result["deduplicated"] == len(requirements) - len(originals)
+    dataset = db.load_dict_from_json_file(db.get_dataset_file_name("requirements", "llama-3.1-8b-instant", "evaluations", "successive"), tmp_path)
+    assert [e["requirement"] for e in dataset["evaluations"]] == requirements
+
+def test_failed_shard_process_prevents_the_merge(monkeypatch):
+    class ShardProcess:
+        def __init__(self, target, args):
+            self.exitcode = None
+            self.shard = args[2]["shard"][0]
+        def start(self):
+            pass
+        def join(self):
+            # the second shard crashes, e.g. by an exhausted API quota
+            self.exitcode = 1 if self.shard == 1 else 0
+    class SpawnContext:
+        Process = ShardProcess
+    monkeypatch.setattr(dataset_evalation.multiprocessing, "get_context", lambda method: SpawnContext)
+    monkeypatch.setattr(dataset_evalation, "merge_shards", lambda **kwargs: pytest.fail("failed shards must not be merged"))
+    with pytest.raises(RuntimeError, match=r"\{1: 1\}"):
+        run_shards({}, 3, dataset_name="requirements")
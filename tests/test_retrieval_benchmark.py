@@ -0,0 +1,23 @@
+# MIT License
+# Copyright (c) 2025 Benedikt Horn, Sascha Tauchmann
+# See the LICENSE file for more details.
+
+import math
+from retrieval_benchmark import overlap_at_k, retrieve_with_backend
+import database_management.db_manager as db
+
+def test_overlap_at_k():
+    assert overlap_at_k([["a", "b"], ["c", "d"]], [["a", "x"], ["c", "d"]]) == 0.75
+
+def test_overlap_at_k_without_references():
+    assert math.isnan(overlap_at_k([], []))
+    assert math.isnan(overlap_at_k([["a"], ["b"]], [[], []]))
+
+def test_first_query_is_timed_apart_from_single_queries(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "bm25_index_path", lambda index_name: tmp_path / index_name)
+    documents = ["The system shall log every login.", "The user shall export reports.", "The printer shall staple pages."]
+    queries = ["log logins", "export reports", "staple pages"]
+    out = retrieve_with_backend("bm25", documents, queries, k=1, n_single_queries=2)
+    assert out["first_query_time"] is not None
+    assert len(out["single_query_times"]) == 2
+    assert out["results"] == [[documents[0]], [documents[1]], [documents[2]]]
@@ -0,0 +1,23 @@
+# MIT License
+# Copyright (c) 2025 Benedikt Horn, Sascha Tauchmann
+# See the LICENSE file for more details.
+
+import numpy as np
+from search_index import max_marginal_relevance, DenseIndex
+
+def embed(texts):
+    return np.array([[text.count("a") + 1, text.count("b") + 1, len(text) + 1] for text in texts], dtype=np.float32)
+
+def test_max_marginal_relevance_without_candidates():
+    assert max_marginal_relevance(np.ones(3, dtype=np.float32), np.empty((0, 3), dtype=np.float32), 4) == []
+
+def test_max_marginal_relevance_selects_k_distinct_candidates():
+    candidates = DenseIndex.normalize(embed(["aa", "aab", "bbb", "ab"]))
+    selected = max_marginal_relevance(candidates[0], candidates, 3)
+    assert selected[0] == 0
+    assert len(set(selected)) == 3
+
+def test_mmr_search_of_empty_index():
+    index = DenseIndex.build(["a"], embed, mmr=True)
+    index.embeddings, index.texts = index.embeddings[:0], []
+    assert index.search(["ab", "b"], 2).shape == (2, 0)